@@ -0,0 +1,136 @@
+"""Load shedding when the worker is saturated.
+
+Two signals: event-loop lag (smoothed, from ``loop_monitor.LoopMonitor``) and how long
+requests wait for a MongoDB connection from the pool. When either exceeds
+its threshold, ``AdmissionMiddleware`` rejects a growing share of requests
+with 503 instead of letting every request queue up and time out.
+"""
+import os
+import random
+import threading
+import time
+from pymongo import monitoring
+
+ADMISSION_MAX_LOOP_LAG_MS = float(os.environ.get('ADMISSION_MAX_LOOP_LAG_MS', '250'))
+ADMISSION_MAX_POOL_WAIT_MS = float(os.environ.get('ADMISSION_MAX_POOL_WAIT_MS', '500'))
+
+# Never shed these, so health checks and metrics work under load
+EXEMPT_PATHS = ("/api/health", "/api/metrics")
+
+
+class PoolWaitListener(monitoring.ConnectionPoolListener):
+    """Measures connection checkout waits; pass it to the client in ``event_listeners``.
+
+    Checkouts happen on driver threads, so a started checkout is matched to its
+    result by thread. Waits still in progress count too, so a stuck pool shows
+    up before any checkout completes.
+    """
+
+    def __init__(self, alpha: float = 0.3, stale_after: float = 5.0):
+        self.alpha = alpha
+        self.stale_after = stale_after
+        self.wait = 0.0
+        self._updated = 0.0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def current_wait(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            oldest = min(self._pending.values(), default=now)
+            recent = self.wait if now - self._updated < self.stale_after else 0.0
+        return max(recent, now - oldest)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._pending[threading.get_ident()] = time.monotonic()
+
+    def _finished(self):
+        now = time.monotonic()
+        with self._lock:
+            started = self._pending.pop(threading.get_ident(), None)
+            if started is not None:
+                self.wait += self.alpha * (now - started - self.wait)
+                self._updated = now
+
+    def connection_checked_out(self, event):
+        self._finished()
+
+    def connection_check_out_failed(self, event):
+        self._finished()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+class AdmissionController:
+    def __init__(self, loop_monitor, pool: PoolWaitListener,
+                 max_loop_lag_ms: float = ADMISSION_MAX_LOOP_LAG_MS,
+                 max_pool_wait_ms: float = ADMISSION_MAX_POOL_WAIT_MS):
+        self.loop_monitor = loop_monitor
+        self.pool = pool
+        self.max_loop_lag = max_loop_lag_ms / 1000
+        self.max_pool_wait = max_pool_wait_ms / 1000
+        self.admitted = 0
+        self.shed = 0
+
+    def pressure(self) -> float:
+        # 1.0 means a signal sits exactly at its threshold
+        return max(self.loop_monitor.lag / self.max_loop_lag, self.pool.current_wait / self.max_pool_wait)
+
+    def admit(self) -> bool:
+        # Shed proportionally above the threshold: everything at twice the limit
+        excess = self.pressure() - 1.0
+        if excess > 0 and random.random() < excess:
+            self.shed += 1
+            return False
+        self.admitted += 1
+        return True
+
+    def snapshot(self) -> dict:
+        return {
+            "loopLagMs": round(self.loop_monitor.lag * 1000, 1),
+            "poolWaitMs": round(self.pool.current_wait * 1000, 1),
+            "pressure": round(self.pressure(), 3),
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or self.controller.admit():
+            await self.app(scope, receive, send)
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")]
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"Server busy, please retry"}'})
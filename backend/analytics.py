@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Rollup documents: one per student x subject x UTC day, with per-quiz
+# {attempts, correct} under "quizzes" for the quiz selector's mastery
+ROLLUPS = "student_subject_daily"
+
+
+async def ensure_rollup_indexes(db):
+    await db[ROLLUPS].create_index([("studentId", 1), ("date", 1), ("subjectId", 1)], unique=True)
+
+
+def counter_key(quiz_id: str) -> bool:
+    # Quiz ids become field names under "quizzes"; ids Mongo can't use as one are left out
+    return bool(quiz_id) and "." not in quiz_id and not quiz_id.startswith("$")
+
+
+async def record_attempt(db, student_id: str, subject_id: str, quiz_id: str, is_correct: bool, xp_earned: int,
+                         attempted_at: datetime):
+    inc = {"attempts": 1, "correct": int(is_correct), "xp": xp_earned}
+    if counter_key(quiz_id):
+        inc[f"quizzes.{quiz_id}.attempts"] = 1
+        inc[f"quizzes.{quiz_id}.correct"] = int(is_correct)
+    await db[ROLLUPS].update_one(
+        {"studentId": student_id, "subjectId": subject_id, "date": attempted_at.strftime("%Y-%m-%d")},
+        {"$inc": inc},
+        upsert=True
+    )
+
+
+async def quiz_totals(db, student_id: str) -> Dict[str, list]:
+    """{quizId: [attempts, correct]} over the student's whole history, archived days included."""
+    totals: Dict[str, list] = {}
+    async for row in db[ROLLUPS].find({"studentId": student_id}, {"_id": 0, "quizzes": 1}):
+        for quiz_id, counts in (row.get("quizzes") or {}).items():
+            total = totals.setdefault(quiz_id, [0, 0])
+            total[0] += counts.get("attempts", 0)
+            total[1] += counts.get("correct", 0)
+    return totals
+
+
+def accuracy(correct: int, attempts: int) -> float:
+    return round(correct / attempts, 4) if attempts else 0.0
+
+
+async def student_analytics(db, student_id: str, subjects: List[dict], since: Optional[str] = None) -> dict:
+    query = {"studentId": student_id}
+    if since:
+        query["date"] = {"$gte": since}
+    rollups = await db[ROLLUPS].find(query, {"_id": 0, "quizzes": 0}).sort("date", 1).to_list(None)
+
+    names = {s['id']: s['name'] for s in subjects}
+    per_subject = defaultdict(lambda: {"attempts": 0, "correct": 0, "xp": 0})
+    per_day: Dict[str, dict] = {}
+    for row in rollups:
+        for bucket in (per_subject[row['subjectId']], per_day.setdefault(row['date'], {"attempts": 0, "correct": 0, "xp": 0})):
+            bucket['attempts'] += row.get('attempts', 0)
+            bucket['correct'] += row.get('correct', 0)
+            bucket['xp'] += row.get('xp', 0)
+
+    attempts = sum(s['attempts'] for s in per_subject.values())
+    correct = sum(s['correct'] for s in per_subject.values())
+    return {
+        "totals": {
+            "attempts": attempts,
+            "correct": correct,
+            "accuracy": accuracy(correct, attempts),
+            "xp": sum(s['xp'] for s in per_subject.values())
+        },
+        "subjects": [
+            {
+                "subjectId": subject_id,
+                "name": names.get(subject_id),
+                **totals,
+                "accuracy": accuracy(totals['correct'], totals['attempts'])
+            }
+            for subject_id, totals in per_subject.items()
+        ],
+        "daily": [{"date": date, **totals} for date, totals in per_day.items()]
+    }
+
+
+# ============ BACKFILL ============
+
+async def rebuild_batch(db, attempts, student_ids: List[str], quiz_subjects: Dict[str, str], since: str) -> int:
+    # Group raw attempts by student x quiz x day, then fold quizzes into their subject
+    rollups = defaultdict(lambda: {"attempts": 0, "correct": 0, "xp": 0, "quizzes": {}})
+    async for row in attempts.daily_totals(student_ids):
+        quiz_id = row['_id']['quizId']
+        subject_id = quiz_subjects.get(quiz_id)
+        if not subject_id:
+            continue
+        rollup = rollups[(row['_id']['studentId'], subject_id, row['_id']['date'])]
+        rollup['attempts'] += row['attempts']
+        rollup['correct'] += row['correct']
+        rollup['xp'] += row['xp']
+        if counter_key(quiz_id):
+            rollup['quizzes'][quiz_id] = {"attempts": row['attempts'], "correct": row['correct']}
+
+    # Days before `since` have been archived, their rollups are the only record left
+    await db[ROLLUPS].delete_many({"studentId": {"$in": student_ids}, "date": {"$gte": since}})
+    if rollups:
+        await db[ROLLUPS].insert_many([
+            {"studentId": student_id, "subjectId": subject_id, "date": date, **totals}
+            for (student_id, subject_id, date), totals in rollups.items()
+        ], ordered=False)
+    return len(rollups)
+
+
+async def backfill(db, attempts, batch_size: int = 500, concurrency: int = 4, log=print) -> int:
+    """Rebuild all rollups from raw attempts, ``concurrency`` student batches at a time.
+
+    Only days that still have raw attempts are rebuilt; rollups for archived
+    days are kept. Attempts recorded while a batch is being rebuilt may be
+    counted twice or not at all for that batch, so run it when traffic is low.
+    """
+    await ensure_rollup_indexes(db)
+    oldest = await attempts.oldest()
+    if not oldest:
+        return 0
+    since = oldest.strftime("%Y-%m-%d")
+    quiz_subjects = {
+        q['id']: q['subjectId']
+        async for q in db.quizzes.find({}, {"_id": 0, "id": 1, "subjectId": 1})
+    }
+    student_ids = [s['id'] async for s in db.students.find({}, {"_id": 0, "id": 1})]
+    batches = [student_ids[i:i + batch_size] for i in range(0, len(student_ids), batch_size)]
+
+    semaphore = asyncio.Semaphore(concurrency)
+    written = 0
+
+    async def run(batch_no: int, batch: List[str]):
+        nonlocal written
+        async with semaphore:
+            written += await rebuild_batch(db, attempts, batch, quiz_subjects, since)
+            log(f"Batch {batch_no + 1}/{len(batches)}: {len(batch)} students")
+
+    await asyncio.gather(*(run(i, batch) for i, batch in enumerate(batches)))
+    return written
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from attempt_store import attempt_store_from_env
+
+    parser = argparse.ArgumentParser(description="Student analytics rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("backfill", help="rebuild rollups from raw attempts")
+    rebuild.add_argument("--batch-size", type=int, default=500, help="students per batch")
+    rebuild.add_argument("--concurrency", type=int, default=4, help="batches rebuilt in parallel")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    started = time.perf_counter()
+    attempts = attempt_store_from_env(db, os.environ.get('ATTEMPT_STORAGE'))
+    written = await backfill(db, attempts, args.batch_size, args.concurrency)
+    print(f"✅ Wrote {written} rollups in {time.perf_counter() - started:.1f}s")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from codec import as_utc, day_expression, from_storage, parse_datetime, time_range, to_storage
+
+# Attempts come back from every store in the original document shape:
+# {studentId, quizId, selectedAnswer, isCorrect, xpEarned, attemptedAt (ISO string)}
+
+COLLECTION = "student_quiz_attempts"
+
+# Attempts per cursor batch when reading a student's history; without it a
+# getMore returns up to 16 MB
+BATCH_SIZE = 1000
+
+
+def day_of(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class DocumentAttemptStore:
+    """One document per attempt in student_quiz_attempts (the original layout)."""
+
+    def __init__(self, db):
+        self.collection = db[COLLECTION]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("studentId", 1), ("quizId", 1)])
+        # A student's history in order, read straight off the index so it streams without a sort stage
+        await self.collection.create_index([("studentId", 1), ("attemptedAt", 1)])
+        await self.collection.create_index("attemptedAt")
+
+    async def insert(self, attempt: dict):
+        await self.collection.insert_one(to_storage(COLLECTION, attempt))
+
+    async def for_student(self, student_id: str, batch_size: int = BATCH_SIZE) -> AsyncIterator[dict]:
+        # Oldest first; legacy string timestamps sort before dates, and predate them
+        cursor = self.collection.find({"studentId": student_id}, {"_id": 0, "id": 0}).sort("attemptedAt", 1)
+        cursor.batch_size(batch_size)
+        try:
+            async for attempt in cursor:
+                yield from_storage(COLLECTION, attempt)
+        finally:
+            # Also when the consumer stops early, e.g. a client disconnecting mid-export
+            await cursor.close()
+
+    async def between(self, start: datetime, end: datetime) -> AsyncIterator[dict]:
+        async for attempt in self.collection.find(time_range("attemptedAt", start, end), {"_id": 0, "id": 0}):
+            yield from_storage(COLLECTION, attempt)
+
+    async def delete_between(self, start: datetime, end: datetime):
+        await self.collection.delete_many(time_range("attemptedAt", start, end))
+
+    async def oldest(self) -> Optional[datetime]:
+        # BSON sorts strings before dates, so look at both forms separately
+        candidates = []
+        for bson_type in ("date", "string"):
+            first = await self.collection.find_one(
+                {"attemptedAt": {"$type": bson_type}},
+                {"_id": 0, "attemptedAt": 1},
+                sort=[("attemptedAt", 1)]
+            )
+            if first:
+                candidates.append(parse_datetime(first['attemptedAt']))
+        return min(candidates) if candidates else None
+
+    def daily_totals(self, student_ids: List[str]):
+        # student x quiz x day counters, for rebuilding analytics rollups
+        return self.collection.aggregate([
+            {"$match": {"studentId": {"$in": student_ids}}},
+            {"$group": {
+                "_id": {
+                    "studentId": "$studentId",
+                    "quizId": "$quizId",
+                    "date": day_expression("attemptedAt")
+                },
+                "attempts": {"$sum": 1},
+                "correct": {"$sum": {"$cond": ["$isCorrect", 1, 0]}},
+                "xp": {"$sum": "$xpEarned"}
+            }}
+        ], allowDiskUse=True)
+
+
+class BucketAttemptStore:
+    """Attempts appended to per-student, per-day bucket documents in attempt_buckets.
+
+    Each bucket is {s: studentId, d: day (datetime), n: count, a: [attempts]}
+    and each attempt is {q: quizId, x: selectedAnswer, c: 0/1, p: xpEarned,
+    t: datetime}. The per-attempt UUID is dropped. A day with more than
+    ``bucket_size`` attempts spills into another bucket.
+    """
+
+    def __init__(self, db, bucket_size: int = 200):
+        self.collection = db.attempt_buckets
+        self.bucket_size = bucket_size
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("s", 1), ("d", 1)])
+        await self.collection.create_index("d")
+
+    async def insert(self, attempt: dict):
+        attempted_at = parse_datetime(attempt['attemptedAt'])
+        await self.collection.update_one(
+            {"s": attempt['studentId'], "d": day_of(attempted_at), "n": {"$lt": self.bucket_size}},
+            {
+                "$push": {"a": {
+                    "q": attempt['quizId'],
+                    "x": attempt['selectedAnswer'],
+                    "c": int(attempt['isCorrect']),
+                    "p": attempt['xpEarned'],
+                    "t": attempted_at
+                }},
+                "$inc": {"n": 1}
+            },
+            upsert=True
+        )
+
+    @staticmethod
+    def _expand(bucket: dict) -> List[dict]:
+        return [
+            {
+                "studentId": bucket['s'],
+                "quizId": a['q'],
+                "selectedAnswer": a['x'],
+                "isCorrect": bool(a['c']),
+                "xpEarned": a['p'],
+                "attemptedAt": as_utc(a['t']).isoformat()
+            }
+            for a in bucket['a']
+        ]
+
+    async def for_student(self, student_id: str, batch_size: int = BATCH_SIZE) -> AsyncIterator[dict]:
+        # A day that spilled into several buckets has them in the order they were created
+        cursor = self.collection.find({"s": student_id}, {"_id": 0}).sort([("d", 1), ("_id", 1)])
+        cursor.batch_size(max(1, batch_size // self.bucket_size))
+        try:
+            async for bucket in cursor:
+                for attempt in self._expand(bucket):
+                    yield attempt
+        finally:
+            await cursor.close()
+
+    async def between(self, start: datetime, end: datetime) -> AsyncIterator[dict]:
+        # Callers pass whole days, so bucket days line up with the range
+        async for bucket in self.collection.find({"d": {"$gte": start, "$lt": end}}, {"_id": 0}):
+            for attempt in self._expand(bucket):
+                yield attempt
+
+    async def delete_between(self, start: datetime, end: datetime):
+        await self.collection.delete_many({"d": {"$gte": start, "$lt": end}})
+
+    async def oldest(self) -> Optional[datetime]:
+        first = await self.collection.find_one({}, {"_id": 0, "d": 1}, sort=[("d", 1)])
+        return as_utc(first['d']) if first else None
+
+    def daily_totals(self, student_ids: List[str]):
+        return self.collection.aggregate([
+            {"$match": {"s": {"$in": student_ids}}},
+            {"$unwind": "$a"},
+            {"$group": {
+                "_id": {
+                    "studentId": "$s",
+                    "quizId": "$a.q",
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$d"}}
+                },
+                "attempts": {"$sum": 1},
+                "correct": {"$sum": "$a.c"},
+                "xp": {"$sum": "$a.p"}
+            }}
+        ], allowDiskUse=True)
+
+
+def attempt_store_from_env(db, mode: Optional[str]):
+    # ATTEMPT_STORAGE=documents (default) | buckets
+    if not mode or mode == 'documents':
+        return DocumentAttemptStore(db)
+    if mode == 'buckets':
+        return BucketAttemptStore(db)
+    raise ValueError(f"Unknown attempt storage: {mode}")
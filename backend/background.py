@@ -0,0 +1,33 @@
+"""Work that runs in the background, one run at a time."""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Runs ``job`` as a task, with at most one run in flight.
+
+    ``start`` returns the running task, or starts one when there is none, so
+    callers that ask at the same time share the same run. A failed run is
+    logged; the next ``start`` tries again.
+    """
+
+    def __init__(self, job: Callable[[], Awaitable], description: str):
+        self.job = job
+        self.description = description
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        task = self._task
+        # A task left over from another event loop (e.g. an earlier test's) can never finish here
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._task = asyncio.create_task(self._run())
+        return task
+
+    async def _run(self):
+        try:
+            await self.job()
+        except Exception:
+            logger.exception("%s failed", self.description)
@@ -0,0 +1,84 @@
+"""Memory and lookup cost of in-memory answer keys: QuizIndex vs a dict of quiz documents.
+
+    python bench_answer_keys.py
+    python bench_answer_keys.py --quizzes 200000
+
+"documents" keeps each quiz's grading fields as a dict keyed by id, which is
+what caching ``find_one`` results amounts to. Ids are uuid4 strings, 40
+subjects, as in production. No database is needed.
+"""
+import argparse
+import gc
+import random
+import timeit
+import tracemalloc
+import uuid
+
+from quiz_index import DIFFICULTIES, QuizIndexBuilder
+
+
+def sample_quizzes(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    subjects = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(40)]
+    for _ in range(n):
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "subjectId": rng.choice(subjects),
+            "difficulty": rng.choice(DIFFICULTIES),
+            "correctAnswer": rng.randrange(4),
+            "xp": rng.choice((10, 20, 30)),
+        }
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    built = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return built, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quizzes", type=int, default=1_000_000)
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+
+    # Ids are materialised up front so both sides are charged only for what they hold beyond them
+    quizzes = list(sample_quizzes(args.quizzes))
+
+    def build_index():
+        built = QuizIndexBuilder()
+        for quiz in quizzes:
+            built.add(quiz)
+        return built
+
+    def build_documents():
+        return {quiz["id"]: dict(quiz) for quiz in quizzes}
+
+    index, index_bytes = measure(build_index)
+    documents, document_bytes = measure(build_documents)
+
+    probes = [quizzes[i]["id"] for i in random.Random(1).sample(range(len(quizzes)), 1000)]
+
+    def index_lookup():
+        for quiz_id in probes:
+            p = index.positions.get(quiz_id)
+            index.correct[p], index.xp[p], index.subjects[index.subject[p]]
+
+    def document_lookup():
+        for quiz_id in probes:
+            q = documents.get(quiz_id)
+            q["correctAnswer"], q["xp"], q["subjectId"]
+
+    rounds = max(1, args.number // len(probes))
+    print(f"{args.quizzes:,} quizzes")
+    for name, size, lookup in (("QuizIndex", index_bytes, index_lookup), ("documents", document_bytes, document_lookup)):
+        per_lookup = min(timeit.repeat(lookup, number=rounds, repeat=3)) / (rounds * len(probes))
+        print(f"  {name:10s} {size / 2**20:8.1f} MiB  {size / args.quizzes:6.1f} B/quiz  "
+              f"lookup {per_lookup * 1e9:5.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
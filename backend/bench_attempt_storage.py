@@ -0,0 +1,119 @@
+"""Compare storage per million attempts: one document per attempt vs per-student daily buckets.
+
+    python bench_attempt_storage.py                  # BSON size estimate, no database needed
+    python bench_attempt_storage.py --mongo 200000   # load N attempts into a scratch DB and read collStats
+
+Uses MONGO_URL from .env; the scratch database (DB_NAME + "_bench") is dropped afterwards.
+"""
+import argparse
+import asyncio
+import os
+import random
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import bson
+
+from attempt_store import BucketAttemptStore, DocumentAttemptStore
+
+STUDENTS = 2000
+QUIZZES = 5000
+ATTEMPTS_PER_STUDENT_DAY = 15
+
+
+def sample_attempts(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    students = [str(uuid.uuid4()) for _ in range(STUDENTS)]
+    quizzes = [str(uuid.uuid4()) for _ in range(QUIZZES)]
+    start = datetime(2025, 9, 1, tzinfo=timezone.utc)
+    produced = 0
+    day = 0
+    while produced < n:
+        for student in students:
+            for _ in range(ATTEMPTS_PER_STUDENT_DAY):
+                if produced == n:
+                    return
+                correct = rng.random() < 0.6
+                yield {
+                    "id": str(uuid.uuid4()),
+                    "studentId": student,
+                    "quizId": rng.choice(quizzes),
+                    "selectedAnswer": rng.randrange(4),
+                    "isCorrect": correct,
+                    "xpEarned": rng.choice((50, 100)) if correct else 0,
+                    "attemptedAt": (start + timedelta(days=day, seconds=rng.randrange(86400))).isoformat()
+                }
+                produced += 1
+        day += 1
+
+
+def estimate(n: int):
+    doc_bytes = 0
+    buckets = {}
+    for attempt in sample_attempts(n):
+        doc_bytes += len(bson.encode({"_id": bson.ObjectId(), **attempt}))
+        at = datetime.fromisoformat(attempt['attemptedAt'])
+        key = (attempt['studentId'], at.date())
+        buckets.setdefault(key, []).append({
+            "q": attempt['quizId'], "x": attempt['selectedAnswer'], "c": int(attempt['isCorrect']),
+            "p": attempt['xpEarned'], "t": at
+        })
+    bucket_bytes = sum(
+        len(bson.encode({"_id": bson.ObjectId(), "s": s, "d": datetime(d.year, d.month, d.day), "n": len(a), "a": a}))
+        for (s, d), a in buckets.items()
+    )
+    scale = 1_000_000 / n
+    print(f"BSON estimate over {n:,} attempts (uncompressed, per million attempts):")
+    print(f"  documents: {doc_bytes * scale / 2**20:8.1f} MiB  ({doc_bytes / n:.0f} B/attempt, {n:,} docs)")
+    print(f"  buckets:   {bucket_bytes * scale / 2**20:8.1f} MiB  ({bucket_bytes / n:.0f} B/attempt, {len(buckets):,} docs)")
+
+
+async def measure(n: int):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME'] + "_bench"]
+    await client.drop_database(db.name)
+
+    stores = {"documents": DocumentAttemptStore(db), "buckets": BucketAttemptStore(db)}
+    for store in stores.values():
+        await store.ensure_indexes()
+
+    batch = []
+    for attempt in sample_attempts(n):
+        # Buckets go through the real upsert path; sequential so concurrent upserts don't split buckets
+        await stores["buckets"].insert(attempt)
+        batch.append(attempt)
+        if len(batch) == 1000:
+            await db.student_quiz_attempts.insert_many(batch)
+            batch = []
+    if batch:
+        await db.student_quiz_attempts.insert_many(batch)
+
+    scale = 1_000_000 / n
+    print(f"collStats over {n:,} attempts (per million attempts):")
+    for name, store in stores.items():
+        stats = await db.command("collStats", store.collection.name)
+        print(
+            f"  {name:10} data {stats['size'] * scale / 2**20:8.1f} MiB"
+            f"  storage {stats['storageSize'] * scale / 2**20:8.1f} MiB"
+            f"  indexes {stats['totalIndexSize'] * scale / 2**20:8.1f} MiB"
+            f"  ({stats['count']:,} docs)"
+        )
+
+    await client.drop_database(db.name)
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--estimate", type=int, default=200_000, metavar="N", help="attempts to encode for the estimate")
+    parser.add_argument("--mongo", type=int, metavar="N", help="also load N attempts into MongoDB and report collStats")
+    args = parser.parse_args()
+
+    estimate(args.estimate)
+    if args.mongo:
+        asyncio.run(measure(args.mongo))
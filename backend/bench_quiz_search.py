@@ -0,0 +1,76 @@
+"""Quiz search latency over a synthetic quiz bank.
+
+    python bench_quiz_search.py
+    python bench_quiz_search.py --quizzes 300000
+
+Questions are drawn from a Zipf-like vocabulary so that common words match
+a large share of the bank, which is the expensive case for ranking. No
+database is needed.
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+
+from quiz_index import DIFFICULTIES, QuizIndex, QuizIndexBuilder
+from quiz_search import QuizSearch, quiz_tokens
+
+QUERIES = [
+    ("common word", {"query": "w0"}),
+    ("two words", {"query": "w3 w250"}),
+    ("rare word", {"query": "w4000"}),
+    ("word + subject + difficulty", {"query": "w10", "subject_id": "subj-3", "difficulty": "hard"}),
+    ("tag only", {"tag": "t7"}),
+    ("common word, page 20", {"query": "w1", "offset": 380}),
+]
+
+
+def sample_quizzes(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    weights = [1 / (i + 1) for i in range(len(vocabulary))]
+    for _ in range(n):
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "subjectId": f"subj-{rng.randrange(10)}",
+            "question": " ".join(rng.choices(vocabulary, weights, k=rng.randrange(8, 20))),
+            "options": [" ".join(rng.choices(vocabulary, weights, k=2)) for _ in range(4)],
+            "correctAnswer": rng.randrange(4),
+            "difficulty": rng.choice(DIFFICULTIES),
+            "xp": 50,
+            "tags": [f"t{rng.randrange(50)}"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quizzes", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    quizzes = list(sample_quizzes(args.quizzes))
+    built = QuizIndexBuilder()
+    for quiz in quizzes:
+        built.add(quiz)
+    index = QuizIndex(db=None)
+    index._swap(built)
+    index._stale = False
+
+    search = QuizSearch(index)
+    started = time.perf_counter()
+    search.build((built.positions[q["id"]], quiz_tokens(q), q["tags"]) for q in quizzes)
+    print(f"{args.quizzes:,} quizzes, index built in {time.perf_counter() - started:.2f} s")
+
+    for name, kwargs in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            total, _ = search.search(**kwargs)
+            timings.append(time.perf_counter() - started)
+        print(f"  {name:30s} {total:7d} matches  median {statistics.median(timings) * 1000:5.2f} ms"
+              f"  max {max(timings) * 1000:5.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Request-path queries on MongoDB vs PostgreSQL, through the two repositories.
+
+    python bench_repository.py                                       # MongoDB only
+    python bench_repository.py --postgres postgresql://localhost/app
+    python bench_repository.py --postgres ... --students 50000 --ops 20000 --concurrency 100
+
+MongoDB is MONGO_URL from .env with a scratch database (DB_NAME + "_bench");
+PostgreSQL gets a scratch schema "repository_bench" holding the tables of the
+Supabase migration. Both are dropped afterwards. Each operation runs ``--ops``
+times from ``--concurrency`` concurrent tasks, like requests on one worker.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from attempt_store import DocumentAttemptStore
+from repository import MongoRepository, PostgresRepository
+
+SCHEMA = "repository_bench"
+QUIZZES = 2000
+PASSWORD_HASH = "$2b$12$" + "x" * 53
+
+
+def sample_students(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "email": f"student{i}@example.com",
+            "username": f"student{i}",
+            "passwordHash": PASSWORD_HASH,
+            "grade": rng.choice((11, 12)),
+            "mbtiType": None,
+            "xp": rng.randrange(20000),
+            "level": 1,
+            "streak": 0,
+            "lastActive": now,
+            "createdAt": now,
+        }
+        for i in range(n)
+    ]
+
+
+async def load(repo, students, chunk: int = 500):
+    for start in range(0, len(students), chunk):
+        await asyncio.gather(*(repo.create_student(dict(s)) for s in students[start:start + chunk]))
+
+
+def operations(repo, students, quiz_ids, rng):
+    async def attempt():
+        student = rng.choice(students)
+        await repo.add_xp(student['id'], 50)
+        await repo.insert_attempt({
+            "id": str(uuid.uuid4()), "studentId": student['id'], "quizId": rng.choice(quiz_ids),
+            "selectedAnswer": 1, "isCorrect": True, "xpEarned": 50, "attemptedAt": datetime.now(timezone.utc)
+        })
+
+    return {
+        "auth lookup (by id)": lambda: repo.student(rng.choice(students)['id']),
+        "login lookup (by username)": lambda: repo.student_by_username(rng.choice(students)['username']),
+        "attempt (xp + insert)": attempt,
+        "rank of one student": lambda: repo.rank(rng.choice(students)['id']),
+        "top 50": lambda: repo.top_students(50),
+    }
+
+
+async def measure(op, ops: int, concurrency: int):
+    latencies = []
+
+    async def worker(count: int):
+        for _ in range(count):
+            started = time.perf_counter()
+            await op()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(ops // concurrency) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+async def bench(name, repo, students, quiz_ids, args):
+    print(f"{name}: loading {len(students):,} students")
+    await load(repo, students)
+    rng = random.Random(1)
+    for label, op in operations(repo, students, quiz_ids, rng).items():
+        for _ in range(min(200, args.ops)):
+            await op()  # warm caches, pools and prepared statements
+        rate, p50, p99 = await measure(op, args.ops, args.concurrency)
+        print(f"  {label:28s} {rate:8.0f} ops/s  p50 {p50 * 1000:6.2f} ms  p99 {p99 * 1000:6.2f} ms")
+
+
+async def bench_mongo(students, quiz_ids, args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    name = os.environ['DB_NAME'] + "_bench"
+    db = client[name]
+    try:
+        await db.students.create_index("id", unique=True)
+        await db.students.create_index("username", unique=True)
+        await db.students.create_index("email", unique=True)
+        await db.students.create_index([("xp", -1), ("id", 1)])
+        attempts = DocumentAttemptStore(db)
+        await attempts.ensure_indexes()
+        await bench("MongoDB", MongoRepository(db, attempts), students, quiz_ids, args)
+    finally:
+        await client.drop_database(name)
+        client.close()
+
+
+async def bench_postgres(students, quiz_ids, args):
+    repo = PostgresRepository(args.postgres, max_size=args.concurrency, server_settings={"search_path": SCHEMA})
+    await repo.start()
+    try:
+        await repo.pool.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+        await repo.ensure_schema()
+        # Attempts reference quizzes, quizzes reference a subject
+        subject_id = uuid.uuid4()
+        await repo.pool.execute("INSERT INTO exam_subjects (id, name) VALUES ($1, 'Bench')", subject_id)
+        await repo.pool.executemany(
+            "INSERT INTO quizzes (id, subject_id, question, options, correct_answer, difficulty, xp) "
+            "VALUES ($1, $2, 'Q', '[\"a\", \"b\"]', 0, 'easy', 50)",
+            [(uuid.UUID(q), subject_id) for q in quiz_ids]
+        )
+        await bench("PostgreSQL", repo, students, quiz_ids, args)
+    finally:
+        await repo.pool.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await repo.stop()
+
+
+async def main():
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--postgres", help="PostgreSQL DSN; without it only MongoDB is measured")
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    students = sample_students(args.students)
+    quiz_ids = [str(uuid.uuid4()) for _ in range(QUIZZES)]
+
+    await bench_mongo(students, quiz_ids, args)
+    if args.postgres:
+        await bench_postgres(students, quiz_ids, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
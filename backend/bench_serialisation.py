@@ -0,0 +1,85 @@
+"""Serialisation CPU per response: FastAPI's default path vs orjson vs cached bytes.
+
+    python bench_serialisation.py
+    python bench_serialisation.py --number 20000
+
+"fastapi" is what a plain ``return`` costs: response_model validation (where
+the route has one), jsonable_encoder and the stdlib JSONResponse encoder.
+No database is needed; payloads come from the seed data.
+"""
+import argparse
+import json
+import os
+import timeit
+import uuid
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'bench')
+
+from fastapi.encoders import jsonable_encoder
+
+from responses import dumps
+from seed_data import BADGES, MBTI_TYPES, QUIZZES
+from server import QuizResult, TokenResponse
+
+
+def stdlib_dumps(value) -> bytes:
+    # starlette.responses.JSONResponse.render
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def payloads():
+    user = {
+        "id": str(uuid.uuid4()), "email": "bat@example.mn", "username": "Бат-Эрдэнэ", "grade": 12,
+        "mbtiType": "ENFP", "xp": 12450, "level": 13, "streak": 6,
+        "lastActive": "2025-10-21T09:54:46.123456+00:00", "createdAt": "2025-09-01T08:00:00+00:00"
+    }
+    quizzes = [{**q, "id": str(uuid.uuid4()), "subjectId": str(uuid.uuid4())} for q in QUIZZES]
+    leaderboard = [
+        {"id": str(uuid.uuid4()), "username": f"student{i}", "xp": 50000 - i * 100, "level": 50 - i // 10, "rank": i + 1}
+        for i in range(50)
+    ]
+    token = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + "x" * 120
+    return [
+        ("quizzes", None, (quizzes * 2)[:10]),
+        ("mbti/types", None, MBTI_TYPES),
+        ("badges", None, [{**b, "unlocked": i % 2 == 0} for i, b in enumerate(BADGES)]),
+        ("leaderboard", None, {"leaderboard": leaderboard, "myRank": 17}),
+        ("auth/login", TokenResponse, {"token": token, "user": user}),
+        ("quizzes/attempt", QuizResult, {
+            "isCorrect": True, "correctAnswer": 2, "xpEarned": 100, "newXp": 12550, "newLevel": 13, "leveledUp": False
+        }),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=5000, help="iterations per measurement")
+    args = parser.parse_args()
+
+    print(f"{'payload':16} {'bytes':>6} {'fastapi µs':>11} {'orjson µs':>10} {'cached µs':>10} {'saved µs':>9}")
+    for name, model, payload in payloads():
+        if model:
+            def default():
+                return stdlib_dumps(jsonable_encoder(model(**payload)))
+        else:
+            def default():
+                return stdlib_dumps(jsonable_encoder(payload))
+        cached = dumps(payload)
+        assert json.loads(default()) == json.loads(cached)
+
+        runs = {
+            "fastapi": default,
+            "orjson": lambda: dumps(payload),
+            # Pre-serialised catalog bytes only cost the cache lookup
+            "cached": lambda: {"payload": cached}.get("payload"),
+        }
+        timings = {k: min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number * 1e6 for k, fn in runs.items()}
+        print(
+            f"{name:16} {len(cached):6} {timings['fastapi']:11.1f} {timings['orjson']:10.1f}"
+            f" {timings['cached']:10.2f} {timings['fastapi'] - timings['orjson']:9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
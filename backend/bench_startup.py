@@ -0,0 +1,87 @@
+"""Worker startup cost: import time of the app and time until the first request is served.
+
+    python bench_startup.py
+    python bench_startup.py --runs 10
+
+Each run starts a fresh interpreter. "first request" spawns uvicorn and polls
+/api/health until it answers, which is what an autoscaler's readiness probe
+sees. MongoDB does not have to be reachable.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+IMPORT_SNIPPET = (
+    "import sys, time; t = time.perf_counter(); import server; "
+    "print(time.perf_counter() - t, 'motor' in sys.modules, 'bcrypt' in sys.modules)"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def env() -> dict:
+    # An address nothing listens on: startup must not wait for the database
+    return {
+        **os.environ,
+        "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=500"),
+        "DB_NAME": os.environ.get("DB_NAME", "startup_bench"),
+    }
+
+
+def import_time():
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env(),
+        capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(out[0]), out[1] == "True", out[2] == "True"
+
+
+def first_request_time(timeout: float = 30.0) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.HTTPError:
+                time.sleep(0.005)
+        raise RuntimeError("server did not come up")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    firsts = [first_request_time() for _ in range(args.runs)]
+    _, motor_loaded, bcrypt_loaded = imports[-1]
+    print(f"import server:        median {statistics.median(t for t, _, _ in imports) * 1000:6.0f} ms"
+          f"  (motor imported: {motor_loaded}, bcrypt imported: {bcrypt_loaded})")
+    print(f"spawn -> first 200:   median {statistics.median(firsts) * 1000:6.0f} ms"
+          f"  min {min(firsts) * 1000:.0f} ms  max {max(firsts) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""File and bulk-write helpers shared by the import commands (quiz_bank.py, provisioning.py)."""
+from pathlib import Path
+from typing import Callable, Optional
+
+DUPLICATE_KEY = 11000
+
+
+def format_from(path: Path, fmt: Optional[str]) -> str:
+    return fmt or ("csv" if path.suffix.lower() == ".csv" else "jsonl")
+
+
+def write_error_message(error: dict, duplicate: Callable[[dict], str]) -> str:
+    """Why one write of an unordered bulk write failed; ``duplicate`` words unique index violations."""
+    if error.get("code") == DUPLICATE_KEY:
+        return duplicate(error)
+    return error.get("errmsg", "Write failed")
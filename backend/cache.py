@@ -0,0 +1,127 @@
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from pubsub import PubSub, broker_from_url
+
+MISSING = object()
+
+
+class LRUCache:
+    """Small in-process LRU cache with an optional TTL as a safety net against missed invalidations."""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires = entry
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InvalidationBus:
+    """Broadcasts data mutations so every worker evicts the same cache entries.
+
+    Events have a ``kind`` ("student", "catalog", ...) and an optional ``key``
+    (a student id, a collection name). They travel over the pub/sub broker, so
+    with a file or change-stream broker every worker applies them, including
+    the one that published. ``generation`` counts applied events. Loaders
+    compare per-(kind, key) generations instead, so that an eviction racing
+    with their read stops them from caching, but unrelated events do not.
+    """
+
+    TOPIC = "invalidate"
+
+    def __init__(self, pubsub: PubSub):
+        self.pubsub = pubsub
+        self.generation = 0
+        # Events without a key, per kind; all events, per kind; keyed events, only for keys being loaded
+        self._kind_generations: Dict[str, int] = defaultdict(int)
+        self._any_generations: Dict[str, int] = defaultdict(int)
+        self._key_generations: Dict[Tuple[str, str], int] = {}
+        self._loading: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._handlers: Dict[str, List[Callable[[Optional[str]], None]]] = defaultdict(list)
+        pubsub.listen(self.TOPIC, self._apply)
+
+    def on(self, kind: str, handler: Callable[[Optional[str]], None]):
+        self._handlers[kind].append(handler)
+
+    async def publish(self, kind: str, key: Optional[str] = None):
+        await self.pubsub.publish(self.TOPIC, {"kind": kind, "key": key})
+
+    def _apply(self, topic: str, message: dict):
+        kind, key = message.get('kind'), message.get('key')
+        self.generation += 1
+        self._any_generations[kind] += 1
+        if key is None:
+            self._kind_generations[kind] += 1
+        elif (kind, key) in self._key_generations:
+            self._key_generations[(kind, key)] += 1
+        for handler in self._handlers.get(kind, ()):
+            handler(key)
+
+    def _generation(self, kind: str, key: Optional[str]) -> tuple:
+        if key is None:
+            return self._any_generations[kind],
+        return self._kind_generations[kind], self._key_generations[(kind, key)]
+
+    async def cached(self, cache: LRUCache, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                     kind: str, event_key: Optional[str] = None) -> Any:
+        """``cache[key]``, loaded on a miss; evicted by ``kind`` events for ``event_key``, or any ``kind`` event if None."""
+        value = cache.get(key)
+        if value is MISSING:
+            loading = (kind, event_key)
+            if event_key is not None:
+                self._loading[loading] += 1
+                self._key_generations.setdefault(loading, 0)
+            try:
+                generation = self._generation(kind, event_key)
+                value = await loader()
+                # Don't store a value that may have been read before a concurrent eviction
+                if generation == self._generation(kind, event_key):
+                    cache.set(key, value)
+            finally:
+                if event_key is not None:
+                    self._loading[loading] -= 1
+                    if not self._loading[loading]:
+                        del self._loading[loading]
+                        del self._key_generations[loading]
+        return value
+
+
+async def publish_invalidation(db, kind: str, key: Optional[str] = None):
+    """Publish one invalidation from a command-line tool, so running workers drop what it changed.
+
+    Goes through the broker named by PUBSUB_BROKER, as the workers do.
+    """
+    pubsub = PubSub(broker_from_url(os.environ.get('PUBSUB_BROKER'), db))
+    await pubsub.start()
+    try:
+        await InvalidationBus(pubsub).publish(kind, key)
+    finally:
+        await pubsub.stop()
@@ -0,0 +1,155 @@
+"""Storage codec: timestamps are stored as BSON datetimes, the API keeps returning strings.
+
+Older documents hold ISO strings ("2025-10-21T09:54:46.123456+00:00") and daily
+quest rows a "YYYY-MM-DD" date string. Reads accept both forms until
+``python codec.py migrate`` has converted everything.
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Union
+
+from pymongo import UpdateOne
+
+# collection -> fields holding a point in time (served as ISO strings)
+DATETIME_FIELDS = {
+    "students": ("createdAt", "lastActive"),
+    "student_quiz_attempts": ("attemptedAt",),
+}
+
+# collection -> fields holding a UTC day (served as "YYYY-MM-DD")
+DATE_FIELDS = {
+    "student_daily_quests": ("date",),
+}
+
+
+def as_utc(value: datetime) -> datetime:
+    # Motor returns naive datetimes unless the client is tz_aware
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def parse_datetime(value: Union[str, datetime]) -> datetime:
+    if isinstance(value, datetime):
+        return as_utc(value)
+    return as_utc(datetime.fromisoformat(value))
+
+
+def parse_day(value: Union[str, datetime]) -> datetime:
+    if isinstance(value, datetime):
+        value = as_utc(value)
+    else:
+        value = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def format_datetime(value):
+    return as_utc(value).isoformat() if isinstance(value, datetime) else value
+
+
+def format_day(value):
+    return value.strftime("%Y-%m-%d") if isinstance(value, datetime) else value
+
+
+def to_storage(collection: str, doc: dict) -> dict:
+    stored = dict(doc)
+    for field in DATETIME_FIELDS.get(collection, ()):
+        if stored.get(field) is not None:
+            stored[field] = parse_datetime(stored[field])
+    for field in DATE_FIELDS.get(collection, ()):
+        if stored.get(field) is not None:
+            stored[field] = parse_day(stored[field])
+    return stored
+
+
+def from_storage(collection: str, doc: Optional[dict]) -> Optional[dict]:
+    if doc is None:
+        return None
+    for field in DATETIME_FIELDS.get(collection, ()):
+        if field in doc:
+            doc[field] = format_datetime(doc[field])
+    for field in DATE_FIELDS.get(collection, ()):
+        if field in doc:
+            doc[field] = format_day(doc[field])
+    return doc
+
+
+def day_match(day: Union[str, datetime]) -> dict:
+    # Matches a day stored either way while a migration is in progress
+    start = parse_day(day)
+    return {"$in": [start, start.strftime("%Y-%m-%d")]}
+
+
+def time_range(field: str, start: datetime, end: datetime) -> dict:
+    # Both branches are index range scans; the string one is empty once migrated
+    return {"$or": [
+        {field: {"$gte": start, "$lt": end}},
+        {field: {"$gte": start.isoformat(), "$lt": end.isoformat()}},
+    ]}
+
+
+def day_expression(field: str) -> dict:
+    # "YYYY-MM-DD" of a timestamp field inside an aggregation, for either storage form
+    return {"$cond": [
+        {"$eq": [{"$type": f"${field}"}, "string"]},
+        {"$substrCP": [f"${field}", 0, 10]},
+        {"$dateToString": {"format": "%Y-%m-%d", "date": f"${field}"}}
+    ]}
+
+
+# ============ MIGRATION ============
+
+async def migrate_collection(db, collection: str, batch_size: int = 1000, pause: float = 0.0, log=print) -> int:
+    """Convert string timestamps to datetimes in small batches, safe to run against a live database.
+
+    Each update is conditional on the field still holding the string that was
+    read, so a concurrent write from the API is never overwritten.
+    """
+    fields = [(f, parse_datetime) for f in DATETIME_FIELDS.get(collection, ())]
+    fields += [(f, parse_day) for f in DATE_FIELDS.get(collection, ())]
+    converted = 0
+    for field, parse in fields:
+        while True:
+            docs = await db[collection].find(
+                {field: {"$type": "string"}},
+                {"_id": 1, field: 1}
+            ).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            result = await db[collection].bulk_write([
+                UpdateOne({"_id": doc['_id'], field: doc[field]}, {"$set": {field: parse(doc[field])}})
+                for doc in docs
+            ], ordered=False)
+            converted += result.modified_count
+            log(f"{collection}.{field}: converted {converted}")
+            if pause:
+                await asyncio.sleep(pause)
+    return converted
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Timestamp storage codec")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="convert ISO string timestamps to BSON datetimes")
+    migrate.add_argument("--batch-size", type=int, default=1000)
+    migrate.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    started = time.perf_counter()
+    total = 0
+    for collection in list(DATETIME_FIELDS) + list(DATE_FIELDS):
+        total += await migrate_collection(db, collection, args.batch_size, args.pause)
+    print(f"✅ Converted {total} fields in {time.perf_counter() - started:.1f}s")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
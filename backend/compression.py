@@ -0,0 +1,249 @@
+"""Response compression negotiated from Accept-Encoding.
+
+``CompressionMiddleware`` compresses JSON/text responses of at least
+``minimum_size`` bytes with brotli or zstd when installed, gzip otherwise,
+including streamed bodies. Payloads that rarely change are wrapped in
+``Precompressed``; each encoding is produced once at a high level and served
+by ``PrecompressedResponse`` without touching the middleware.
+"""
+import gzip
+import os
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '500'))
+
+# Server preference when the client weighs encodings equally
+ENCODINGS = tuple(e for e, available in (("br", brotli), ("zstd", zstandard), ("gzip", True)) if available)
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# Per-response levels favour speed; precompressed payloads are encoded once, so go for size
+DYNAMIC_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+STATIC_LEVELS = {"br": 11, "zstd": 19, "gzip": 9}
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(encoding: str, data: bytes, level: Optional[int] = None) -> bytes:
+    level = DYNAMIC_LEVELS[encoding] if level is None else level
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class _StreamCompressor:
+    # Each chunk is flushed so a streamed response reaches the client as it is produced
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        level = DYNAMIC_LEVELS[encoding]
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=level)
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if not data:
+            return b""
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.flush()
+        if self.encoding == "zstd":
+            return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.finish() if self.encoding == "br" else self._obj.flush()
+
+
+class CompressionStats:
+    """Responses, bytes before/after and compression CPU time, per encoding."""
+
+    def __init__(self):
+        self._rows = defaultdict(lambda: [0, 0, 0, 0.0])
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, cpu: float = 0.0):
+        row = self._rows[encoding]
+        row[0] += 1
+        row[1] += bytes_in
+        row[2] += bytes_out
+        row[3] += cpu
+
+    def snapshot(self) -> dict:
+        out = {}
+        for encoding, (responses, bytes_in, bytes_out, cpu) in self._rows.items():
+            out[encoding] = {
+                "responses": responses,
+                "bytesIn": bytes_in,
+                "bytesOut": bytes_out,
+                "bytesOutPerResponse": round(bytes_out / responses),
+                "ratio": round(bytes_out / bytes_in, 3) if bytes_in else 1.0,
+                "cpuMsPerResponse": round(cpu * 1000 / responses, 3)
+            }
+        return out
+
+
+stats = CompressionStats()
+
+
+class Precompressed:
+    """A serialised payload plus its compressed variants, built on first use."""
+
+    __slots__ = ("body", "_variants")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._variants: Dict[str, bytes] = {}
+
+    def variant(self, encoding: str) -> bytes:
+        data = self._variants.get(encoding)
+        if data is None:
+            data = self._variants[encoding] = compress(encoding, self.body, STATIC_LEVELS[encoding])
+        return data
+
+
+class PrecompressedResponse(Response):
+    media_type = "application/json"
+
+    def __init__(self, payload: Precompressed, status_code: int = 200):
+        self.payload = payload
+        super().__init__(payload.body, status_code=status_code)
+
+    async def __call__(self, scope, receive, send):
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding and len(self.payload.body) >= COMPRESSION_MIN_SIZE:
+            self.body = self.payload.variant(encoding)
+            self.headers["content-encoding"] = encoding
+            self.headers["content-length"] = str(len(self.body))
+            self.headers["vary"] = "Accept-Encoding"
+            stats.record(f"{encoding} (precompressed)", len(self.payload.body), len(self.body))
+        await super().__call__(scope, receive, send)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, stats: CompressionStats = stats):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        await self.app(scope, receive, _CompressingSender(send, encoding, self.minimum_size, self.stats))
+
+
+class _CompressingSender:
+    def __init__(self, send, encoding: Optional[str], minimum_size: int, stats: CompressionStats):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.stats = stats
+        self.start = None
+        # None until the first body chunk decides between passing through and compressing
+        self.passthrough: Optional[bool] = None
+        self.counted = True
+        self.stream: Optional[_StreamCompressor] = None
+        self.bytes_in = self.bytes_out = 0
+        self.cpu = 0.0
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough is None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            # Precompressed responses count themselves
+            self.counted = "content-encoding" not in headers
+            self.passthrough = (
+                self.encoding is None
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                or (not more_body and len(body) < self.minimum_size)
+            )
+            if not self.passthrough:
+                if "content-length" in headers:
+                    del headers["content-length"]
+                headers["content-encoding"] = self.encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    began = time.thread_time()
+                    body = compress(self.encoding, message["body"])
+                    self.cpu = time.thread_time() - began
+                    headers["content-length"] = str(len(body))
+                    self.bytes_in = len(message["body"])
+                    self.bytes_out = len(body)
+                    self.stats.record(self.encoding, self.bytes_in, self.bytes_out, self.cpu)
+                    await self.send(start)
+                    await self.send({"type": "http.response.body", "body": body})
+                    return
+                self.stream = _StreamCompressor(self.encoding)
+            await self.send(start)
+
+        if self.passthrough:
+            self.bytes_in += len(body)
+            await self.send(message)
+            if not more_body and self.counted:
+                self.stats.record("identity", self.bytes_in, self.bytes_in)
+            return
+
+        # Streamed body: compress chunk by chunk
+        began = time.thread_time()
+        chunk = self.stream.compress(body)
+        if not more_body:
+            chunk += self.stream.finish()
+        self.cpu += time.thread_time() - began
+        self.bytes_in += len(body)
+        self.bytes_out += len(chunk)
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        if not more_body:
+            self.stats.record(self.encoding, self.bytes_in, self.bytes_out, self.cpu)
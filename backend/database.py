@@ -0,0 +1,62 @@
+import os
+
+
+class LazyDatabase:
+    """Stands in for the Motor database and creates the client on first use.
+
+    Importing the app then needs neither MONGO_URL/DB_NAME nor the driver, and
+    the connection is set up during startup (or by the first query) instead of
+    at import time. Attribute and item access are forwarded, so ``db.students``
+    and ``db["students"]`` work as before.
+    """
+
+    def __init__(self, **client_options):
+        self._client_options = client_options
+        self._client = None
+        self._db = None
+
+    @property
+    def client(self):
+        self.get()
+        return self._client
+
+    def get(self):
+        if self._db is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self._client = AsyncIOMotorClient(os.environ['MONGO_URL'], **self._client_options)
+            self._db = self._client[os.environ['DB_NAME']]
+        return self._db
+
+    @property
+    def connected(self) -> bool:
+        return self._db is not None
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name] if self._db is None else getattr(self._db, name)
+
+    def __getitem__(self, name: str):
+        # Components built at import keep collection handles; those resolve on first use
+        return LazyCollection(self, name) if self._db is None else self._db[name]
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = self._db = None
+
+
+class LazyCollection:
+    """A collection of a LazyDatabase that was looked up before the client existed."""
+
+    def __init__(self, database: LazyDatabase, name: str):
+        self._database = database
+        self.name = name
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._database.get()[self.name], name)
+
+    def __getitem__(self, name: str):
+        return self._database.get()[self.name][name]
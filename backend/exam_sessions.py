@@ -0,0 +1,430 @@
+"""Timed mock exams, held in memory on the worker that runs them.
+
+An exam is drawn from the subject's quiz pools of the ``QuizSelector`` (the
+answer keys and difficulties come from the in-memory ``QuizIndex``), and one
+query fetches the question texts. A running session is the quiz ids plus
+three small packed arrays (answer key, points, answers); answers change only
+memory, and the answers that changed are written to ``exam_sessions`` in one
+bulk write per checkpoint interval. Submitting closes the stored session with
+this worker's pending answers in one atomic update that returns the merged
+answers, grades them from the session's own answer key and stores the result.
+Sessions still open after their deadline are graded by the checkpoint task,
+including ones left behind by a worker that stopped.
+
+A session can be open on several workers at once (another worker loads it
+from its checkpoint). Each writes only the positions it changed, so their
+answers are merged rather than overwriting each other.
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+from codec import as_utc, format_datetime
+from quiz_index import DIFFICULTIES
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "exam_sessions"
+
+EXAM_QUESTIONS = 40
+SECONDS_PER_QUESTION = 90
+# Share of easy, medium and hard questions, and what each is worth
+EXAM_MIX = (0.3, 0.4, 0.3)
+DIFFICULTY_POINTS = (1, 2, 3)
+
+# Answers still in flight when time runs out are accepted for this long
+SUBMIT_GRACE_SECONDS = 30
+
+UNANSWERED = 255
+QUESTION_PROJECTION = {"_id": 0, "id": 1, "question": 1, "options": 1}
+RESULT_FIELDS = ("correct", "total", "points", "maxPoints", "scaledScore", "maxScore")
+
+
+class ExamInProgress(Exception):
+    """The student already has an exam running."""
+
+    def __init__(self, session_id: str):
+        super().__init__("An exam is already in progress")
+        self.session_id = session_id
+
+
+class ExamClosed(Exception):
+    """The exam was submitted, or its time is up."""
+
+
+def timestamp(value: datetime) -> float:
+    return as_utc(value).timestamp()
+
+
+def from_timestamp(value: float) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+def stored_answers(answers: Sequence[Optional[int]]) -> bytearray:
+    return bytearray(UNANSWERED if a is None else a for a in answers)
+
+
+def summary(graded: dict) -> dict:
+    return {field: graded[field] for field in RESULT_FIELDS}
+
+
+class ExamSession:
+    __slots__ = ("id", "student_id", "subject_id", "quiz_ids", "key", "points", "answers",
+                 "started_at", "deadline", "max_score", "result")
+
+    def __init__(self, id: str, student_id: str, subject_id: str, quiz_ids: Tuple[str, ...],
+                 key: array, points: array, answers: bytearray, started_at: float, deadline: float,
+                 max_score: int, result: Optional[dict] = None):
+        self.id = id
+        self.student_id = student_id
+        self.subject_id = subject_id
+        self.quiz_ids = quiz_ids
+        self.key = key
+        self.points = points
+        self.answers = answers
+        self.started_at = started_at
+        self.deadline = deadline
+        self.max_score = max_score
+        self.result = result
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "ExamSession":
+        session = cls(
+            doc['id'], doc['studentId'], doc['subjectId'], tuple(doc['quizIds']),
+            array('B', doc['key']), array('B', doc['points']),
+            stored_answers(doc['answers']),
+            timestamp(doc['startedAt']), timestamp(doc['deadline']), doc['maxScore'], doc.get('result')
+        )
+        if session.result is None and doc.get('status', 'active') != 'active':
+            # Closed, but the worker grading it stopped before storing the result
+            session.result = summary(session.grade())
+        return session
+
+    def to_doc(self) -> dict:
+        return {
+            "id": self.id,
+            "studentId": self.student_id,
+            "subjectId": self.subject_id,
+            "quizIds": list(self.quiz_ids),
+            "key": list(self.key),
+            "points": list(self.points),
+            "answers": self.answer_list(),
+            "startedAt": from_timestamp(self.started_at),
+            "deadline": from_timestamp(self.deadline),
+            "maxScore": self.max_score,
+            "status": "active",
+        }
+
+    def answer_list(self) -> List[Optional[int]]:
+        return [None if a == UNANSWERED else a for a in self.answers]
+
+    def answered(self) -> int:
+        return len(self.answers) - self.answers.count(UNANSWERED)
+
+    def set_answers(self, answers: Sequence[Optional[int]]):
+        if len(answers) != len(self.answers):
+            raise ValueError(f"Expected {len(self.answers)} answers")
+        for question, answer in enumerate(answers):
+            self.set_answer(question, answer)
+
+    def set_answer(self, question: int, answer: Optional[int]):
+        if not 0 <= question < len(self.answers):
+            raise ValueError("No such question")
+        if answer is not None and not 0 <= answer < UNANSWERED:
+            raise ValueError("No such option")
+        self.answers[question] = UNANSWERED if answer is None else answer
+
+    def view(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        return {
+            "id": self.id,
+            "subjectId": self.subject_id,
+            "status": "active" if self.result is None else "submitted",
+            "startedAt": format_datetime(from_timestamp(self.started_at)),
+            "deadline": format_datetime(from_timestamp(self.deadline)),
+            "remainingSeconds": max(0, round(self.deadline - now)) if self.result is None else 0,
+            "answers": self.answer_list(),
+        }
+
+    def grade(self) -> dict:
+        correct = earned = 0
+        questions = []
+        for quiz_id, key, points, answer in zip(self.quiz_ids, self.key, self.points, self.answers):
+            is_correct = answer == key
+            if is_correct:
+                correct += 1
+                earned += points
+            questions.append({
+                "quizId": quiz_id,
+                "selectedAnswer": None if answer == UNANSWERED else answer,
+                "correctAnswer": key,
+                "isCorrect": is_correct,
+            })
+        possible = sum(self.points)
+        return {
+            "correct": correct,
+            "total": len(self.quiz_ids),
+            "points": earned,
+            "maxPoints": possible,
+            # Difficulty-weighted share of the points, on the subject's scale (800)
+            "scaledScore": round(self.max_score * earned / possible) if possible else 0,
+            "maxScore": self.max_score,
+            "questions": questions,
+        }
+
+
+class ExamSessions:
+    """Running exams of this worker, checkpointed to MongoDB every ``checkpoint_interval`` seconds."""
+
+    def __init__(self, db, selector, checkpoint_interval: float = 15.0):
+        self.db = db
+        self.selector = selector
+        self.checkpoint_interval = checkpoint_interval
+        self.sessions: Dict[str, ExamSession] = {}
+        self.by_student: Dict[str, str] = {}
+        self.rng = random.Random()
+        # session id -> answer positions changed here since the last checkpoint
+        self._dirty: Dict[str, Set[int]] = {}
+        # Sessions whose close write is in flight on this worker
+        self._finishing: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---- lifecycle ----
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.checkpoint()
+        except Exception:
+            logger.exception("Could not checkpoint exam sessions")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+                await self.close_expired()
+            except Exception:
+                logger.exception("Exam checkpoint failed")
+
+    async def ensure_indexes(self):
+        await self.db[COLLECTION].create_index("id", unique=True)
+        await self.db[COLLECTION].create_index([("studentId", 1), ("status", 1)])
+        await self.db[COLLECTION].create_index([("status", 1), ("deadline", 1)])
+
+    # ---- sessions ----
+
+    def _add(self, session: ExamSession):
+        self.sessions[session.id] = session
+        self.by_student[session.student_id] = session.id
+
+    def _forget(self, session: ExamSession):
+        self.sessions.pop(session.id, None)
+        self._dirty.pop(session.id, None)
+        if self.by_student.get(session.student_id) == session.id:
+            del self.by_student[session.student_id]
+
+    async def load(self, session_id: str) -> Optional[ExamSession]:
+        session = self.sessions.get(session_id)
+        if session is None:
+            doc = await self.db[COLLECTION].find_one({"id": session_id}, {"_id": 0})
+            if doc is None:
+                return None
+            session = ExamSession.from_doc(doc)
+            # Running on another worker, or started before a restart: continue from its checkpoint
+            if session.result is None:
+                self._add(session)
+        return session
+
+    async def active_for(self, student_id: str) -> Optional[ExamSession]:
+        session_id = self.by_student.get(student_id)
+        if session_id is not None:
+            return self.sessions[session_id]
+        doc = await self.db[COLLECTION].find_one({"studentId": student_id, "status": "active"}, {"_id": 0})
+        if doc is None:
+            return None
+        session = ExamSession.from_doc(doc)
+        self._add(session)
+        return session
+
+    def assemble(self, subject_id: str, n: int) -> List[int]:
+        """QuizIndex positions of an ``n``-question exam, easy to hard, following ``EXAM_MIX`` where the pools allow."""
+        pools = [self.selector.pools.get((subject_id, d)) or array('I') for d in range(len(DIFFICULTIES))]
+        quotas = [round(n * share) for share in EXAM_MIX]
+        quotas[1] += n - sum(quotas)
+        chosen = [self.rng.sample(pool, min(quota, len(pool))) for pool, quota in zip(pools, quotas)]
+
+        # A difficulty short of questions is made up from the others
+        short = n - sum(len(c) for c in chosen)
+        for d, pool in sorted(enumerate(pools), key=lambda p: len(p[1]), reverse=True):
+            if short <= 0:
+                break
+            taken = set(chosen[d])
+            # Sampling len(taken) more than needed always leaves enough untaken ones
+            extra = [p for p in self.rng.sample(pool, min(len(pool), short + len(taken))) if p not in taken][:short]
+            chosen[d] += extra
+            short -= len(extra)
+        return [position for group in chosen for position in group]
+
+    async def questions(self, quiz_ids: Sequence[str]) -> List[dict]:
+        """Question texts and options, in exam order, without answers; one query."""
+        found = {q['id']: q for q in await self.db.quizzes.find(
+            {"id": {"$in": list(quiz_ids)}}, QUESTION_PROJECTION
+        ).to_list(len(quiz_ids))}
+        return [found[quiz_id] for quiz_id in quiz_ids if quiz_id in found]
+
+    async def begin(self, student_id: str, subject: dict,
+                    n: int = EXAM_QUESTIONS) -> Optional[Tuple[ExamSession, List[dict]]]:
+        """A new exam and its questions, or None when the subject has no questions."""
+        running = await self.active_for(student_id)
+        if running is not None:
+            if running.deadline + SUBMIT_GRACE_SECONDS > time.time():
+                raise ExamInProgress(running.id)
+            try:
+                await self.finish(running)
+            except ExamClosed:
+                pass
+
+        await self.selector.ensure_pools()
+        index = self.selector.view
+        # Read the answer keys before awaiting, while positions match the pools
+        positions = self.assemble(subject['id'], n)
+        quiz_ids = tuple(index.ids[p] for p in positions)
+        key = array('B', (index.correct[p] for p in positions))
+        points = array('B', (DIFFICULTY_POINTS[index.difficulty[p]] for p in positions))
+
+        questions = await self.questions(quiz_ids)
+        if len(questions) < len(quiz_ids):
+            # Deleted since the index was loaded
+            present = {q['id'] for q in questions}
+            keep = [i for i, quiz_id in enumerate(quiz_ids) if quiz_id in present]
+            quiz_ids = tuple(quiz_ids[i] for i in keep)
+            key = array('B', (key[i] for i in keep))
+            points = array('B', (points[i] for i in keep))
+        if not quiz_ids:
+            return None
+
+        now = time.time()
+        session = ExamSession(
+            str(uuid.uuid4()), student_id, subject['id'], quiz_ids, key, points,
+            bytearray([UNANSWERED]) * len(quiz_ids), now, now + len(quiz_ids) * SECONDS_PER_QUESTION,
+            subject.get('maxScore', 800)
+        )
+        await self.db[COLLECTION].insert_one(session.to_doc())
+        self._add(session)
+        return session, questions
+
+    def answer(self, session: ExamSession, question: int, answer: Optional[int]):
+        if session.result is not None or session.id in self._finishing or time.time() > session.deadline + SUBMIT_GRACE_SECONDS:
+            raise ExamClosed()
+        session.set_answer(question, answer)
+        self._dirty.setdefault(session.id, set()).add(question)
+
+    async def submit(self, session: ExamSession, answers: Optional[Sequence[Optional[int]]] = None) -> dict:
+        if session.result is not None or session.id in self._finishing:
+            raise ExamClosed()
+        if answers is not None and time.time() <= session.deadline + SUBMIT_GRACE_SECONDS:
+            session.set_answers(answers)
+            self._dirty[session.id] = set(range(len(session.answers)))
+        return await self.finish(session)
+
+    async def finish(self, session: ExamSession) -> dict:
+        # Marked before awaiting, so a concurrent submit or answer is refused
+        if session.id in self._finishing:
+            raise ExamClosed()
+        self._finishing.add(session.id)
+        try:
+            pending = set(self._dirty.get(session.id, ()))
+            answers = session.answer_list()
+            # Closing and writing this worker's pending answers is one atomic step. The document as it
+            # was holds the answers checkpointed by other workers with the same session open
+            closed = await self.db[COLLECTION].find_one_and_update(
+                {"id": session.id, "status": "active"},
+                {"$set": {
+                    **{f"answers.{i}": answers[i] for i in pending},
+                    "status": "submitted",
+                    "submittedAt": datetime.now(timezone.utc),
+                }},
+                projection={"_id": 0, "answers": 1},
+                return_document=ReturnDocument.BEFORE
+            )
+            # Forgotten only once closed: if the write fails, the pending answers stay for a retry or checkpoint
+            self._forget(session)
+            if closed is None:
+                # Submitted on another worker
+                raise ExamClosed()
+            session.answers = stored_answers(closed['answers'])
+            for i in pending:
+                session.set_answer(i, answers[i])
+            graded = session.grade()
+            session.result = summary(graded)
+        finally:
+            self._finishing.discard(session.id)
+        await self.db[COLLECTION].update_one({"id": session.id}, {"$set": {"result": session.result}})
+        return graded
+
+    # ---- background ----
+
+    async def checkpoint(self):
+        """Write every answer changed since the last checkpoint, in one bulk write.
+
+        Only the changed positions are set, so a worker never overwrites
+        answers another worker recorded for the same session.
+        """
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        now = datetime.now(timezone.utc)
+        operations = []
+        for session_id, positions in dirty.items():
+            session = self.sessions.get(session_id)
+            if session is None:
+                continue
+            answers = session.answer_list()
+            operations.append(UpdateOne(
+                {"id": session_id, "status": "active"},
+                {"$set": {**{f"answers.{i}": answers[i] for i in positions}, "checkpointedAt": now}}
+            ))
+        if not operations:
+            return
+        try:
+            await self.db[COLLECTION].bulk_write(operations, ordered=False)
+        except Exception:
+            for session_id, positions in dirty.items():
+                self._dirty.setdefault(session_id, set()).update(positions)
+            raise
+
+    async def close_expired(self, limit: int = 500):
+        """Grade sessions whose time is up, with the answers they have."""
+        cutoff = time.time() - SUBMIT_GRACE_SECONDS
+        for session in [s for s in self.sessions.values() if s.deadline < cutoff]:
+            try:
+                await self.finish(session)
+            except ExamClosed:
+                pass
+
+        # Left behind by a worker that stopped; give a live one a few intervals to finish its own
+        orphaned = from_timestamp(cutoff - 4 * self.checkpoint_interval)
+        cursor = self.db[COLLECTION].find({"status": "active", "deadline": {"$lt": orphaned}}, {"_id": 0})
+        for doc in await cursor.limit(limit).to_list(limit):
+            try:
+                await self.finish(ExamSession.from_doc(doc))
+            except ExamClosed:
+                pass
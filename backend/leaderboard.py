@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, List, Optional
+
+from analytics import ROLLUPS
+from background import SingleFlight
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_SIZE = 50
+
+
+def week_start(now: Optional[datetime] = None) -> datetime:
+    # Weekly boards reset on Monday 00:00 UTC
+    now = now or datetime.now(timezone.utc)
+    start = now - timedelta(days=now.weekday())
+    return start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class Board:
+    """One materialised leaderboard: the serialised top rows plus every student's rank."""
+
+    __slots__ = ("rows", "ranks")
+
+    def __init__(self, rows: bytes, ranks: Dict[str, int]):
+        self.rows = rows
+        self.ranks = ranks
+
+    def render(self, student_id: str) -> bytes:
+        rank = self.ranks.get(student_id)
+        return b'{"leaderboard":' + self.rows + b',"myRank":' + (str(rank).encode() if rank else b'null') + b'}'
+
+
+EMPTY_BOARD = Board(b'[]', {})
+
+
+class LeaderboardSnapshots:
+    """Keeps the global, per-grade, per-subject and weekly leaderboards in memory.
+
+    Boards are rebuilt by a background task every ``refresh_interval`` seconds, or
+    sooner after ``mark_dirty`` is called when XP changes, but never more than
+    once per ``min_interval`` (default ``refresh_interval``): every rebuild reads
+    all students, so under steady traffic XP changes are batched into the next
+    one rather than each triggering its own. Subject and weekly XP
+    are kept as in-memory counters fed by ``record_attempt`` and reconciled from
+    the analytics rollups every ``reconcile_interval`` seconds.
+    """
+
+    def __init__(self, db, refresh_interval: float = 5.0, min_interval: Optional[float] = None,
+                 reconcile_interval: float = 300.0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.min_interval = refresh_interval if min_interval is None else min_interval
+        self.reconcile_interval = reconcile_interval
+
+        self.boards: Dict[str, Board] = {}
+        self.subject_ids: Dict[str, str] = {}  # subject name -> id
+        self.subject_xp: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.week_xp: Dict[str, int] = defaultdict(int)
+        self.week_of = week_start()
+
+        self._dirty = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_reconcile: Optional[float] = None
+        # One rebuild at a time, shared by the background task and the first requests
+        self._update = SingleFlight(self._rebuild, "Leaderboard refresh")
+        # (student, subject, xp) recorded while a reconcile is reading the rollups
+        self._reconciling: Optional[List[tuple]] = None
+
+        # Called after every rebuild, e.g. to push rank changes to live clients
+        self.on_refresh: Optional[Callable[[], None]] = None
+
+    # ---- lifecycle ----
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await self._update.start()
+
+            # XP changes until then wait for the next rebuild
+            await asyncio.sleep(max(0.0, started + self.min_interval - time.monotonic()))
+            try:
+                await asyncio.wait_for(
+                    self._dirty.wait(), timeout=max(0.0, started + self.refresh_interval - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    # ---- change events ----
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def request_reconcile(self):
+        # Quizzes or subjects changed, recount subject XP on the next rebuild
+        self._last_reconcile = None
+        self.mark_dirty()
+
+    def record_attempt(self, student_id: str, subject_id: str, xp_earned: int):
+        if xp_earned <= 0:
+            return
+        self._roll_week()
+        self.subject_xp[subject_id][student_id] += xp_earned
+        self.week_xp[student_id] += xp_earned
+        if self._reconciling is not None:
+            self._reconciling.append((student_id, subject_id, xp_earned))
+        self.mark_dirty()
+
+    def _roll_week(self):
+        current = week_start()
+        if current != self.week_of:
+            self.week_of = current
+            self.week_xp = defaultdict(int)
+
+    # ---- reads ----
+
+    def subject_key(self, subject_name: str) -> Optional[str]:
+        subject_id = self.subject_ids.get(subject_name)
+        return f"subject:{subject_id}" if subject_id else None
+
+    async def ensure_ready(self):
+        # Serve the very first request even if the background task hasn't run yet.
+        # Concurrent first requests share one rebuild; a cancelled request leaves it running
+        if not self._ready.is_set():
+            await asyncio.shield(self._update.start())
+
+    def render(self, key: str, student_id: str) -> bytes:
+        return self.boards.get(key, EMPTY_BOARD).render(student_id)
+
+    # ---- rebuilds ----
+
+    async def _rebuild(self):
+        if self._last_reconcile is None or time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+            await self.reconcile()
+        await self.refresh()
+
+    async def reconcile(self):
+        # Rollups outlive archived attempts and are far smaller than the raw history
+        self._reconciling = []
+        try:
+            subject_xp, week_of, week_xp = await self._count_rollups()
+            # Attempts recorded meanwhile went to the counters being replaced
+            for student_id, subject_id, xp in self._reconciling:
+                subject_xp[subject_id][student_id] += xp
+                week_xp[student_id] += xp
+        finally:
+            self._reconciling = None
+
+        self.subject_xp = subject_xp
+        self.week_xp = week_xp
+        self.week_of = week_of
+        self._last_reconcile = time.monotonic()
+
+    async def _count_rollups(self):
+        subject_xp = defaultdict(lambda: defaultdict(int))
+        async for row in self.db[ROLLUPS].aggregate([
+            {"$match": {"xp": {"$gt": 0}}},
+            {"$group": {"_id": {"studentId": "$studentId", "subjectId": "$subjectId"}, "xp": {"$sum": "$xp"}}}
+        ]):
+            subject_xp[row['_id']['subjectId']][row['_id']['studentId']] = row['xp']
+
+        week_of = week_start()
+        week_xp = defaultdict(int)
+        async for row in self.db[ROLLUPS].aggregate([
+            {"$match": {"xp": {"$gt": 0}, "date": {"$gte": week_of.strftime("%Y-%m-%d")}}},
+            {"$group": {"_id": "$studentId", "xp": {"$sum": "$xp"}}}
+        ]):
+            week_xp[row['_id']] = row['xp']
+        return subject_xp, week_of, week_xp
+
+    async def refresh(self):
+        self._dirty.clear()
+        self._roll_week()
+
+        subjects = await self.db.exam_subjects.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(100)
+        students = await self.db.students.find(
+            {},
+            {"_id": 0, "id": 1, "username": 1, "xp": 1, "level": 1, "grade": 1}
+        ).to_list(None)
+        by_id = {s['id']: s for s in students}
+
+        boards = {"global": self._build(students, lambda s: s.get('xp', 0))}
+        for grade in (11, 12):
+            boards[f"grade:{grade}"] = self._build(
+                [s for s in students if s.get('grade') == grade],
+                lambda s: s.get('xp', 0)
+            )
+        for subject_id, totals in self.subject_xp.items():
+            boards[f"subject:{subject_id}"] = self._build(
+                [by_id[sid] for sid in totals if sid in by_id],
+                lambda s, totals=totals: totals[s['id']]
+            )
+        week_xp = self.week_xp
+        boards["week"] = self._build(
+            [by_id[sid] for sid in week_xp if sid in by_id],
+            lambda s: week_xp[s['id']]
+        )
+
+        self.subject_ids = {s['name']: s['id'] for s in subjects}
+        self.boards = boards
+        self._ready.set()
+        if self.on_refresh:
+            self.on_refresh()
+
+    @staticmethod
+    def _build(students: List[dict], score) -> Board:
+        # Ties in id order, so equal scores keep their places between rebuilds
+        ranked = sorted(students, key=lambda s: (-score(s), s['id']))
+        rows = [
+            {
+                "id": s['id'],
+                "username": s.get('username'),
+                "xp": score(s),
+                "level": s.get('level', 1),
+                "rank": idx + 1
+            }
+            for idx, s in enumerate(ranked[:LEADERBOARD_SIZE])
+        ]
+        ranks = {s['id']: idx + 1 for idx, s in enumerate(ranked)}
+        return Board(dumps(rows), ranks)
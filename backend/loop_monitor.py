@@ -0,0 +1,126 @@
+"""Event-loop lag monitor and blocking-call detector.
+
+A timer task fires every ``interval`` seconds and records how late it ran;
+the samples give lag percentiles and a smoothed current lag (used by
+admission control). With ``block_threshold`` set (LOOP_MONITOR_DEBUG=1), a
+watchdog thread notices when that timer has not run for longer than the
+threshold and captures the loop thread's stack while it is still blocked,
+which points straight at the sync call (bcrypt, file I/O, ...) responsible.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_DEBUG = os.environ.get('LOOP_MONITOR_DEBUG', '').lower() in ('1', 'true', 'yes')
+LOOP_BLOCK_THRESHOLD_MS = float(os.environ.get('LOOP_BLOCK_THRESHOLD_MS', '100'))
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.05, samples: int = 1200, alpha: float = 0.3,
+                 block_threshold: Optional[float] = None, keep_blocks: int = 20):
+        self.interval = interval
+        self.alpha = alpha
+        self.block_threshold = block_threshold
+        self.lag = 0.0
+        self._samples = array('d', [0.0] * samples)
+        self._count = 0
+        self.blocked = 0
+        self.blocks = deque(maxlen=keep_blocks)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+        if self.block_threshold:
+            self._stopping.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog:
+            self._stopping.set()
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, loop.time() - scheduled))
+
+    def _record(self, late: float):
+        self._samples[self._count % len(self._samples)] = late
+        self._count += 1
+        self.lag += self.alpha * (late - self.lag)
+        # The block the watchdog reported has ended; now its full length is known
+        if self._reported_beat == self._heartbeat and self.blocks:
+            self.blocks[-1]['durationMs'] = round(late * 1000, 1)
+        self._heartbeat = time.monotonic()
+
+    def _watch(self):
+        while not self._stopping.wait(self.block_threshold / 4):
+            beat = self._heartbeat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.block_threshold or self._reported_beat == beat:
+                continue
+            self._reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            self.blocked += 1
+            self.blocks.append({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "durationMs": round(stalled * 1000, 1),
+                "stack": [line.rstrip() for line in stack[-10:]]
+            })
+            logger.warning("Event loop blocked for over %.0f ms at:\n%s", stalled * 1000, "".join(stack[-10:]))
+
+    def snapshot(self) -> dict:
+        n = min(self._count, len(self._samples))
+        ordered = sorted(self._samples[:n])
+        out = {
+            "lagMs": {
+                "current": round(self.lag * 1000, 2),
+                "p50": round(percentile(ordered, 0.50) * 1000, 2),
+                "p90": round(percentile(ordered, 0.90) * 1000, 2),
+                "p99": round(percentile(ordered, 0.99) * 1000, 2),
+                "max": round(ordered[-1] * 1000, 2) if ordered else 0.0
+            },
+            "samples": n
+        }
+        if self.block_threshold:
+            out["blockThresholdMs"] = self.block_threshold * 1000
+            out["blocked"] = self.blocked
+            out["recentBlocks"] = list(self.blocks)
+        return out
+
+
+def loop_monitor_from_env() -> LoopMonitor:
+    return LoopMonitor(block_threshold=LOOP_BLOCK_THRESHOLD_MS / 1000 if LOOP_MONITOR_DEBUG else None)
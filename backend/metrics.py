@@ -0,0 +1,16 @@
+"""Per-worker metrics served at /api/metrics.
+
+Components register a section with a callable returning a JSON-able dict;
+the endpoint collects every section at request time.
+"""
+from typing import Callable, Dict
+
+_sections: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, collect: Callable[[], dict]):
+    _sections[name] = collect
+
+
+def snapshot() -> dict:
+    return {name: collect() for name, collect in _sections.items()}
@@ -0,0 +1,282 @@
+"""Bulk student provisioning from CSV or JSONL.
+
+Rows need email, username, password and grade (CSV with a header row).
+Rows are validated in one pass over the file, passwords are hashed in a
+process pool across all cores (started once and kept for the life of the
+process), and accounts are inserted with unordered ``insert_many`` so one bad
+row never blocks the rest. Every rejected row is reported with its row number
+and reason.
+
+Imports through the API run as jobs in the background: ``start_job`` records
+the job in ``provisioning_jobs`` and returns at once, and the report is stored
+on the job when it finishes, so any worker can answer a status request.
+
+Hashing dominates: a bcrypt hash at the interactive cost (12) takes ~300 ms of
+CPU, i.e. close to an hour of CPU for 10k students. That is the default. A
+lower PROVISION_BCRYPT_ROUNDS (e.g. 8, ~20 ms) is an explicit opt-in that
+leaves weaker hashes in the database until login upgrades each one to the
+full cost the first time its student signs in.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+from bulk_io import format_from, write_error_message
+
+# Same as server.BCRYPT_ROUNDS unless lowered on purpose
+PROVISION_BCRYPT_ROUNDS = int(os.environ.get('PROVISION_BCRYPT_ROUNDS', '12'))
+PROVISION_WORKERS = int(os.environ.get('PROVISION_WORKERS', '0')) or os.cpu_count() or 1
+
+VALID_GRADES = (11, 12)
+FIELDS = ("email", "username", "password", "grade")
+INSERT_BATCH = 1000
+HASH_CHUNK = 64
+JOBS = "provisioning_jobs"
+
+logger = logging.getLogger(__name__)
+
+hash_pool: Optional[ProcessPoolExecutor] = None
+running_jobs: Set[asyncio.Task] = set()
+
+
+def parse(data: bytes, fmt: str) -> List[dict]:
+    text = data.decode('utf-8-sig')
+    if fmt == "csv":
+        return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+    if fmt in ("jsonl", "ndjson"):
+        rows = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            rows.append(row if isinstance(row, dict) else {"_invalid": "Not a JSON object"})
+        return rows
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+def hash_passwords(passwords: List[str], rounds: int) -> List[str]:
+    # Runs in the worker processes
+    import bcrypt
+    return [bcrypt.hashpw(p.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8') for p in passwords]
+
+
+def validate(rows: List[dict]) -> tuple:
+    """Return (indexes of valid rows, {row index: error}); emails and grades are normalised in place."""
+    from pydantic import EmailStr, TypeAdapter, ValidationError
+
+    errors: Dict[int, str] = {}
+    for i, row in enumerate(rows):
+        if "_invalid" in row:
+            errors[i] = row["_invalid"]
+            continue
+        missing = [f for f in FIELDS if not str(row.get(f) or "").strip()]
+        if missing:
+            errors[i] = f"Missing {', '.join(missing)}"
+            continue
+        try:
+            grade = int(str(row["grade"]).strip())
+        except ValueError:
+            grade = None
+        if grade not in VALID_GRADES:
+            errors[i] = "Grade must be 11 or 12"
+            continue
+        row["grade"] = grade
+
+    email_adapter = TypeAdapter(EmailStr)
+    seen_usernames, seen_emails = {}, {}
+    for i, row in enumerate(rows):
+        if i in errors:
+            continue
+        try:
+            row["email"] = email_adapter.validate_python(str(row["email"]).strip())
+        except ValidationError:
+            errors[i] = "Invalid email"
+            continue
+        row["username"] = str(row["username"]).strip()
+        # Against the database the unique indexes decide; inside the file, the first row wins
+        for key, seen, field in ((row["username"], seen_usernames, "Username"), (row["email"], seen_emails, "Email")):
+            if key in seen:
+                errors[i] = f"{field} duplicates row {seen[key] + 1}"
+                break
+        else:
+            seen_usernames[row["username"]] = i
+            seen_emails[row["email"]] = i
+
+    return [i for i in range(len(rows)) if i not in errors], errors
+
+
+def get_hash_pool(workers: int = PROVISION_WORKERS) -> ProcessPoolExecutor:
+    # Spawning the workers costs about a second, so the pool outlives each import
+    global hash_pool
+    if hash_pool is None:
+        # spawn: forking a process that runs driver threads is not safe
+        hash_pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+    return hash_pool
+
+
+def shutdown():
+    global hash_pool
+    for task in list(running_jobs):
+        task.cancel()
+    if hash_pool is not None:
+        hash_pool.shutdown(wait=False, cancel_futures=True)
+        hash_pool = None
+
+
+async def hash_all(passwords: List[str], rounds: int) -> List[str]:
+    loop = asyncio.get_running_loop()
+    pool = get_hash_pool()
+    chunks = [passwords[i:i + HASH_CHUNK] for i in range(0, len(passwords), HASH_CHUNK)]
+    results = await asyncio.gather(*(loop.run_in_executor(pool, hash_passwords, chunk, rounds) for chunk in chunks))
+    return [h for chunk in results for h in chunk]
+
+
+def student_document(row: dict, password_hash: str, now: datetime) -> dict:
+    # Same shape as server.Student, with timestamps already in storage form
+    return {
+        "id": str(uuid.uuid4()),
+        "email": row["email"],
+        "username": row["username"],
+        "passwordHash": password_hash,
+        "grade": row["grade"],
+        "mbtiType": None,
+        "xp": 0,
+        "level": 1,
+        "streak": 0,
+        "lastActive": now,
+        "createdAt": now
+    }
+
+
+async def provision(db, rows: List[dict], rounds: int = PROVISION_BCRYPT_ROUNDS) -> dict:
+    from pymongo.errors import BulkWriteError
+    from repository import duplicate_field
+
+    started = time.perf_counter()
+    valid, errors = validate(rows)
+    validated = time.perf_counter()
+
+    hashes = await hash_all([str(rows[i]["password"]) for i in valid], rounds) if valid else []
+    hashed = time.perf_counter()
+
+    now = datetime.now(timezone.utc)
+    created = 0
+    for start in range(0, len(valid), INSERT_BATCH):
+        batch = valid[start:start + INSERT_BATCH]
+        docs = [student_document(rows[i], hashes[start + n], now) for n, i in enumerate(batch)]
+        try:
+            result = await db.students.insert_many(docs, ordered=False)
+            created += len(result.inserted_ids)
+        except BulkWriteError as e:
+            created += e.details.get("nInserted", 0)
+            for error in e.details.get("writeErrors", []):
+                errors[batch[error["index"]]] = write_error_message(
+                    error, lambda e: f"{duplicate_field(e).capitalize()} already exists"
+                )
+
+    return {
+        "received": len(rows),
+        "created": created,
+        "failed": [
+            {"row": i + 1, "username": rows[i].get("username"), "error": errors[i]}
+            for i in sorted(errors)
+        ],
+        "timings": {
+            "validateMs": round((validated - started) * 1000, 1),
+            "hashMs": round((hashed - validated) * 1000, 1),
+            "insertMs": round((time.perf_counter() - hashed) * 1000, 1)
+        }
+    }
+
+
+async def start_job(db, rows: List[dict], on_done: Optional[Callable[[dict], None]] = None) -> dict:
+    """Record an import job and run it in the background; returns the job as first stored."""
+    job = {
+        "id": str(uuid.uuid4()),
+        "status": "running",
+        "received": len(rows),
+        "createdAt": datetime.now(timezone.utc)
+    }
+    await db[JOBS].insert_one(dict(job))
+    task = asyncio.create_task(run_job(db, job["id"], rows, on_done))
+    running_jobs.add(task)
+    task.add_done_callback(running_jobs.discard)
+    return job
+
+
+async def run_job(db, job_id: str, rows: List[dict], on_done: Optional[Callable[[dict], None]] = None):
+    try:
+        report = await provision(db, rows)
+        update = {"status": "done", "report": report}
+    except Exception:
+        logger.exception("Student import %s failed", job_id)
+        report, update = None, {"status": "failed"}
+    update["finishedAt"] = datetime.now(timezone.utc)
+    await db[JOBS].update_one({"id": job_id}, {"$set": update})
+    if report and on_done:
+        on_done(report)
+
+
+async def get_job(db, job_id: str) -> Optional[dict]:
+    return await db[JOBS].find_one({"id": job_id}, {"_id": 0})
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from cache import publish_invalidation
+    from repository import ensure_student_indexes
+
+    parser = argparse.ArgumentParser(description="Bulk student provisioning")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="create student accounts from a CSV or JSONL file")
+    imp.add_argument("file", type=Path)
+    imp.add_argument("--format", choices=["csv", "jsonl"])
+    imp.add_argument("--errors", type=Path, help="write rejected rows here as JSONL")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    rows = parse(args.file.read_bytes(), format_from(args.file, args.format))
+    # Taken usernames and emails are only caught by the unique indexes
+    missing = await ensure_student_indexes(db)
+    if missing:
+        client.close()
+        raise SystemExit(f"❌ Unique student indexes missing ({', '.join(missing)}); resolve the duplicates first")
+    try:
+        report = await provision(db, rows)
+    finally:
+        shutdown()
+    if report["created"]:
+        # Running workers pick the new students up in their leaderboards
+        await publish_invalidation(db, "student")
+
+    if args.errors:
+        with open(args.errors, "w") as f:
+            f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in report["failed"])
+    else:
+        for e in report["failed"][:20]:
+            print(f"  row {e['row']}: {e['error']}")
+    t = report["timings"]
+    print(f"✅ Created {report['created']} of {report['received']} students, {len(report['failed'])} rejected "
+          f"(validate {t['validateMs']:.0f} ms, hash {t['hashMs']:.0f} ms, insert {t['insertMs']:.0f} ms)")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
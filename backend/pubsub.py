@@ -0,0 +1,312 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Server error code for a change stream opened on a standalone MongoDB
+CHANGE_STREAM_UNSUPPORTED = 40573
+# Longest wait between change stream retries, in seconds
+MAX_RETRY_DELAY = 60
+
+# Events published inside ``PubSub.batch()`` by the current task
+_batch: ContextVar[Optional[List[Tuple[str, dict]]]] = ContextVar("pubsub_batch", default=None)
+
+
+class Subscription:
+    """A subscriber's mailbox. Slow consumers lose their oldest messages instead of blocking publishers."""
+
+    def __init__(self, pubsub: "PubSub", topics, maxsize: int = 100):
+        self.pubsub = pubsub
+        self.topics = set(topics)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def put(self, topic: str, message: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait((topic, message))
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.pubsub.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Default broker: a single worker, so publishing is just local delivery."""
+
+    async def start(self, deliver: Callable[[str, dict], None]):
+        self._deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def publish(self, topic: str, message: dict):
+        self._deliver(topic, message)
+
+    async def publish_many(self, events: List[Tuple[str, dict]]):
+        for topic, message in events:
+            self._deliver(topic, message)
+
+
+class FileBroker:
+    """Stand-in broker for several workers on one host.
+
+    Every worker appends published events to a shared JSONL file and tails it,
+    delivering events written by the other workers to its own subscribers. The
+    file is never truncated, so this is meant for local multi-worker runs and
+    tests rather than long-lived production nodes.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.origin = uuid.uuid4().hex
+        self._fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Callable[[str, dict], None]):
+        self._deliver = deliver
+        self._fd = os.open(self.path, os.O_CREAT | os.O_APPEND | os.O_WRONLY, 0o644)
+        self._task = asyncio.create_task(self._tail(os.path.getsize(self.path)))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    async def publish(self, topic: str, message: dict):
+        await self.publish_many([(topic, message)])
+
+    async def publish_many(self, events: List[Tuple[str, dict]]):
+        lines = []
+        for topic, message in events:
+            self._deliver(topic, message)
+            lines.append(json.dumps({"origin": self.origin, "topic": topic, "message": message}, ensure_ascii=False))
+        # A single O_APPEND write keeps lines from different workers from interleaving
+        os.write(self._fd, "\n".join(lines).encode('utf-8') + b'\n')
+
+    async def _tail(self, offset: int):
+        pending = b''
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                chunk = f.read()
+                if not chunk:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                *lines, pending = (pending + chunk).split(b'\n')
+                for line in lines:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        logger.warning("Skipping malformed pub/sub event")
+                        continue
+                    if event.get('origin') != self.origin:
+                        self._deliver(event['topic'], event['message'])
+
+
+class MongoChangeStreamBroker:
+    """Broker for several workers or nodes sharing one MongoDB replica set.
+
+    Events are inserted into ``pubsub_events`` (expired by a TTL index) and every
+    worker follows that collection with a change stream. On a standalone
+    MongoDB, which has no change streams, it says so once and falls back to
+    local delivery, like the in-process broker.
+    """
+
+    def __init__(self, db, collection: str = 'pubsub_events', ttl_seconds: int = 3600):
+        self.collection = db[collection]
+        self.ttl_seconds = ttl_seconds
+        self.origin = uuid.uuid4().hex
+        self.standalone = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Callable[[str, dict], None]):
+        self._deliver = deliver
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, topic: str, message: dict):
+        await self.publish_many([(topic, message)])
+
+    async def publish_many(self, events: List[Tuple[str, dict]]):
+        # One insert per batch: each published event would otherwise be a write of its own
+        now = datetime.now(timezone.utc)
+        for topic, message in events:
+            self._deliver(topic, message)
+        if self.standalone:
+            # Nobody can follow the collection
+            return
+        await self.collection.insert_many([
+            {"origin": self.origin, "topic": topic, "message": message, "createdAt": now}
+            for topic, message in events
+        ])
+
+    async def _watch(self):
+        resume_token = None
+        delay = 1
+        while True:
+            try:
+                await self.collection.create_index("createdAt", expireAfterSeconds=self.ttl_seconds)
+                async with self.collection.watch(
+                    [{"$match": {"operationType": "insert"}}],
+                    resume_after=resume_token
+                ) as stream:
+                    delay = 1
+                    async for change in stream:
+                        resume_token = change['_id']
+                        event = change['fullDocument']
+                        if event.get('origin') != self.origin:
+                            self._deliver(event['topic'], event['message'])
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAM_UNSUPPORTED:
+                    delay = await self._retry_after(delay)
+                    continue
+                self.standalone = True
+                logger.warning("MongoDB is not a replica set, so the pub/sub broker has no change streams: "
+                               "events only reach this worker. Run MongoDB as a replica set for several workers")
+                return
+            except Exception:
+                delay = await self._retry_after(delay)
+
+    async def _retry_after(self, delay: float) -> float:
+        # The traceback once, then a line per retry, waiting twice as long each time
+        if delay == 1:
+            logger.exception("Change stream broker failed, retrying")
+        else:
+            logger.warning("Change stream broker still failing, retrying in %ss", delay)
+        await asyncio.sleep(delay)
+        return min(delay * 2, MAX_RETRY_DELAY)
+
+
+def broker_from_url(url: Optional[str], db=None):
+    # memory (default) | file:/path/to/events.jsonl | mongo
+    if not url or url == 'memory':
+        return InProcessBroker()
+    if url.startswith('file:'):
+        return FileBroker(url[len('file:'):])
+    if url == 'mongo':
+        return MongoChangeStreamBroker(db)
+    raise ValueError(f"Unknown pub/sub broker: {url}")
+
+
+class PubSub:
+    """Topic-based fan-out to in-process subscribers (e.g. WebSocket connections).
+
+    ``publish`` goes through the broker so that subscribers on every worker see
+    the event; ``publish_local`` only reaches this worker, for events that each
+    worker derives on its own (such as leaderboard refreshes). ``listen``
+    registers a plain callback, for in-process consumers such as caches.
+    Events published inside ``batch()`` are held until it completes and then
+    handed to the broker together (one write for the Mongo broker). A broker
+    that fails to publish is logged; the request that published goes on.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or InProcessBroker()
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._listeners: Dict[str, List[Callable[[str, dict], None]]] = defaultdict(list)
+        self._started = False
+
+    async def start(self):
+        await self.broker.start(self.publish_local)
+        self._started = True
+
+    async def stop(self):
+        if self._started:
+            self._started = False
+            await self.broker.stop()
+
+    def subscribe(self, *topics: str, maxsize: int = 100) -> Subscription:
+        subscription = Subscription(self, topics, maxsize)
+        for topic in subscription.topics:
+            self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def listen(self, topic: str, callback: Callable[[str, dict], None]):
+        self._listeners[topic].append(callback)
+
+    async def publish(self, topic: str, message: dict):
+        pending = _batch.get()
+        if pending is not None:
+            pending.append((topic, message))
+            return
+        if not self._started:
+            # Before startup (scripts, tests) there is no broker to fan out through
+            self.publish_local(topic, message)
+            return
+        await self._send([(topic, message)])
+
+    @asynccontextmanager
+    async def batch(self):
+        """Collect this task's publishes and send them when the block completes.
+
+        If the block raises, its events are dropped with it.
+        """
+        if _batch.get() is not None:
+            yield
+            return
+        pending: List[Tuple[str, dict]] = []
+        token = _batch.set(pending)
+        try:
+            yield
+        finally:
+            _batch.reset(token)
+        if pending:
+            if self._started:
+                await self._send(pending)
+            else:
+                for topic, message in pending:
+                    self.publish_local(topic, message)
+
+    async def _send(self, events: List[Tuple[str, dict]]):
+        # The data is written by now: a broker failure costs other workers the events, not the request
+        try:
+            await self.broker.publish_many(events)
+        except Exception:
+            logger.exception("Pub/sub broker failed to publish %d events", len(events))
+
+    def publish_local(self, topic: str, message: dict):
+        for callback in self._listeners.get(topic, ()):
+            try:
+                callback(topic, message)
+            except Exception:
+                logger.exception("Pub/sub listener failed for %s", topic)
+        for subscription in tuple(self._subscribers.get(topic, ())):
+            subscription.put(topic, message)
@@ -0,0 +1,309 @@
+"""Streaming import and export of the quiz bank as JSONL or CSV.
+
+Input is consumed a chunk at a time and written in batches of ``BATCH_SIZE``
+with unordered ``bulk_write``, so memory stays flat however large the file.
+Rows are validated against the ``Quiz`` model; ``options`` and ``tags`` are
+JSON arrays or, in CSV, ``|``-separated lists. Rows with an ``id`` update that
+quiz; rows without one are deduplicated on a hash of their content (subject,
+question, options, answer), stored as ``contentHash`` under a unique index, so
+re-importing a bank is a no-op. Exports iterate a cursor and stream lines.
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from bulk_io import format_from, write_error_message
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 1000
+
+EXPORT_FIELDS = ("id", "subjectId", "question", "options", "correctAnswer", "difficulty", "xp", "tags")
+LIST_FIELDS = ("options", "tags")
+EXPORT_PROJECTION = {"_id": 0, **{f: 1 for f in EXPORT_FIELDS}}
+MEDIA_TYPES = {"jsonl": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def content_hash(quiz: dict) -> str:
+    # Case and whitespace differences don't make a new question
+    normalise = lambda text: " ".join(str(text).split()).casefold()
+    key = [quiz["subjectId"], normalise(quiz["question"]), [normalise(o) for o in quiz["options"]], quiz["correctAnswer"]]
+    return hashlib.sha1(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def ensure_quiz_bank_indexes(db):
+    await db.quizzes.create_index(
+        "contentHash", unique=True, partialFilterExpression={"contentHash": {"$exists": True}}
+    )
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def iter_rows(lines: AsyncIterable[str], fmt: str) -> AsyncIterator[Tuple[int, dict]]:
+    """(row number, raw row) for each record; CSV records may span lines inside quotes."""
+    if fmt not in ("csv", "jsonl", "ndjson"):
+        raise ValueError(f"Unknown format: {fmt}")
+    header: Optional[List[str]] = None
+    record = ""
+    row_number = 0
+    async for line in lines:
+        if fmt != "csv":
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row_number, row if isinstance(row, dict) else {"_invalid": "Not a JSON object"}
+            continue
+
+        record += line + "\n"
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader(io.StringIO(record)), [])
+        record = ""
+        if not any(v.strip() for v in values):
+            continue
+        if header is None:
+            header = [v.strip() for v in values]
+            continue
+        row_number += 1
+        yield row_number, dict(zip(header, values))
+
+
+def normalise_row(row: dict) -> dict:
+    lists = {}
+    for field in LIST_FIELDS:
+        value = row.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+            if value.startswith("["):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            else:
+                value = [v.strip() for v in value.split("|") if v.strip()]
+        if value is not None:
+            lists[field] = value
+    row = {k: v for k, v in row.items() if v not in ("", None)}
+    row.update(lists)
+    return row
+
+
+def validation_message(error) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+class ImportReport:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self.started = time.perf_counter()
+
+    def reject(self, row_number: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": error})
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "errors": self.errors,
+            "elapsedMs": round((time.perf_counter() - self.started) * 1000, 1)
+        }
+
+
+async def import_quizzes(db, rows: AsyncIterable[Tuple[int, dict]], model,
+                         batch_size: int = BATCH_SIZE,
+                         progress: Optional[Callable[[dict], None]] = None) -> dict:
+    from pydantic import ValidationError
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    subjects = {s["id"] async for s in db.exam_subjects.find({}, {"_id": 0, "id": 1})}
+    report = ImportReport()
+    batch: List[UpdateOne] = []
+    batch_rows: List[int] = []
+    batch_keys: Dict[str, int] = {}
+
+    async def flush():
+        try:
+            result = (await db.quizzes.bulk_write(batch, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+            for error in result.get("writeErrors", []):
+                message = write_error_message(error, lambda _: "Same question as an existing quiz")
+                report.reject(batch_rows[error["index"]], message)
+        upserted = result.get("nUpserted", 0)
+        report.inserted += upserted
+        report.updated += result.get("nModified", 0)
+        report.unchanged += result.get("nMatched", 0) - result.get("nModified", 0)
+        batch.clear()
+        batch_rows.clear()
+        batch_keys.clear()
+        if progress:
+            progress(report.as_dict())
+
+    async for row_number, row in rows:
+        report.received += 1
+        if "_invalid" in row:
+            report.reject(row_number, row["_invalid"])
+            continue
+        try:
+            quiz = model.model_validate(normalise_row(row))
+        except ValidationError as e:
+            report.reject(row_number, validation_message(e))
+            continue
+        if quiz.subjectId not in subjects:
+            report.reject(row_number, f"Unknown subjectId {quiz.subjectId}")
+            continue
+
+        fields = quiz.model_dump(exclude={"id"})
+        fields["contentHash"] = content_hash(fields)
+        # The same quiz twice in one batch would race its own upsert
+        key = row["id"] if row.get("id") else fields["contentHash"]
+        if key in batch_keys:
+            report.reject(row_number, f"Duplicate of row {batch_keys[key]}")
+            continue
+        batch_keys[key] = row_number
+
+        if row.get("id"):
+            batch.append(UpdateOne({"id": quiz.id}, {"$set": fields}, upsert=True))
+        else:
+            batch.append(UpdateOne(
+                {"contentHash": fields["contentHash"]},
+                {"$set": fields, "$setOnInsert": {"id": str(uuid.uuid4())}},
+                upsert=True
+            ))
+        batch_rows.append(row_number)
+        if len(batch) >= batch_size:
+            await flush()
+
+    if batch:
+        await flush()
+    return report.as_dict()
+
+
+async def export_quizzes(db, fmt: str, subject_id: Optional[str] = None,
+                         progress: Optional[Callable[[int], None]] = None) -> AsyncIterator[bytes]:
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unknown format: {fmt}")
+    query = {"subjectId": subject_id} if subject_id else {}
+    cursor = db.quizzes.find(query, EXPORT_PROJECTION).batch_size(BATCH_SIZE)
+
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if fmt == "csv":
+        writer.writerow(EXPORT_FIELDS)
+    exported = 0
+    async for quiz in cursor:
+        if fmt == "csv":
+            writer.writerow([
+                json.dumps(quiz.get(f, []), ensure_ascii=False) if f in LIST_FIELDS else quiz.get(f)
+                for f in EXPORT_FIELDS
+            ])
+        else:
+            out.write(json.dumps({f: quiz.get(f, [] if f in LIST_FIELDS else None) for f in EXPORT_FIELDS},
+                                 ensure_ascii=False) + "\n")
+        exported += 1
+        # One chunk per cursor batch keeps writes few and memory bounded
+        if exported % BATCH_SIZE == 0:
+            yield out.getvalue().encode("utf-8")
+            out.seek(0)
+            out.truncate()
+            if progress:
+                progress(exported)
+    if out.tell():
+        yield out.getvalue().encode("utf-8")
+    if progress:
+        progress(exported)
+
+
+async def file_chunks(path: Path) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from cache import publish_invalidation
+
+    parser = argparse.ArgumentParser(description="Quiz bank import/export")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="add or update quizzes from a JSONL or CSV file")
+    imp.add_argument("file", type=Path)
+    imp.add_argument("--format", choices=["csv", "jsonl"])
+    imp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    exp = sub.add_parser("export", help="write the quiz bank as JSONL or CSV")
+    exp.add_argument("file", type=Path)
+    exp.add_argument("--format", choices=["csv", "jsonl"])
+    exp.add_argument("--subject", help="only this subjectId")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    fmt = format_from(args.file, args.format)
+
+    if args.command == "import":
+        from server import Quiz
+
+        await ensure_quiz_bank_indexes(db)
+        rows = iter_rows(iter_lines(file_chunks(args.file)), fmt)
+        report = await import_quizzes(
+            db, rows, Quiz, args.batch_size,
+            progress=lambda r: print(f"\r  {r['received']} rows, {r['inserted']} new, {r['updated']} updated, "
+                                     f"{r['failed']} rejected", end="", flush=True)
+        )
+        print()
+        if report["inserted"] or report["updated"]:
+            # Running workers drop cached catalogs and reload their answer keys
+            await publish_invalidation(db, "catalog")
+        for e in report["errors"][:20]:
+            print(f"  row {e['row']}: {e['error']}")
+        print(f"✅ Imported {report['received']} rows: {report['inserted']} new, {report['updated']} updated, "
+              f"{report['unchanged']} unchanged, {report['failed']} rejected ({report['elapsedMs'] / 1000:.1f} s)")
+    else:
+        with open(args.file, "wb") as f:
+            async for chunk in export_quizzes(db, fmt, args.subject,
+                                              progress=lambda n: print(f"\r  {n} quizzes", end="", flush=True)):
+                f.write(chunk)
+        print(f"\n✅ Exported to {args.file}")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+import asyncio
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+from background import SingleFlight
+
+DIFFICULTIES = ("easy", "medium", "hard")
+NO_DIFFICULTY = 255
+
+
+class QuizIndexBuilder:
+    def __init__(self):
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.subjects: List[str] = []
+        self.subject_positions: Dict[str, int] = {}
+        self.subject = array('H')
+        self.difficulty = array('B')
+        self.correct = array('B')
+        self.xp = array('I')
+
+    def add(self, quiz: dict):
+        if quiz['id'] in self.positions:
+            return
+        subject = self.subject_positions.get(quiz['subjectId'])
+        if subject is None:
+            subject = self.subject_positions[quiz['subjectId']] = len(self.subjects)
+            self.subjects.append(quiz['subjectId'])
+        difficulty = quiz.get('difficulty')
+        self.positions[quiz['id']] = len(self.ids)
+        self.ids.append(quiz['id'])
+        self.subject.append(subject)
+        self.difficulty.append(DIFFICULTIES.index(difficulty) if difficulty in DIFFICULTIES else NO_DIFFICULTY)
+        self.correct.append(quiz['correctAnswer'])
+        self.xp.append(quiz['xp'])
+
+    def subject_of(self, position: int) -> str:
+        return self.subjects[self.subject[position]]
+
+
+class QuizIndex:
+    """Answer keys and selection fields of every quiz, held in memory.
+
+    Quiz ids are interned to positions; per position, packed arrays hold the
+    correct option, XP reward, subject (itself interned) and difficulty, so
+    grading needs no database read. ``invalidate`` (on catalog changes) starts
+    a reload in the background; until it is swapped in the current arrays keep
+    answering (quizzes added meanwhile are looked up directly by callers).
+    ``version`` tells dependants such as the quiz selector that positions have
+    changed, and ``snapshot`` is the builder behind the current arrays, which
+    is never modified once swapped in. Callbacks in ``on_reload`` run after
+    each swap, so dependants can rebuild right away.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.version = 0
+        self.loaded = False
+        self.on_reload: List[Callable[[], None]] = []
+        self._stale = True
+        self._lock = asyncio.Lock()
+        self._reload = SingleFlight(self._reload_if_stale, "Quiz index reload")
+        self._swap(QuizIndexBuilder())
+
+    def _swap(self, built: QuizIndexBuilder):
+        # No awaits in here, so readers never see a half-replaced index
+        self.snapshot = built
+        self.ids = built.ids
+        self.positions = built.positions
+        self.subjects = built.subjects
+        self.subject = built.subject
+        self.difficulty = built.difficulty
+        self.correct = built.correct
+        self.xp = built.xp
+        self.version += 1
+
+    def invalidate(self):
+        self._stale = True
+        # Before the first load there is nothing to refresh: first use loads it
+        if self.loaded:
+            self._reload.start()
+
+    async def ensure_loaded(self):
+        """Load on first use; afterwards a stale index is reloaded in the background."""
+        if not self._stale:
+            return
+        if self.loaded:
+            self._reload.start()
+            return
+        async with self._lock:
+            if not self.loaded:
+                await self.reload()
+
+    async def _reload_if_stale(self):
+        # A failed reload leaves the index stale, so the next use tries again
+        async with self._lock:
+            if self._stale:
+                await self.reload()
+
+    async def reload(self):
+        # Cleared first: an invalidation arriving mid-load triggers another reload
+        self._stale = False
+        built = QuizIndexBuilder()
+        try:
+            async for quiz in self.db.quizzes.find(
+                {}, {"_id": 0, "id": 1, "subjectId": 1, "difficulty": 1, "correctAnswer": 1, "xp": 1}
+            ):
+                built.add(quiz)
+        except Exception:
+            self._stale = True
+            raise
+        self._swap(built)
+        self.loaded = True
+        for callback in self.on_reload:
+            callback()
+
+    def subject_of(self, position: int) -> str:
+        return self.subjects[self.subject[position]]
+
+    async def answer_key(self, quiz_id: str) -> Optional[Tuple[int, int, str]]:
+        """(correctAnswer, xp, subjectId), or None for a quiz added since the last load."""
+        await self.ensure_loaded()
+        position = self.positions.get(quiz_id)
+        if position is None:
+            return None
+        return self.correct[position], self.xp[position], self.subjects[self.subject[position]]
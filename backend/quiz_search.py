@@ -0,0 +1,263 @@
+"""Keyword, tag and filter search over the quiz bank.
+
+An inverted index over question text, options and tags, keyed by the
+positions of the shared ``QuizIndex`` so subject and difficulty filters read
+its arrays directly. Postings are numpy arrays with BM25 weights computed at
+build time, so a query is a few vectorised adds plus a partial sort. The
+index is rebuilt in the background whenever the QuizIndex reloads (catalog
+invalidations, e.g. after a quiz bank import); the previous one answers until
+the new one is installed.
+
+Rebuilds are incremental. Raw term frequencies are kept per posting, and
+each quiz's text is fingerprinted. Quizzes whose text is unchanged keep
+their postings, remapped to their new positions. Only new and edited
+quizzes are tokenized. BM25 weights depend on the size of the whole bank,
+so they are recomputed for every term, one vectorised pass per term.
+"""
+import asyncio
+import math
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from background import SingleFlight
+from quiz_index import DIFFICULTIES, QuizIndexBuilder
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.casefold())
+
+
+def quiz_tokens(quiz: dict) -> List[str]:
+    return tokenize(" ".join([quiz.get("question", ""), *quiz.get("options", []), *quiz.get("tags", [])]))
+
+
+def fingerprint(quiz: dict) -> int:
+    # Only has to match within this process
+    return hash((quiz.get("question", ""), tuple(quiz.get("options", [])), tuple(quiz.get("tags", []))))
+
+
+class Postings:
+    """Raw postings of an index build, kept so the next build can reuse them.
+
+    ``terms`` maps each term to (positions, term frequencies), ``tags`` each
+    tag to positions, ``lengths`` holds the token count per position, and
+    ``fingerprints`` the text fingerprint per quiz id. ``weighted`` is what
+    queries read: each term's positions with their BM25 weights.
+    """
+
+    def __init__(self, size: int):
+        import numpy as np
+
+        self.terms: Dict[str, tuple] = {}
+        self.tags: Dict[str, object] = {}
+        self.lengths = np.zeros(size, dtype=np.float32)
+        self.fingerprints: Dict[str, int] = {}
+        self.documents = 0
+        self.weighted: Dict[str, tuple] = {}
+
+    @classmethod
+    def build(cls, size: int, docs: Iterable[Tuple[int, List[str], List[str]]],
+              kept: Optional[Tuple["Postings", object]] = None) -> "Postings":
+        """Postings of ``docs`` (position, tokens, tags), plus those of ``kept``.
+
+        ``kept`` is (previous postings, array mapping each previous position to
+        its new one, or -1 for quizzes that were removed or are in ``docs``).
+        """
+        import numpy as np
+
+        built = cls(size)
+        terms = defaultdict(list)
+        tags = defaultdict(list)
+        if kept:
+            previous, remap = kept
+            moved = remap >= 0
+            built.lengths[remap[moved]] = previous.lengths[moved]
+            built.documents = int(moved.sum())
+            for term, (positions, tf) in previous.terms.items():
+                new = remap[positions]
+                keep = new >= 0
+                if keep.any():
+                    terms[term].append((new[keep], tf[keep]))
+            for tag, positions in previous.tags.items():
+                new = remap[positions]
+                new = new[new >= 0]
+                if len(new):
+                    tags[tag].append(new)
+
+        postings = defaultdict(list)
+        tag_postings = defaultdict(list)
+        for position, tokens, quiz_tags in docs:
+            built.lengths[position] = len(tokens)
+            built.documents += 1
+            counts = defaultdict(int)
+            for token in tokens:
+                counts[token] += 1
+            for token, tf in counts.items():
+                postings[token].append((position, tf))
+            for tag in {t.casefold() for t in quiz_tags}:
+                tag_postings[tag].append(position)
+        for token, entries in postings.items():
+            terms[token].append((
+                np.fromiter((p for p, _ in entries), dtype=np.int32, count=len(entries)),
+                np.fromiter((t for _, t in entries), dtype=np.float32, count=len(entries)),
+            ))
+        for tag, positions in tag_postings.items():
+            tags[tag].append(np.array(positions, dtype=np.int32))
+
+        for term, parts in terms.items():
+            built.terms[term] = parts[0] if len(parts) == 1 else (
+                np.concatenate([p for p, _ in parts]), np.concatenate([t for _, t in parts])
+            )
+        built.tags = {tag: parts[0] if len(parts) == 1 else np.concatenate(parts) for tag, parts in tags.items()}
+        built.weighted = built._weigh()
+        return built
+
+    def _weigh(self) -> Dict[str, tuple]:
+        import numpy as np
+
+        n = max(self.documents, 1)
+        avg_length = float(self.lengths.sum()) / n or 1.0
+        terms = {}
+        for token, (positions, tf) in self.terms.items():
+            idf = math.log(1 + (n - len(positions) + 0.5) / (len(positions) + 0.5))
+            length = self.lengths[positions]
+            weights = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+            terms[token] = (positions, weights.astype(np.float32))
+        return terms
+
+
+def build_postings(snapshot: QuizIndexBuilder, docs: List[Tuple[int, dict]],
+                   previous: Optional[Postings] = None, previous_positions: Optional[Dict[str, int]] = None) -> Postings:
+    """Postings for ``docs`` (position in ``snapshot``, quiz), reusing ``previous`` for unchanged quizzes."""
+    import numpy as np
+
+    fingerprints = {quiz['id']: fingerprint(quiz) for _, quiz in docs}
+    fresh = docs
+    kept = None
+    if previous is not None and previous_positions is not None:
+        remap = np.full(len(previous_positions), -1, dtype=np.int32)
+        fresh = []
+        for position, quiz in docs:
+            old = previous_positions.get(quiz['id'])
+            if old is not None and previous.fingerprints.get(quiz['id']) == fingerprints[quiz['id']]:
+                remap[old] = position
+            else:
+                fresh.append((position, quiz))
+        kept = previous, remap
+    built = Postings.build(len(snapshot.ids), ((p, quiz_tokens(q), q.get("tags", [])) for p, q in fresh), kept)
+    built.fingerprints = fingerprints
+    return built
+
+
+class QuizSearch:
+    def __init__(self, index):
+        self.index = index
+        self.version = None
+        self.terms: Dict[str, tuple] = {}
+        self.tags: Dict[str, object] = {}
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.subjects: List[str] = []
+        self.subject = None
+        self.difficulty = None
+        self.postings: Optional[Postings] = None
+        self._lock = asyncio.Lock()
+        self._refresh = SingleFlight(self._rebuild, "Quiz search rebuild")
+        # Rebuilt as soon as the index reloads, once built at all
+        index.on_reload.append(lambda: self._refresh.start() if self.version is not None else None)
+
+    async def ensure_built(self):
+        await self.index.ensure_loaded()
+        if self.version == self.index.version:
+            return
+        if self.version is not None:
+            self._refresh.start()
+            return
+        await self._rebuild()
+
+    async def _rebuild(self):
+        async with self._lock:
+            while self.version != self.index.version:
+                version, snapshot = self.index.version, self.index.snapshot
+                positions = snapshot.positions
+                docs = []
+                async for quiz in self.index.db.quizzes.find({}, {"_id": 0, "id": 1, "question": 1, "options": 1, "tags": 1}):
+                    if quiz['id'] in positions:
+                        docs.append((positions[quiz['id']], quiz))
+                # Reloaded while reading: positions are stale, read again
+                if self.index.version != version:
+                    continue
+                # Kept off the event loop: seconds of CPU for a large bank the first time
+                postings = await asyncio.to_thread(build_postings, snapshot, docs, self.postings, self.positions)
+                self._install(version, snapshot, postings)
+
+    def build(self, docs: Iterable[Tuple[int, List[str], List[str]]]):
+        self._install(self.index.version, self.index.snapshot, Postings.build(len(self.index.ids), docs))
+
+    def _install(self, version: int, snapshot: QuizIndexBuilder, postings: Postings):
+        import numpy as np
+
+        subject, difficulty = snapshot.subject, snapshot.difficulty
+        self.terms = postings.weighted
+        self.tags = postings.tags
+        self.postings = postings
+        self.ids = snapshot.ids
+        self.positions = snapshot.positions
+        self.subjects = snapshot.subjects
+        self.subject = np.frombuffer(subject, dtype=np.uint16) if len(subject) else np.zeros(0, np.uint16)
+        self.difficulty = np.frombuffer(difficulty, dtype=np.uint8) if len(difficulty) else np.zeros(0, np.uint8)
+        self.version = version
+
+    def search(self, query: str = "", subject_id: Optional[str] = None, difficulty: Optional[str] = None,
+               tag: Optional[str] = None, exclude: Optional[Set[int]] = None,
+               offset: int = 0, limit: int = 20) -> Tuple[int, List[Tuple[str, float]]]:
+        """(total matches, [(quiz id, score)] for the requested page), best first."""
+        import numpy as np
+
+        n = len(self.ids)
+        mask = np.ones(n, dtype=bool)
+        if subject_id is not None:
+            if subject_id not in self.subjects:
+                return 0, []
+            mask &= self.subject == self.subjects.index(subject_id)
+        if difficulty is not None:
+            mask &= self.difficulty == DIFFICULTIES.index(difficulty)
+        if tag is not None:
+            tagged = np.zeros(n, dtype=bool)
+            tagged[self.tags.get(tag.casefold(), [])] = True
+            mask &= tagged
+        if exclude:
+            mask[[p for p in exclude if p < n]] = False
+
+        terms = [self.terms[t] for t in set(tokenize(query)) if t in self.terms]
+        if query.strip() and not terms:
+            return 0, []
+        if not terms:
+            # Filters only: catalog order
+            matches = np.flatnonzero(mask)
+            page = matches[offset:offset + limit]
+            return len(matches), [(self.ids[p], 0.0) for p in page]
+
+        scores = np.zeros(n, dtype=np.float32)
+        for positions, weights in terms:
+            # A term occurs once per posting list, so plain fancy-index adds are safe
+            scores[positions] += weights
+        mask &= scores > 0
+        matches = np.flatnonzero(mask)
+        wanted = offset + limit
+        if len(matches) > wanted:
+            matches_scores = scores[matches]
+            top = np.argpartition(-matches_scores, wanted - 1)[:wanted]
+            ranked = matches[top[np.argsort(-matches_scores[top], kind="stable")]]
+        else:
+            ranked = matches[np.argsort(-scores[matches], kind="stable")]
+        page = ranked[offset:wanted]
+        return len(matches), [(self.ids[p], round(float(scores[p]), 3)) for p in page]
@@ -0,0 +1,203 @@
+import asyncio
+import math
+import random
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from analytics import quiz_totals
+from background import SingleFlight
+from cache import LRUCache, MISSING
+from quiz_index import DIFFICULTIES, NO_DIFFICULTY, QuizIndexBuilder
+
+# Expected success rate of a student we know nothing about, per difficulty
+PRIOR_SUCCESS = (0.85, 0.65, 0.45)
+PRIOR_WEIGHT = 2.0
+
+# Questions are most useful when a student gets roughly this share right
+TARGET_SUCCESS = 0.7
+SPREAD = 0.2
+
+
+class Mastery:
+    """Per-subject attempt/correct counters for one student, plus the quizzes already seen and solved.
+
+    Counters are packed as [attempts, correct] per difficulty in one small array per subject.
+    ``seen`` and ``solved`` hold positions in ``view``, the index snapshot they were recorded against.
+    """
+
+    __slots__ = ("subjects", "seen", "solved", "view")
+
+    def __init__(self, view: QuizIndexBuilder):
+        self.subjects: Dict[str, array] = {}
+        self.seen: Set[int] = set()
+        self.solved: Set[int] = set()
+        self.view = view
+
+    def record(self, subject_id: str, difficulty: int, quiz_idx: int, attempts: int, correct: int):
+        counters = self.subjects.get(subject_id)
+        if counters is None:
+            counters = self.subjects[subject_id] = array('I', [0] * (2 * len(DIFFICULTIES)))
+        counters[2 * difficulty] += attempts
+        self.seen.add(quiz_idx)
+        if correct:
+            counters[2 * difficulty + 1] += correct
+            self.solved.add(quiz_idx)
+
+    def remap(self, view: QuizIndexBuilder):
+        # Positions are per snapshot: carry seen/solved over through the quiz ids
+        ids, positions = self.view.ids, view.positions
+        self.seen = {p for p in (positions.get(ids[idx]) for idx in self.seen) if p is not None}
+        self.solved = {p for p in (positions.get(ids[idx]) for idx in self.solved) if p is not None}
+        self.view = view
+
+    def success_rates(self, subject_id: Optional[str]) -> List[float]:
+        if subject_id is None:
+            rows = list(self.subjects.values())
+        else:
+            rows = [self.subjects[subject_id]] if subject_id in self.subjects else []
+        rates = []
+        for d, prior in enumerate(PRIOR_SUCCESS):
+            attempts = sum(row[2 * d] for row in rows)
+            correct = sum(row[2 * d + 1] for row in rows)
+            rates.append((correct + prior * PRIOR_WEIGHT) / (attempts + PRIOR_WEIGHT))
+        return rates
+
+
+def build_pools(snapshot: QuizIndexBuilder) -> Dict[tuple, array]:
+    pools = defaultdict(lambda: array('I'))
+    subjects, subject = snapshot.subjects, snapshot.subject
+    for idx, difficulty in enumerate(snapshot.difficulty):
+        if difficulty == NO_DIFFICULTY:
+            continue
+        pools[(subjects[subject[idx]], difficulty)].append(idx)
+        pools[(None, difficulty)].append(idx)
+    return dict(pools)
+
+
+class QuizSelector:
+    """Picks the next quizzes for a student from in-memory per-difficulty candidate pools.
+
+    Quizzes are identified by their position in the shared ``QuizIndex``; pools
+    are arrays of those positions keyed by (subjectId, difficulty) and
+    (None, difficulty) for all subjects, rebuilt whenever the index reloads.
+    The rebuild runs in a worker thread while the old pools keep serving;
+    ``view`` is the index snapshot the current pools were built from, so
+    positions are always read from it. A student's mastery is loaded once
+    from the per-quiz counters of their analytics rollups, which outlive
+    attempt archival, and then kept current by ``record_attempt``, so
+    selection never reads the attempt history. Cached masteries survive a
+    rebuild: each is remapped to the new positions when next used.
+    """
+
+    def __init__(self, index, db, max_students: int = 50000):
+        self.index = index
+        self.db = db
+        self.students = LRUCache(maxsize=max_students)
+        self.rng = random.Random()
+        self.version = None
+        self.view = index.snapshot
+        self.pools: Dict[tuple, array] = {}
+        self._lock = asyncio.Lock()
+        self._refresh = SingleFlight(self._locked_rebuild, "Quiz pool rebuild")
+        # Rebuilt as soon as the index reloads, once built at all
+        index.on_reload.append(lambda: self._refresh.start() if self.version is not None else None)
+
+    async def ensure_pools(self):
+        """Build the pools on first use; afterwards they are rebuilt in the background."""
+        await self.index.ensure_loaded()
+        if self.version == self.index.version:
+            return
+        if self.version is not None:
+            self._refresh.start()
+            return
+        await self._locked_rebuild()
+
+    async def _locked_rebuild(self):
+        async with self._lock:
+            await self._rebuild()
+
+    async def _rebuild(self):
+        while self.version != self.index.version:
+            version, snapshot = self.index.version, self.index.snapshot
+            # Pure Python over every quiz: a fraction of a second for a large bank, off the event loop
+            pools = await asyncio.to_thread(build_pools, snapshot)
+            self.pools, self.view, self.version = pools, snapshot, version
+
+    async def _mastery(self, student_id: str) -> Mastery:
+        mastery = self.students.get(student_id)
+        if mastery is MISSING:
+            mastery = Mastery(self.view)
+            for quiz_id, (attempts, correct) in (await quiz_totals(self.db, student_id)).items():
+                self._apply(mastery, quiz_id, attempts, correct)
+            self.students.set(student_id, mastery)
+        if mastery.view is not self.view:
+            mastery.remap(self.view)
+        return mastery
+
+    def _apply(self, mastery: Mastery, quiz_id: str, attempts: int, correct: int):
+        view = mastery.view
+        idx = view.positions.get(quiz_id)
+        if idx is not None and view.difficulty[idx] != NO_DIFFICULTY:
+            mastery.record(view.subject_of(idx), view.difficulty[idx], idx, attempts, correct)
+
+    def record_attempt(self, student_id: str, quiz_id: str, is_correct: bool):
+        # Students not in memory pick this attempt up from the rollups when they are next loaded
+        mastery = self.students.get(student_id)
+        if mastery is not MISSING:
+            if mastery.view is not self.view:
+                mastery.remap(self.view)
+            self._apply(mastery, quiz_id, 1, int(is_correct))
+
+    async def seen(self, student_id: str) -> Set[int]:
+        """QuizIndex positions of every quiz the student has attempted."""
+        await self.ensure_pools()
+        return (await self._mastery(student_id)).seen
+
+    async def select(self, student_id: str, subject_id: Optional[str], n: int) -> List[str]:
+        await self.ensure_pools()
+        mastery = await self._mastery(student_id)
+        # Read after the last await, so pools and positions match the mastery's view
+        pools, ids = self.pools, self.view.ids
+
+        # Expected learning value peaks where the student succeeds about TARGET_SUCCESS of the time
+        rates = mastery.success_rates(subject_id)
+        weights = [math.exp(-((rate - TARGET_SUCCESS) / SPREAD) ** 2) for rate in rates]
+        total = sum(weights)
+        quotas = [int(n * w / total) for w in weights]
+        order = sorted(range(len(DIFFICULTIES)), key=lambda d: weights[d], reverse=True)
+        for d in order[:n - sum(quotas)]:
+            quotas[d] += 1
+
+        picked: List[int] = []
+        taken: Set[int] = set()
+        carry = 0
+        for d in order:
+            want = quotas[d] + carry
+            got = self._take(pools.get((subject_id, d)), want, mastery.solved, taken, picked)
+            carry = want - got
+
+        # Everything unsolved is used up: fall back to reviewing solved questions
+        for d in order:
+            if len(picked) >= n:
+                break
+            self._take(pools.get((subject_id, d)), n - len(picked), set(), taken, picked)
+
+        return [ids[idx] for idx in picked]
+
+    def _take(self, pool: Optional[array], want: int, skip: Set[int], taken: Set[int], picked: List[int]) -> int:
+        # Walk the pool from a random offset so students don't all get the same questions
+        if not pool or want <= 0:
+            return 0
+        got = 0
+        start = self.rng.randrange(len(pool))
+        for i in range(len(pool)):
+            idx = pool[(start + i) % len(pool)]
+            if idx in skip or idx in taken:
+                continue
+            taken.add(idx)
+            picked.append(idx)
+            got += 1
+            if got == want:
+                break
+        return got
@@ -0,0 +1,140 @@
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+
+from cache import LRUCache, MISSING
+
+PERIODS = {"s": 1, "m": 60, "h": 3600}
+
+# route -> key kind -> "N/period[:burst]"; override with RATE_LIMIT_<ROUTE>_<KIND>, "off" disables.
+# Per-IP limits are loose because a whole school often shares one address. Login
+# "account" buckets are a username tried from one address, so guessing from
+# elsewhere can't lock the student out.
+DEFAULT_LIMITS = {
+    "attempt": {"student": "30/m:10", "ip": "1200/m:200"},
+    "login": {"account": "10/m:5", "ip": "60/m:20"},
+    "register": {"ip": "20/m:5"},
+}
+
+
+class Limit:
+    """Token bucket: ``rate`` tokens per second, holding at most ``burst``."""
+
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def parse(cls, spec: str) -> "Limit":
+        count, _, rest = spec.partition("/")
+        period, _, burst = rest.partition(":")
+        rate = float(count) / PERIODS[period]
+        return cls(rate, float(burst) if burst else float(count))
+
+
+class MemoryBackend:
+    """Buckets in this worker's memory. Also the stand-in for the shared backend in tests."""
+
+    def __init__(self, maxsize: int = 100000):
+        self.buckets = LRUCache(maxsize=maxsize)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is MISSING:
+            bucket = [limit.burst, now]
+            self.buckets.set(key, bucket)
+        tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / limit.rate
+
+
+class MongoBackend:
+    """Buckets shared by every worker, one document per key, updated atomically.
+
+    The refill is computed with the server clock ($$NOW), so workers with skewed
+    clocks agree; idle buckets are removed by a TTL index once they would be full.
+    """
+
+    def __init__(self, db, collection: str = "rate_limits"):
+        self.collection = db[collection]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expiresAt", expireAfterSeconds=0)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updatedAt", "$$NOW"]}]}, 1000]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [
+                        limit.burst,
+                        {"$add": [{"$ifNull": ["$tokens", limit.burst]}, {"$multiply": [elapsed, limit.rate]}]}
+                    ]},
+                    "updatedAt": "$$NOW"
+                }},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expiresAt": {"$add": ["$$NOW", int(limit.burst / limit.rate * 1000)]}
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket['allowed']:
+            return 0.0
+        return (1 - bucket['tokens']) / limit.rate
+
+
+def limiter_backend_from_url(url: Optional[str], db=None):
+    # memory (default) | mongo
+    if not url or url == 'memory':
+        return MemoryBackend()
+    if url == 'mongo':
+        return MongoBackend(db)
+    raise ValueError(f"Unknown rate limit backend: {url}")
+
+
+class RateLimiter:
+    """Per-route token buckets keyed by student id, IP address or username and IP address."""
+
+    def __init__(self, backend, limits: Optional[Dict[str, Dict[str, str]]] = None):
+        self.backend = backend
+        self.limits: Dict[str, Dict[str, Limit]] = {}
+        for route, kinds in (limits or DEFAULT_LIMITS).items():
+            for kind, spec in kinds.items():
+                spec = os.environ.get(f"RATE_LIMIT_{route.upper()}_{kind.upper()}", spec)
+                if spec != "off":
+                    self.limits.setdefault(route, {})[kind] = Limit.parse(spec)
+        self.rejected = defaultdict(int)
+
+    async def hit(self, route: str, **keys: Optional[str]) -> float:
+        """Take one token from each of the route's buckets; returns seconds to wait, 0 when allowed."""
+        wait = 0.0
+        for kind, limit in self.limits.get(route, {}).items():
+            key = keys.get(kind)
+            if key is None:
+                continue
+            wait = max(wait, await self.backend.take(f"{route}:{kind}:{key}", limit))
+        if wait:
+            self.rejected[route] += 1
+        return wait
+
+    def snapshot(self) -> dict:
+        return {"rejected": dict(self.rejected)}
+
+
+def retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
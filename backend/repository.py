@@ -0,0 +1,296 @@
+"""Student and attempt storage for the request path: MongoDB (Motor) or PostgreSQL (asyncpg).
+
+Both repositories have the same methods and return students in the API shape
+(camelCase fields, ISO timestamps). They cover what every student request
+hits: the auth lookup, registration, login and profile updates, crediting
+XP, recording an attempt and leaderboard ranks. Every write to a student
+also increments its ``syncVersion`` (see sync.py) in the same update. ``PostgresRepository`` uses
+the tables of the Supabase migration (snake_case columns, uuid ids).
+"""
+import logging
+import re
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from codec import format_datetime, from_storage, parse_datetime, to_storage
+
+try:
+    import asyncpg
+except ImportError:  # optional, only needed for PostgresRepository
+    asyncpg = None
+
+SUPABASE_SCHEMA = Path(__file__).resolve().parent.parent / "supabase" / "migrations" / "20251021095446_create_initial_schema.sql"
+
+# API field -> students column
+STUDENT_COLUMNS = {
+    "id": "id",
+    "email": "email",
+    "username": "username",
+    "passwordHash": "password_hash",
+    "grade": "grade",
+    "mbtiType": "mbti_type",
+    "xp": "xp",
+    "level": "level",
+    "streak": "streak",
+    "lastActive": "last_active",
+    "createdAt": "created_at",
+    "syncVersion": "sync_version",
+}
+STUDENT_SELECT = "SELECT " + ", ".join(STUDENT_COLUMNS.values()) + " FROM students"
+
+# The unique indexes are what keeps ids, usernames and emails unique
+STUDENT_UNIQUE_FIELDS = ("id", "username", "email")
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateStudent(Exception):
+    """A unique username or email is already taken."""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already exists")
+        self.field = field
+
+
+def duplicate_field(details: Optional[dict]) -> str:
+    # Which unique index was hit: "username" or "email"; from a DuplicateKeyError's or a bulk write error's details
+    key_pattern = (details or {}).get('keyPattern') or {}
+    return next((field for field in key_pattern if field in ("username", "email")), "username or email")
+
+
+async def ensure_student_indexes(db) -> List[str]:
+    """Build the unique student indexes and return the fields whose index could not be built."""
+    # Each index builds on its own, so a duplicate email doesn't leave usernames unprotected
+    missing = []
+    for field in STUDENT_UNIQUE_FIELDS:
+        try:
+            await db.students.create_index(field, unique=True)
+        except DuplicateKeyError:
+            logger.error("Duplicate student %ss exist; resolve them so the unique index can be built", field)
+            missing.append(field)
+        except Exception:
+            logger.exception("Could not create the unique student %s index", field)
+            missing.append(field)
+    return missing
+
+
+class MongoRepository:
+    def __init__(self, db, attempts):
+        self.db = db
+        self.attempts = attempts
+
+    async def _find(self, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        # Timestamps are stored as datetimes but served as ISO strings
+        return from_storage("students", await self.db.students.find_one(query, projection or {"_id": 0}))
+
+    async def student(self, student_id: str) -> Optional[dict]:
+        return await self._find({"id": student_id})
+
+    async def student_by_username(self, username: str) -> Optional[dict]:
+        return await self._find({"username": username})
+
+    async def create_student(self, student: dict):
+        # Unique indexes on username and email reject duplicates, even from concurrent registrations
+        try:
+            await self.db.students.insert_one(to_storage("students", student))
+        except DuplicateKeyError as e:
+            raise DuplicateStudent(duplicate_field(e.details))
+
+    async def update_student(self, student_id: str, fields: dict):
+        await self.db.students.update_one(
+            {"id": student_id},
+            {"$set": to_storage("students", fields), "$inc": {"syncVersion": 1}}
+        )
+
+    async def update_profile(self, student_id: str, fields: dict) -> Optional[dict]:
+        """Apply ``fields`` and return the updated student without its password hash."""
+        try:
+            student = await self.db.students.find_one_and_update(
+                {"id": student_id},
+                {"$set": fields, "$inc": {"syncVersion": 1}},
+                projection={"_id": 0, "passwordHash": 0},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError as e:
+            raise DuplicateStudent(duplicate_field(e.details))
+        return from_storage("students", student)
+
+    async def add_xp(self, student_id: str, xp: int) -> Optional[Tuple[int, int]]:
+        """Credit ``xp``; returns the new (xp, level), level not yet recalculated."""
+        updated = await self.db.students.find_one_and_update(
+            {"id": student_id},
+            {"$inc": {"xp": xp, "syncVersion": 1}},
+            projection={"_id": 0, "xp": 1, "level": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return (updated['xp'], updated.get('level', 1)) if updated else None
+
+    async def set_level(self, student_id: str, level: int):
+        await self.db.students.update_one({"id": student_id}, {"$set": {"level": level}, "$inc": {"syncVersion": 1}})
+
+    async def insert_attempt(self, attempt: dict):
+        await self.attempts.insert(attempt)
+
+    async def rank(self, student_id: str) -> Optional[int]:
+        me = await self.db.students.find_one({"id": student_id}, {"_id": 0, "xp": 1})
+        if not me:
+            return None
+        return await self.db.students.count_documents({"xp": {"$gt": me.get('xp', 0)}}) + 1
+
+    async def top_students(self, limit: int) -> List[dict]:
+        cursor = self.db.students.find({}, {"_id": 0, "id": 1, "username": 1, "xp": 1, "level": 1})
+        students = await cursor.sort([("xp", -1), ("id", 1)]).limit(limit).to_list(limit)
+        return [{**s, "rank": i + 1} for i, s in enumerate(students)]
+
+
+POSTGRES_ADDITIONS = (
+    # Not in the Supabase migration: the sync counter, and indexes for rank and a student's history
+    "ALTER TABLE students ADD COLUMN IF NOT EXISTS sync_version bigint NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS students_xp_idx ON students (xp DESC)",
+    "CREATE INDEX IF NOT EXISTS student_quiz_attempts_student_idx ON student_quiz_attempts (student_id, attempted_at)",
+)
+
+INSERT_STUDENT = (
+    "INSERT INTO students (" + ", ".join(STUDENT_COLUMNS.values()) + ") VALUES ("
+    + ", ".join(f"${i + 1}" for i in range(len(STUDENT_COLUMNS))) + ")"
+)
+ADD_XP = "UPDATE students SET xp = xp + $2, sync_version = sync_version + 1 WHERE id = $1 RETURNING xp, level"
+INSERT_ATTEMPT = (
+    "INSERT INTO student_quiz_attempts (id, student_id, quiz_id, selected_answer, is_correct, xp_earned, attempted_at) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7)"
+)
+# Counting the students ahead is an index range scan; ranking everyone to find one row is not
+STUDENT_RANK = "SELECT (SELECT count(*) FROM students s WHERE s.xp > me.xp) + 1 FROM students me WHERE me.id = $1"
+TOP_STUDENTS = (
+    "SELECT id, username, xp, level, row_number() OVER (ORDER BY xp DESC, id) AS rank "
+    "FROM students ORDER BY xp DESC, id LIMIT $1"
+)
+
+
+def schema_statements(path: Path = SUPABASE_SCHEMA) -> List[str]:
+    """The CREATE TABLE statements of the Supabase migration, without Supabase-only RLS policies."""
+    return re.findall(r"CREATE TABLE IF NOT EXISTS .*?\n\);", path.read_text(), re.S)
+
+
+def as_uuid(value: str) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(value)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class PostgresRepository:
+    """The same operations on PostgreSQL through an asyncpg pool.
+
+    asyncpg prepares each distinct statement once per connection and keeps it
+    in the connection's statement cache, so the fixed SQL of the hot queries
+    above is parsed and planned once per pooled connection, then only bound
+    and executed.
+    """
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 20, **pool_options):
+        if asyncpg is None:
+            raise RuntimeError("PostgresRepository needs asyncpg (pip install asyncpg)")
+        self.dsn = dsn
+        self.pool_options = dict(pool_options, min_size=min_size, max_size=max_size)
+        self.pool = None
+
+    async def start(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(self.dsn, **self.pool_options)
+
+    async def stop(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def ensure_schema(self):
+        async with self.pool.acquire() as conn:
+            for statement in (*schema_statements(), *POSTGRES_ADDITIONS):
+                await conn.execute(statement)
+
+    @staticmethod
+    def _student(row) -> Optional[dict]:
+        if row is None:
+            return None
+        student = {field: row[column] for field, column in STUDENT_COLUMNS.items()}
+        student['id'] = str(student['id'])
+        for field in ("lastActive", "createdAt"):
+            student[field] = format_datetime(student[field])
+        return student
+
+    async def student(self, student_id: str) -> Optional[dict]:
+        key = as_uuid(student_id)
+        if key is None:
+            return None
+        return self._student(await self.pool.fetchrow(STUDENT_SELECT + " WHERE id = $1", key))
+
+    async def student_by_username(self, username: str) -> Optional[dict]:
+        return self._student(await self.pool.fetchrow(STUDENT_SELECT + " WHERE username = $1", username))
+
+    async def create_student(self, student: dict):
+        row = {
+            **student,
+            "id": uuid.UUID(student['id']),
+            "lastActive": parse_datetime(student['lastActive']),
+            "createdAt": parse_datetime(student['createdAt']),
+            "syncVersion": student.get('syncVersion', 0)
+        }
+        values = [row.get(field) for field in STUDENT_COLUMNS]
+        try:
+            await self.pool.execute(INSERT_STUDENT, *values)
+        except asyncpg.UniqueViolationError as e:
+            raise DuplicateStudent(next(
+                (field for field in ("username", "email") if field in (e.constraint_name or "")), "username or email"
+            ))
+
+    async def _update(self, student_id: str, fields: dict, returning: str = ""):
+        columns = [STUDENT_COLUMNS[field] for field in fields]
+        values = [parse_datetime(v) if field in ("lastActive", "createdAt") else v for field, v in fields.items()]
+        query = (
+            "UPDATE students SET " + ", ".join(f"{c} = ${i + 2}" for i, c in enumerate(columns))
+            + ", sync_version = sync_version + 1 WHERE id = $1" + returning
+        )
+        return await self.pool.fetchrow(query, as_uuid(student_id), *values)
+
+    async def update_student(self, student_id: str, fields: dict):
+        await self._update(student_id, fields)
+
+    async def update_profile(self, student_id: str, fields: dict) -> Optional[dict]:
+        try:
+            row = await self._update(student_id, fields, " RETURNING " + ", ".join(STUDENT_COLUMNS.values()))
+        except asyncpg.UniqueViolationError as e:
+            raise DuplicateStudent(next(
+                (field for field in ("username", "email") if field in (e.constraint_name or "")), "username or email"
+            ))
+        student = self._student(row)
+        if student is not None:
+            del student['passwordHash']
+        return student
+
+    async def add_xp(self, student_id: str, xp: int) -> Optional[Tuple[int, int]]:
+        row = await self.pool.fetchrow(ADD_XP, as_uuid(student_id), xp)
+        return (row['xp'], row['level']) if row else None
+
+    async def set_level(self, student_id: str, level: int):
+        await self.pool.execute(
+            "UPDATE students SET level = $2, sync_version = sync_version + 1 WHERE id = $1", as_uuid(student_id), level
+        )
+
+    async def insert_attempt(self, attempt: dict):
+        await self.pool.execute(
+            INSERT_ATTEMPT,
+            uuid.UUID(attempt['id']), uuid.UUID(attempt['studentId']), uuid.UUID(attempt['quizId']),
+            attempt['selectedAnswer'], attempt['isCorrect'], attempt['xpEarned'], parse_datetime(attempt['attemptedAt'])
+        )
+
+    async def rank(self, student_id: str) -> Optional[int]:
+        return await self.pool.fetchval(STUDENT_RANK, as_uuid(student_id))
+
+    async def top_students(self, limit: int) -> List[dict]:
+        rows = await self.pool.fetch(TOP_STUDENTS, limit)
+        return [{**dict(row), "id": str(row['id'])} for row in rows]
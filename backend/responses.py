@@ -0,0 +1,48 @@
+"""JSON responses encoded with orjson.
+
+FastAPI runs every returned dict or model through ``jsonable_encoder`` before
+the response class sees it. Handlers on hot paths return a ``Response``
+themselves (``json_response``/``model_response``/pre-serialised bytes), which
+skips that step and the response_model validation entirely.
+"""
+import os
+from typing import Any, Type
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+# Validate hand-built bodies against their response_model, e.g. in development
+VALIDATE_RESPONSES = os.environ.get('VALIDATE_RESPONSES', '').lower() in ('1', 'true', 'yes')
+
+MEDIA_TYPE = "application/json"
+
+
+def dumps(value: Any) -> bytes:
+    # Compact UTF-8 like json.dumps(separators=(",", ":"), ensure_ascii=False); datetimes become ISO strings
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(Response):
+    """Default response class: orjson instead of the stdlib encoder."""
+
+    media_type = MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    return FastJSONResponse(content, status_code=status_code)
+
+
+def bytes_response(body: bytes, status_code: int = 200) -> Response:
+    # For payloads serialised once and cached
+    return Response(content=body, status_code=status_code, media_type=MEDIA_TYPE)
+
+
+def model_response(model: Type[BaseModel], **fields) -> Response:
+    # The route keeps response_model for the OpenAPI schema; the body is built directly
+    if VALIDATE_RESPONSES:
+        fields = model(**fields).model_dump(mode="json")
+    return json_response(fields)
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional
+
+from bson import Binary
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is used instead
+    zstandard = None
+
+ARCHIVE = "attempt_archive"
+
+QUEST_RETENTION_DAYS = int(os.environ.get('QUEST_RETENTION_DAYS', '30'))
+ATTEMPT_RETENTION_DAYS = int(os.environ.get('ATTEMPT_RETENTION_DAYS', '180'))
+
+
+def compress(data: bytes) -> tuple:
+    if zstandard:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+async def ensure_retention_indexes(db, quest_retention_days: int = QUEST_RETENTION_DAYS):
+    # Daily quest rows are only read for "today", old ones expire on their own
+    await db.student_daily_quests.create_index("createdAt", expireAfterSeconds=quest_retention_days * 86400)
+    await db[ARCHIVE].create_index([("studentId", 1), ("day", 1)])
+
+
+async def stamp_quest_rows(db) -> int:
+    # Rows written before TTL support only have their date, possibly still a "YYYY-MM-DD" string
+    result = await db.student_daily_quests.update_many(
+        {"createdAt": {"$exists": False}},
+        [{"$set": {"createdAt": {"$cond": [
+            {"$eq": [{"$type": "$date"}, "string"]},
+            {"$dateFromString": {"dateString": "$date", "timezone": "UTC"}},
+            "$date"
+        ]}}}]
+    )
+    return result.modified_count
+
+
+def iter_archive_bucket(bucket: dict) -> Iterator[dict]:
+    for line in decompress(bucket['codec'], bucket['data']).splitlines():
+        yield {**json.loads(line), "studentId": bucket['studentId']}
+
+
+async def archived_for_student(db, student_id: str) -> AsyncIterator[dict]:
+    """The student's attempts in attempt_archive, oldest first (archives written with --dir are not included)."""
+    cursor = db[ARCHIVE].find({"studentId": student_id}, {"_id": 0}).sort("day", 1)
+    try:
+        async for bucket in cursor:
+            # One student-day per bucket, rows in no particular order
+            rows = [json.loads(line) for line in decompress(bucket['codec'], bucket['data']).splitlines()]
+            for row in sorted(rows, key=lambda r: str(r.get('attemptedAt'))):
+                # Same shape as the attempt store's rows
+                yield {"studentId": student_id, **row}
+    finally:
+        await cursor.close()
+
+
+async def archive_day(db, attempts, day: datetime, out_dir: Optional[Path] = None) -> int:
+    """Move one UTC day of attempts into compressed per-student buckets (or a local file).
+
+    Buckets have a deterministic _id and are written before the source rows are
+    deleted, so an interrupted run can simply be repeated.
+    """
+    end = day + timedelta(days=1)
+    day_key = day.strftime("%Y-%m-%d")
+    by_student = {}
+    count = 0
+    async for attempt in attempts.between(day, end):
+        row = {k: v for k, v in attempt.items() if k != "studentId"}
+        by_student.setdefault(attempt['studentId'], []).append(row)
+        count += 1
+    if not count:
+        return 0
+
+    if out_dir:
+        suffix, opener = (".jsonl.zst", None) if zstandard else (".jsonl.gz", gzip.open)
+        path = out_dir / f"attempts-{day_key}{suffix}"
+        lines = b"".join(
+            json.dumps({**row, "studentId": student_id}, ensure_ascii=False).encode('utf-8') + b"\n"
+            for student_id, rows in by_student.items() for row in rows
+        )
+        # Appending means a repeated run can duplicate rows in the file, but never drops them
+        if opener:
+            with opener(path, "ab") as f:
+                f.write(lines)
+        else:
+            with open(path, "ab") as f:
+                f.write(zstandard.ZstdCompressor(level=10).compress(lines))
+    else:
+        for student_id, rows in by_student.items():
+            codec, data = compress(b"\n".join(json.dumps(r, ensure_ascii=False).encode('utf-8') for r in rows))
+            await db[ARCHIVE].update_one(
+                {"_id": f"{student_id}:{day_key}"},
+                {"$setOnInsert": {
+                    "studentId": student_id,
+                    "day": day_key,
+                    "count": len(rows),
+                    "codec": codec,
+                    "data": Binary(data)
+                }},
+                upsert=True
+            )
+
+    await attempts.delete_between(day, end)
+    return count
+
+
+async def archive_attempts(db, attempts, retention_days: int = ATTEMPT_RETENTION_DAYS,
+                           out_dir: Optional[Path] = None, log=print) -> int:
+    """Archive every whole UTC day older than ``retention_days``.
+
+    Rollups in student_subject_daily are left untouched, so analytics and the
+    subject/weekly leaderboards keep their history.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    oldest = await attempts.oldest()
+    if not oldest:
+        return 0
+
+    day = oldest.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    moved = 0
+    while day < cutoff:
+        count = await archive_day(db, attempts, day, out_dir)
+        if count:
+            log(f"Archived {count} attempts from {day:%Y-%m-%d}")
+        moved += count
+        day += timedelta(days=1)
+    return moved
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from attempt_store import attempt_store_from_env
+
+    parser = argparse.ArgumentParser(description="Attempt archival and quest expiry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("indexes", help="create TTL/archive indexes and stamp old quest rows")
+    archive = sub.add_parser("archive", help="move old attempts to cold storage")
+    archive.add_argument("--days", type=int, default=ATTEMPT_RETENTION_DAYS, help="keep this many days hot")
+    archive.add_argument("--dir", type=Path, help="write JSONL files here instead of archive documents")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    started = time.perf_counter()
+    if args.command == "indexes":
+        await ensure_retention_indexes(db)
+        print(f"✅ Indexes ready, stamped {await stamp_quest_rows(db)} quest rows")
+    else:
+        if args.dir:
+            args.dir.mkdir(parents=True, exist_ok=True)
+        attempts = attempt_store_from_env(db, os.environ.get('ATTEMPT_STORAGE'))
+        moved = await archive_attempts(db, attempts, args.days, args.dir)
+        print(f"✅ Archived {moved} attempts in {time.perf_counter() - started:.1f}s")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,6 +3,9 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+from cache import publish_invalidation
+from quiz_bank import content_hash
+from sync import CATALOGS, bump_versions
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -194,7 +197,8 @@ async def seed_database():
     print(f"✅ Inserted {len(SUBJECTS)} exam subjects")
     
     # Insert quizzes
-    await db.quizzes.insert_many(QUIZZES)
+    # Hashed like imported quizzes, so importing the same questions doesn't duplicate them
+    await db.quizzes.insert_many([{**q, "contentHash": content_hash(q)} for q in QUIZZES])
     print(f"✅ Inserted {len(QUIZZES)} quizzes")
     
     # Insert daily quests
@@ -207,6 +211,13 @@ async def seed_database():
     
     print("🎉 Database seeding completed!")
     
+    # Tell running API workers to drop their cached catalog
+    await publish_invalidation(db, "catalog")
+    print("📣 Published catalog invalidation")
+    
+    # After the invalidation, so clients never get a new version with stale cached data
+    await bump_versions(db, CATALOGS)
+    
     client.close()
 
 if __name__ == "__main__":
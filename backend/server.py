@@ -1,38 +1,140 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import StreamingResponse
+from pymongo import ReturnDocument
 import os
+import asyncio
 import logging
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, model_validator
+from typing import List, Literal, Optional
 import uuid
+import secrets
 from datetime import datetime, timezone, timedelta
-import bcrypt
 import jwt
 from collections import defaultdict
-
-# TODO: Uncomment when OpenAI key is provided
-# from emergentintegrations.llm.chat import LlmChat, UserMessage
+from contextlib import asynccontextmanager
+from leaderboard import LeaderboardSnapshots
+from pubsub import PubSub, broker_from_url
+from cache import LRUCache, InvalidationBus
+from quiz_index import QuizIndex
+from quiz_selection import QuizSelector
+from quiz_search import QuizSearch
+from exam_sessions import ExamClosed, ExamInProgress, ExamSessions
+import analytics
+import retention
+from attempt_store import BATCH_SIZE as ATTEMPT_BATCH_SIZE, attempt_store_from_env
+import codec
+from responses import FastJSONResponse, bytes_response, dumps, json_response, model_response
+from compression import CompressionMiddleware, Precompressed, PrecompressedResponse
+import compression
+import metrics
+from ratelimit import RateLimiter, limiter_backend_from_url, retry_after
+from admission import AdmissionController, AdmissionMiddleware, PoolWaitListener
+from loop_monitor import loop_monitor_from_env
+from database import LazyDatabase
+from repository import DuplicateStudent, MongoRepository, ensure_student_indexes as build_student_indexes
+import provisioning
+import quiz_bank
+import sync
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection, made on first use (MONGO_URL, DB_NAME); pool checkout waits feed admission control
+pool_listener = PoolWaitListener()
+db = LazyDatabase(event_listeners=[pool_listener])
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
 
+# bcrypt cost for passwords set through the API; cheaper provisioning hashes are upgraded at login
+BCRYPT_ROUNDS = 12
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Live updates fan-out (leaderboard, XP, quests) to WebSocket clients, and
+# cache invalidations between workers. Use PUBSUB_BROKER=mongo (or file:<path>
+# on a single host) when running more than one worker.
+pubsub = PubSub(broker_from_url(os.environ.get('PUBSUB_BROKER'), db))
+invalidation = InvalidationBus(pubsub)
+
+# Per-worker caches, kept coherent through the invalidation bus
+student_cache = LRUCache(maxsize=50000, ttl=float(os.environ.get('STUDENT_CACHE_TTL_SECONDS', '30')))
+catalog_cache = LRUCache(maxsize=256)
+
+# Materialised leaderboards, rebuilt in the background
+leaderboards = LeaderboardSnapshots(
+    db,
+    refresh_interval=float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', '5'))
+)
+leaderboards.on_refresh = lambda: pubsub.publish_local("leaderboard", {})
+pubsub.listen("attempt", lambda topic, m: leaderboards.record_attempt(m['studentId'], m['subjectId'], m['xpEarned']))
+
+# Where attempts are stored: one document each, or per-student daily buckets
+attempt_store = attempt_store_from_env(db, os.environ.get('ATTEMPT_STORAGE'))
+
+# Student lookups and updates, XP and attempts on the request path
+repository = MongoRepository(db, attempt_store)
 
-app = FastAPI()
+# Answer keys of the whole quiz bank in memory, shared with adaptive quiz selection
+quiz_index = QuizIndex(db)
+quiz_selector = QuizSelector(quiz_index, db)
+quiz_search = QuizSearch(quiz_index)
+pubsub.listen("attempt", lambda topic, m: quiz_selector.record_attempt(m['studentId'], m['quizId'], m['isCorrect']))
+
+# Running mock exams, answers checkpointed in bulk rather than written one by one
+exam_sessions = ExamSessions(
+    db, quiz_selector,
+    checkpoint_interval=float(os.environ.get('EXAM_CHECKPOINT_SECONDS', '15'))
+)
+
+invalidation.on("student", lambda key: student_cache.pop(key) if key else student_cache.clear())
+invalidation.on("student", lambda key: leaderboards.mark_dirty())
+invalidation.on("catalog", lambda key: catalog_cache.clear())
+invalidation.on("catalog", lambda key: leaderboards.request_reconcile())
+invalidation.on("catalog", lambda key: quiz_index.invalidate())
+
+# Token buckets for expensive writes (RATE_LIMIT_BACKEND=mongo to share them between workers),
+# and load shedding when the worker falls behind
+rate_limiter = RateLimiter(limiter_backend_from_url(os.environ.get('RATE_LIMIT_BACKEND'), db))
+loop_monitor = loop_monitor_from_env()
+admission = AdmissionController(loop_monitor, pool_listener)
+
+metrics.register("compression", compression.stats.snapshot)
+metrics.register("rateLimit", rate_limiter.snapshot)
+metrics.register("admission", admission.snapshot)
+metrics.register("eventLoop", loop_monitor.snapshot)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve as soon as possible: indexes build in the background
+    index_build = asyncio.create_task(ensure_indexes())
+    warm_up = asyncio.create_task(load_quiz_index())
+    await pubsub.start()
+    leaderboards.start()
+    exam_sessions.start()
+    loop_monitor.start()
+    yield
+    index_build.cancel()
+    warm_up.cancel()
+    await loop_monitor.stop()
+    await exam_sessions.stop()
+    await leaderboards.stop()
+    await pubsub.stop()
+    provisioning.shutdown()
+    db.close()
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # ============ MODELS ============
@@ -66,7 +168,7 @@ class TokenResponse(BaseModel):
     user: dict
 
 class MBTIType(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", defer_build=True)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     code: str  # ENFP, ISTJ, etc.
     title: str
@@ -74,20 +176,29 @@ class MBTIType(BaseModel):
     tips: str
 
 class ExamSubject(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", defer_build=True)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     maxScore: int = 800
 
 class Quiz(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", defer_build=True)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     subjectId: str
     question: str
     options: List[str]
     correctAnswer: int  # index of correct option
-    difficulty: str  # easy, medium, hard
-    xp: int  # XP reward
+    difficulty: Literal["easy", "medium", "hard"]
+    xp: int = Field(ge=0)  # XP reward
+    tags: List[str] = []
+
+    @model_validator(mode="after")
+    def check_answer(self):
+        if len(self.options) < 2:
+            raise ValueError("options needs at least two entries")
+        if not 0 <= self.correctAnswer < len(self.options):
+            raise ValueError("correctAnswer must be the index of one of the options")
+        return self
 
 class QuizAttempt(BaseModel):
     quizId: str
@@ -101,8 +212,18 @@ class QuizResult(BaseModel):
     newLevel: int
     leveledUp: bool
 
+class ExamStart(BaseModel):
+    subjectId: str
+
+class ExamAnswer(BaseModel):
+    question: int  # position in the exam
+    answer: Optional[int] = None  # None clears it
+
+class ExamSubmit(BaseModel):
+    answers: Optional[List[Optional[int]]] = None
+
 class Badge(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", defer_build=True)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     description: str
@@ -110,7 +231,7 @@ class Badge(BaseModel):
     requirement: str
 
 class DailyQuest(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", defer_build=True)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     description: str
     xpReward: int
@@ -118,7 +239,7 @@ class DailyQuest(BaseModel):
     target: int
 
 class StudentDailyQuest(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", defer_build=True)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     studentId: str
     questId: str
@@ -131,12 +252,24 @@ class AITipRequest(BaseModel):
 
 # ============ HELPER FUNCTIONS ============
 
+# Stored on the student but never sent: the hash, and the counter behind /api/sync
+PRIVATE_STUDENT_FIELDS = ("passwordHash", "syncVersion")
+
+def public_student(student: dict) -> dict:
+    return {k: v for k, v in student.items() if k not in PRIVATE_STUDENT_FIELDS}
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    import bcrypt  # only needed on register/login, not at import
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
+    import bcrypt
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def bcrypt_rounds(hashed: str) -> int:
+    # "$2b$12$..." -> 12
+    return int(hashed.split('$')[2])
+
 def create_token(student_id: str) -> str:
     payload = {
         "sub": student_id,
@@ -144,23 +277,69 @@ def create_token(student_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def student_id_from_token(token: str) -> str:
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        student_id = payload.get("sub")
-        if not student_id:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        student = await db.students.find_one({"id": student_id}, {"_id": 0})
-        if not student:
-            raise HTTPException(status_code=401, detail="User not found")
-        
-        return student
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    student_id = payload.get("sub")
+    if not student_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return student_id
+
+async def get_student_from_token(token: str) -> dict:
+    student_id = student_id_from_token(token)
+    student = await invalidation.cached(
+        student_cache, student_id,
+        lambda: repository.student(student_id),
+        "student", student_id
+    )
+    if not student:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    return student
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await get_student_from_token(credentials.credentials)
+
+async def get_current_student_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    # For writes that only need the id: the signed token is enough, the student isn't read
+    return student_id_from_token(credentials.credentials)
+
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    if not credentials:
+        return None
+    return await get_student_from_token(credentials.credentials)
+
+async def get_catalog(collection: str, limit: int = 100) -> List[dict]:
+    # Reference data only changes on seeding, so it is served from memory.
+    # Callers must copy documents before modifying them.
+    return await invalidation.cached(
+        catalog_cache, collection,
+        lambda: db[collection].find({}, {"_id": 0}).to_list(limit),
+        "catalog"
+    )
+
+async def get_catalog_payload(collection: str) -> Precompressed:
+    # Whole-catalog responses are serialised and compressed once per catalog generation
+    async def load():
+        return Precompressed(dumps(await get_catalog(collection)))
+    return await invalidation.cached(catalog_cache, f"{collection}:json", load, "catalog")
+
+def client_ip(request: Request) -> Optional[str]:
+    # Behind a proxy, run uvicorn with --proxy-headers so this is the real client
+    return request.client.host if request.client else None
+
+async def enforce_rate_limit(route: str, **keys: Optional[str]):
+    wait = await rate_limiter.hit(route, **keys)
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": retry_after(wait)})
 
 def calculate_level_from_xp(xp: int) -> int:
     # Every 1000 XP = 1 level
@@ -191,6 +370,7 @@ async def get_ai_tip(mbti_code: str, context: Optional[str] = None) -> str:
     # TODO: Replace with actual OpenAI integration when key is provided
     # openai_key = os.environ.get('OPENAI_API_KEY')
     # if openai_key:
+    #     from emergentintegrations.llm.chat import LlmChat, UserMessage  # heavy, import on first use
     #     chat = LlmChat(
     #         api_key=openai_key,
     #         session_id=f"ai-teacher-{uuid.uuid4()}",
@@ -210,14 +390,9 @@ async def get_ai_tip(mbti_code: str, context: Optional[str] = None) -> str:
 # ============ AUTH ENDPOINTS ============
 
 @api_router.post("/auth/register", response_model=TokenResponse)
-async def register(data: StudentCreate):
-    # Check if username or email exists
-    existing = await db.students.find_one(
-        {"$or": [{"email": data.email}, {"username": data.username}]},
-        {"_id": 0}
-    )
-    if existing:
-        raise HTTPException(status_code=400, detail="Username or email already exists")
+async def register(data: StudentCreate, request: Request):
+    await enforce_rate_limit("register", ip=client_ip(request))
+    await require_student_indexes()
     
     # Validate grade
     if data.grade not in [11, 12]:
@@ -227,62 +402,69 @@ async def register(data: StudentCreate):
     student = Student(
         email=data.email,
         username=data.username,
-        passwordHash=hash_password(data.password),
+        passwordHash=await asyncio.to_thread(hash_password, data.password),
         grade=data.grade
     )
     
     student_dict = student.model_dump()
-    student_dict['createdAt'] = student_dict['createdAt'].isoformat()
-    student_dict['lastActive'] = student_dict['lastActive'].isoformat()
-    
-    await db.students.insert_one(student_dict)
+    try:
+        await repository.create_student(student_dict)
+    except DuplicateStudent as e:
+        raise HTTPException(status_code=400, detail=f"{e.field.capitalize()} already exists")
+    student_dict = codec.from_storage("students", student_dict)
+    leaderboards.mark_dirty()
     
     # Create token
     token = create_token(student.id)
     
     # Return user without password
-    user_data = {k: v for k, v in student_dict.items() if k != 'passwordHash'}
+    user_data = public_student(student_dict)
     
-    return TokenResponse(token=token, user=user_data)
+    return model_response(TokenResponse, token=token, user=user_data)
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(data: StudentLogin):
+async def login(data: StudentLogin, request: Request):
+    # Each failed guess costs a bcrypt check, so limit per address and per username from that address
+    ip = client_ip(request)
+    await enforce_rate_limit("login", account=f"{data.username.lower()}@{ip}", ip=ip)
+    
     # Find student by username
-    student = await db.students.find_one({"username": data.username}, {"_id": 0})
-    if not student or not verify_password(data.password, student['passwordHash']):
+    student = await repository.student_by_username(data.username)
+    # bcrypt takes a few hundred ms of CPU, keep it off the event loop
+    if not student or not await asyncio.to_thread(verify_password, data.password, student['passwordHash']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Update last active
-    await db.students.update_one(
-        {"id": student['id']},
-        {"$set": {"lastActive": datetime.now(timezone.utc).isoformat()}}
-    )
+    # Update last active, and bring bulk-provisioned hashes up to full cost now that we have the password
+    update = {"lastActive": datetime.now(timezone.utc)}
+    if bcrypt_rounds(student['passwordHash']) < BCRYPT_ROUNDS:
+        update['passwordHash'] = await asyncio.to_thread(hash_password, data.password)
+    await repository.update_student(student['id'], update)
     
     # Create token
     token = create_token(student['id'])
     
     # Return user without password
-    user_data = {k: v for k, v in student.items() if k != 'passwordHash'}
+    user_data = public_student(student)
     
-    return TokenResponse(token=token, user=user_data)
+    return model_response(TokenResponse, token=token, user=user_data)
 
 @api_router.get("/auth/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
-    return {k: v for k, v in current_user.items() if k != 'passwordHash'}
+    return json_response(public_student(current_user))
 
 # ============ DASHBOARD ENDPOINTS ============
 
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     student_id = current_user['id']
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    today = datetime.now(timezone.utc)
     
     # Get daily quests
-    daily_quests = await db.daily_quests.find({}, {"_id": 0}).to_list(100)
+    daily_quests = await get_catalog("daily_quests")
     
     # Get student quest progress
     student_quests = await db.student_daily_quests.find(
-        {"studentId": student_id, "date": today},
+        {"studentId": student_id, "date": codec.day_match(today)},
         {"_id": 0}
     ).to_list(100)
     
@@ -302,89 +484,218 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
             "completed": student_quest['completed']
         })
     
-    return {
+    return json_response({
         "xp": current_user.get('xp', 0),
         "level": current_user.get('level', 1),
         "streak": current_user.get('streak', 0),
         "dailyQuests": quests_with_progress[:3]  # Show only 3 quests
-    }
+    })
+
+# ============ SYNC ENDPOINT ============
+
+@api_router.get("/sync")
+async def sync_changes(since: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    # Only what changed since the client's version token; no token means everything
+    known = sync.SyncToken.decode(since)
+    today = codec.format_day(codec.parse_day(datetime.now(timezone.utc)))
+    current = sync.SyncToken(await sync.catalog_versions(db), current_user.get('syncVersion', 0), today)
+    
+    catalogs = {}
+    for collection in sync.CATALOGS:
+        if known is None or known.catalogs[collection] != current.catalogs[collection]:
+            catalogs[collection] = await get_catalog(collection)
+    
+    student = None
+    if known is None or known.student != current.student or known.day != current.day:
+        quest_progress = await db.student_daily_quests.find(
+            {"studentId": current_user['id'], "date": codec.day_match(today)},
+            {"_id": 0, "questId": 1, "progress": 1, "completed": 1}
+        ).to_list(100)
+        unlocked = await db.student_badges.find(
+            {"studentId": current_user['id']},
+            {"_id": 0, "badgeId": 1}
+        ).to_list(100)
+        student = {
+            "xp": current_user.get('xp', 0),
+            "level": current_user.get('level', 1),
+            "streak": current_user.get('streak', 0),
+            "mbtiType": current_user.get('mbtiType'),
+            "questProgress": quest_progress,
+            "unlockedBadges": [b['badgeId'] for b in unlocked]
+        }
+    
+    return json_response({"version": current.encode(), "catalogs": catalogs, "student": student})
 
 # ============ QUIZ ENDPOINTS ============
 
+QUIZ_PROJECTION = {"_id": 0, "contentHash": 0}
+
 @api_router.get("/quizzes")
-async def get_quizzes(subject: Optional[str] = None, limit: int = 10):
-    query = {}
+async def get_quizzes(subject: Optional[str] = None, limit: int = 10, current_user: Optional[dict] = Depends(get_optional_user)):
+    subject_id = None
     if subject:
         # Find subject ID
-        subject_doc = await db.exam_subjects.find_one({"name": subject}, {"_id": 0})
+        subject_doc = next((s for s in await get_catalog("exam_subjects") if s['name'] == subject), None)
         if subject_doc:
-            query['subjectId'] = subject_doc['id']
+            subject_id = subject_doc['id']
+    
+    if current_user is None:
+        query = {"subjectId": subject_id} if subject_id else {}
+        quizzes = await db.quizzes.find(query, QUIZ_PROJECTION).to_list(limit)
+        return json_response(quizzes)
     
-    quizzes = await db.quizzes.find(query, {"_id": 0}).to_list(limit)
-    return quizzes
+    # Signed-in students get unsolved questions picked for their level
+    quiz_ids = await quiz_selector.select(current_user['id'], subject_id, limit)
+    if not quiz_ids:
+        return json_response([])
+    docs = await db.quizzes.find({"id": {"$in": quiz_ids}}, QUIZ_PROJECTION).to_list(len(quiz_ids))
+    by_id = {q['id']: q for q in docs}
+    return json_response([by_id[quiz_id] for quiz_id in quiz_ids if quiz_id in by_id])
 
-@api_router.post("/quizzes/attempt", response_model=QuizResult)
-async def attempt_quiz(attempt: QuizAttempt, current_user: dict = Depends(get_current_user)):
-    # Get quiz
-    quiz = await db.quizzes.find_one({"id": attempt.quizId}, {"_id": 0})
-    if not quiz:
-        raise HTTPException(status_code=404, detail="Quiz not found")
-    
-    is_correct = attempt.selectedAnswer == quiz['correctAnswer']
-    xp_earned = quiz['xp'] if is_correct else 0
-    
-    # Update student XP
-    new_xp = current_user['xp'] + xp_earned
-    new_level = calculate_level_from_xp(new_xp)
-    leveled_up = new_level > current_user.get('level', 1)
-    
-    await db.students.update_one(
-        {"id": current_user['id']},
-        {"$set": {"xp": new_xp, "level": new_level}}
+@api_router.get("/quizzes/search")
+async def search_quizzes(
+    q: str = "",
+    subject: Optional[str] = None,
+    difficulty: Optional[Literal["easy", "medium", "hard"]] = None,
+    tag: Optional[str] = None,
+    unseen: bool = False,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Optional[dict] = Depends(get_optional_user)
+):
+    subject_id = None
+    if subject:
+        subject_doc = next((s for s in await get_catalog("exam_subjects") if s['name'] == subject), None)
+        if not subject_doc:
+            return json_response({"total": 0, "page": page, "limit": limit, "results": []})
+        subject_id = subject_doc['id']
+    if unseen and current_user is None:
+        raise HTTPException(status_code=401, detail="Sign in to hide questions you have seen")
+    
+    await quiz_search.ensure_built()
+    exclude = None
+    if unseen:
+        exclude = await quiz_selector.seen(current_user['id'])
+        if quiz_selector.version != quiz_search.version:
+            # One of them is still rebuilding after a catalog change: match the quizzes by id
+            ids, positions = quiz_selector.view.ids, quiz_search.positions
+            exclude = {positions[ids[p]] for p in exclude if ids[p] in positions}
+    total, hits = quiz_search.search(q, subject_id, difficulty, tag, exclude, (page - 1) * limit, limit)
+    
+    docs = await db.quizzes.find({"id": {"$in": [quiz_id for quiz_id, _ in hits]}}, QUIZ_PROJECTION).to_list(len(hits))
+    by_id = {doc['id']: doc for doc in docs}
+    return json_response({
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "results": [{**by_id[quiz_id], "score": score} for quiz_id, score in hits if quiz_id in by_id]
+    })
+
+async def advance_quiz_quest(student_id: str, attempted_at: datetime) -> Optional[dict]:
+    """Count an attempt towards today's quiz_count quest; returns the live event to publish."""
+    today = codec.parse_day(attempted_at)
+    quiz_quest = next((q for q in await get_catalog("daily_quests") if q['questType'] == "quiz_count"), None)
+    if not quiz_quest:
+        return None
+    # One upsert per attempt; the row as it was before tells whether this one completed the quest.
+    # Today's row is always written with a date, so no need to match a legacy string day here
+    student_quest = await db.student_daily_quests.find_one_and_update(
+        {"studentId": student_id, "questId": quiz_quest['id'], "date": today},
+        {
+            "$inc": {"progress": 1},
+            "$setOnInsert": {"id": str(uuid.uuid4()), "completed": 1 >= quiz_quest['target'], "createdAt": attempted_at}
+        },
+        projection={"_id": 0, "progress": 1, "completed": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
     )
+    new_progress = (student_quest or {}).get('progress', 0) + 1
+    completed = new_progress >= quiz_quest['target']
+    if completed and student_quest and not student_quest.get('completed', False):
+        # Once a day at most
+        await db.student_daily_quests.update_one(
+            {"studentId": student_id, "questId": quiz_quest['id'], "date": today},
+            {"$set": {"completed": True}}
+        )
     
-    # Save attempt
-    attempt_doc = {
-        "id": str(uuid.uuid4()),
-        "studentId": current_user['id'],
-        "quizId": attempt.quizId,
-        "selectedAnswer": attempt.selectedAnswer,
-        "isCorrect": is_correct,
-        "xpEarned": xp_earned,
-        "attemptedAt": datetime.now(timezone.utc).isoformat()
+    return {
+        "type": "quest",
+        "questId": quiz_quest['id'],
+        "progress": new_progress,
+        "completed": completed,
+        "justCompleted": completed and not (student_quest or {}).get('completed', False)
     }
-    await db.student_quiz_attempts.insert_one(attempt_doc)
-    
-    # Update daily quest progress
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    quiz_quest = await db.daily_quests.find_one({"questType": "quiz_count"}, {"_id": 0})
-    if quiz_quest:
-        student_quest = await db.student_daily_quests.find_one(
-            {"studentId": current_user['id'], "questId": quiz_quest['id'], "date": today},
-            {"_id": 0}
-        )
+
+@api_router.post("/quizzes/attempt", response_model=QuizResult)
+async def attempt_quiz(attempt: QuizAttempt, request: Request, student_id: str = Depends(get_current_student_id)):
+    await enforce_rate_limit("attempt", student=student_id, ip=client_ip(request))
+    
+    # Grade from the in-memory answer keys; quizzes newer than the index are read directly
+    answer_key = await quiz_index.answer_key(attempt.quizId)
+    if answer_key is None:
+        quiz = await db.quizzes.find_one({"id": attempt.quizId}, {"_id": 0, "correctAnswer": 1, "xp": 1, "subjectId": 1})
+        if not quiz:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        answer_key = quiz['correctAnswer'], quiz['xp'], quiz['subjectId']
+    correct_answer, quiz_xp, subject_id = answer_key
+    
+    is_correct = attempt.selectedAnswer == correct_answer
+    xp_earned = quiz_xp if is_correct else 0
+    
+    # Events go out together when the block ends: one pubsub write with the Mongo broker
+    async with pubsub.batch():
+        # Quest progress is written before XP is credited: the XP update bumps the student's
+        # sync version, so a client that sees the new version also sees the new progress
+        attempted_at = datetime.now(timezone.utc)
+        quest_event = await advance_quiz_quest(student_id, attempted_at)
+        
+        # Update student XP atomically; the student is not read first, an unknown id credits nothing
+        credited = await repository.add_xp(student_id, xp_earned)
+        if credited is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        new_xp, old_level = credited
+        new_level = calculate_level_from_xp(new_xp)
+        leveled_up = new_level > old_level
         
-        if student_quest:
-            new_progress = student_quest['progress'] + 1
-            completed = new_progress >= quiz_quest['target']
-            await db.student_daily_quests.update_one(
-                {"id": student_quest['id']},
-                {"$set": {"progress": new_progress, "completed": completed}}
-            )
-        else:
-            # Create new quest progress
-            await db.student_daily_quests.insert_one({
-                "id": str(uuid.uuid4()),
-                "studentId": current_user['id'],
-                "questId": quiz_quest['id'],
-                "progress": 1,
-                "completed": 1 >= quiz_quest['target'],
-                "date": today
+        if new_level != old_level:
+            await repository.set_level(student_id, new_level)
+        await invalidation.publish("student", student_id)
+        if xp_earned:
+            await pubsub.publish(f"student:{student_id}", {
+                "type": "xp",
+                "xpEarned": xp_earned,
+                "xp": new_xp,
+                "level": new_level,
+                "leveledUp": leveled_up
             })
+        
+        # Save attempt
+        attempt_doc = {
+            "id": str(uuid.uuid4()),
+            "studentId": student_id,
+            "quizId": attempt.quizId,
+            "selectedAnswer": attempt.selectedAnswer,
+            "isCorrect": is_correct,
+            "xpEarned": xp_earned,
+            "attemptedAt": attempted_at
+        }
+        await repository.insert_attempt(attempt_doc)
+        await analytics.record_attempt(db, student_id, subject_id, attempt.quizId, is_correct, xp_earned, attempted_at)
+        await pubsub.publish("attempt", {
+            "studentId": student_id,
+            "quizId": attempt.quizId,
+            "subjectId": subject_id,
+            "isCorrect": is_correct,
+            "xpEarned": xp_earned
+        })
+        
+        if quest_event:
+            await pubsub.publish(f"student:{student_id}", quest_event)
     
-    return QuizResult(
+    return model_response(
+        QuizResult,
         isCorrect=is_correct,
-        correctAnswer=quiz['correctAnswer'],
+        correctAnswer=correct_answer,
         xpEarned=xp_earned,
         newXp=new_xp,
         newLevel=new_level,
@@ -394,55 +705,215 @@ async def attempt_quiz(attempt: QuizAttempt, current_user: dict = Depends(get_cu
 # ============ LEADERBOARD ENDPOINTS ============
 
 @api_router.get("/leaderboard")
-async def get_leaderboard(current_user: dict = Depends(get_current_user)):
-    # Get top 50 students
-    students = await db.students.find(
-        {},
-        {"_id": 0, "id": 1, "username": 1, "xp": 1, "level": 1}
-    ).sort("xp", -1).limit(50).to_list(50)
+async def get_leaderboard(
+    grade: Optional[int] = None,
+    subject: Optional[str] = None,
+    period: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    if sum(v is not None for v in (grade, subject, period)) > 1:
+        raise HTTPException(status_code=400, detail="Specify only one of grade, subject or period")
     
-    # Add rank
-    for idx, student in enumerate(students):
-        student['rank'] = idx + 1
+    await leaderboards.ensure_ready()
     
-    # Find current user rank
-    all_students = await db.students.find(
-        {},
-        {"_id": 0, "id": 1, "xp": 1}
-    ).sort("xp", -1).to_list(10000)
+    if grade is not None:
+        if grade not in [11, 12]:
+            raise HTTPException(status_code=400, detail="Grade must be 11 or 12")
+        key = f"grade:{grade}"
+    elif subject is not None:
+        key = leaderboards.subject_key(subject)
+        if not key:
+            raise HTTPException(status_code=404, detail="Subject not found")
+    elif period is not None:
+        if period != "week":
+            raise HTTPException(status_code=400, detail="Period must be 'week'")
+        key = "week"
+    else:
+        key = "global"
     
-    my_rank = next((idx + 1 for idx, s in enumerate(all_students) if s['id'] == current_user['id']), None)
+    # Boards are pre-serialised, only myRank is spliced in per request
+    return bytes_response(leaderboards.render(key, current_user['id']))
+
+# ============ ANALYTICS ENDPOINTS ============
+
+@api_router.get("/analytics/me")
+async def get_my_analytics(days: Optional[int] = None, current_user: dict = Depends(get_current_user)):
+    since = None
+    if days is not None:
+        if days < 1:
+            raise HTTPException(status_code=400, detail="Days must be at least 1")
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
     
-    return {
-        "leaderboard": students,
-        "myRank": my_rank
-    }
+    return json_response(await analytics.student_analytics(db, current_user['id'], await get_catalog("exam_subjects"), since))
+
+async def attempt_history(student_id: str):
+    # One chunk per cursor batch: memory stays flat however long the history,
+    # and each chunk waits for the client to take the previous one
+    lines = []
+    archived_days = set()
+    
+    async def attempts():
+        # Archived days come first, they are older than anything still in the attempt store
+        async for attempt in retention.archived_for_student(db, student_id):
+            archived_days.add(attempt['attemptedAt'][:10])
+            yield attempt
+        async for attempt in attempt_store.for_student(student_id):
+            # A day whose archiving was interrupted is in both places
+            if str(attempt['attemptedAt'])[:10] not in archived_days:
+                yield attempt
+    
+    async for attempt in attempts():
+        lines.append(dumps(attempt))
+        if len(lines) == ATTEMPT_BATCH_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+@api_router.get("/me/attempts/export")
+async def export_my_attempts(current_user: dict = Depends(get_current_user)):
+    # NDJSON, one attempt per line, archived attempts included (except archives written to files
+    # with `retention.py archive --dir`); CompressionMiddleware gzips it on the fly when the client accepts it
+    return StreamingResponse(
+        attempt_history(current_user['id']),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="attempts.ndjson"'}
+    )
+
+# ============ MOCK EXAM ENDPOINTS ============
+
+async def load_exam(session_id: str, student_id: str):
+    session = await exam_sessions.load(session_id)
+    if not session or session.student_id != student_id:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    return session
+
+@api_router.post("/exams")
+async def start_exam(data: ExamStart, current_user: dict = Depends(get_current_user)):
+    subject = next((s for s in await get_catalog("exam_subjects") if s['id'] == data.subjectId), None)
+    if not subject:
+        raise HTTPException(status_code=404, detail="Subject not found")
+    
+    try:
+        started = await exam_sessions.begin(current_user['id'], subject)
+    except ExamInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not started:
+        raise HTTPException(status_code=404, detail="No questions for this subject yet")
+    
+    session, questions = started
+    return json_response({**session.view(), "questions": questions})
+
+@api_router.get("/exams/current")
+async def get_current_exam(current_user: dict = Depends(get_current_user)):
+    session = await exam_sessions.active_for(current_user['id'])
+    if not session:
+        raise HTTPException(status_code=404, detail="No exam in progress")
+    return json_response({**session.view(), "questions": await exam_sessions.questions(session.quiz_ids)})
+
+@api_router.get("/exams/{session_id}")
+async def get_exam(session_id: str, current_user: dict = Depends(get_current_user)):
+    session = await load_exam(session_id, current_user['id'])
+    if session.result is not None:
+        return json_response({**session.view(), **session.grade()})
+    return json_response({**session.view(), "questions": await exam_sessions.questions(session.quiz_ids)})
+
+@api_router.put("/exams/{session_id}/answers")
+async def answer_exam_question(session_id: str, data: ExamAnswer, current_user: dict = Depends(get_current_user)):
+    # Memory only; written with the next checkpoint
+    session = await load_exam(session_id, current_user['id'])
+    try:
+        exam_sessions.answer(session, data.question, data.answer)
+    except ExamClosed:
+        raise HTTPException(status_code=409, detail="This exam is closed")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response({"answered": session.answered()})
+
+@api_router.post("/exams/{session_id}/submit")
+async def submit_exam(session_id: str, data: Optional[ExamSubmit] = None, current_user: dict = Depends(get_current_user)):
+    session = await load_exam(session_id, current_user['id'])
+    try:
+        result = await exam_sessions.submit(session, data.answers if data else None)
+    except ExamClosed:
+        raise HTTPException(status_code=409, detail="This exam is closed")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response({**session.view(), **result})
+
+# ============ LIVE UPDATES ============
+
+@api_router.websocket("/ws")
+async def live_updates(websocket: WebSocket, token: str):
+    # Browsers can't set headers on WebSocket requests, so the JWT comes in the query string
+    try:
+        student = await get_student_from_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    subscription = pubsub.subscribe("leaderboard", f"student:{student['id']}")
+    
+    async def push():
+        last_board = None
+        await leaderboards.ensure_ready()
+        await websocket.send_json({
+            "type": "xp",
+            "xp": student.get('xp', 0),
+            "level": student.get('level', 1),
+            "streak": student.get('streak', 0)
+        })
+        topic = "leaderboard"
+        while True:
+            if topic == "leaderboard":
+                # Only push when the top 50 or this student's rank actually moved
+                board = leaderboards.render("global", student['id'])
+                if board != last_board:
+                    last_board = board
+                    await websocket.send_text('{"type":"leaderboard",' + board[1:].decode('utf-8'))
+            else:
+                await websocket.send_json(message)
+            topic, message = await subscription.get()
+    
+    async def listen():
+        # Drain client frames (pings) until the socket closes
+        while True:
+            await websocket.receive_text()
+    
+    tasks = [asyncio.create_task(push()), asyncio.create_task(listen())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                logger.warning("Live update stream failed: %s", task.exception())
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
 
 # ============ MBTI ENDPOINTS ============
 
 @api_router.get("/mbti/types")
 async def get_mbti_types():
-    types = await db.mbti_types.find({}, {"_id": 0}).to_list(100)
-    return types
+    return PrecompressedResponse(await get_catalog_payload("mbti_types"))
 
 @api_router.get("/mbti/{code}")
 async def get_mbti_type(code: str):
-    mbti_type = await db.mbti_types.find_one({"code": code.upper()}, {"_id": 0})
+    mbti_type = next((t for t in await get_catalog("mbti_types") if t['code'] == code.upper()), None)
     if not mbti_type:
         raise HTTPException(status_code=404, detail="MBTI type not found")
-    return mbti_type
+    return json_response(mbti_type)
 
 @api_router.put("/student/mbti")
 async def update_student_mbti(mbti_code: str, current_user: dict = Depends(get_current_user)):
     # Verify MBTI code exists
-    mbti_type = await db.mbti_types.find_one({"code": mbti_code.upper()}, {"_id": 0})
+    mbti_type = next((t for t in await get_catalog("mbti_types") if t['code'] == mbti_code.upper()), None)
     if not mbti_type:
         raise HTTPException(status_code=404, detail="Invalid MBTI type")
     
-    await db.students.update_one(
-        {"id": current_user['id']},
-        {"$set": {"mbtiType": mbti_code.upper()}}
-    )
+    await repository.update_student(current_user['id'], {"mbtiType": mbti_code.upper()})
+    await invalidation.publish("student", current_user['id'])
     
     return {"message": "MBTI type updated", "mbtiType": mbti_code.upper()}
 
@@ -463,7 +934,7 @@ async def get_ai_teacher_tip(request: AITipRequest, current_user: dict = Depends
 @api_router.get("/badges")
 async def get_badges(current_user: dict = Depends(get_current_user)):
     # Get all badges
-    badges = await db.badges.find({}, {"_id": 0}).to_list(100)
+    badges = await get_catalog("badges")
     
     # Get unlocked badges
     unlocked = await db.student_badges.find(
@@ -474,56 +945,128 @@ async def get_badges(current_user: dict = Depends(get_current_user)):
     unlocked_ids = {b['badgeId'] for b in unlocked}
     
     # Mark badges as unlocked
-    for badge in badges:
-        badge['unlocked'] = badge['id'] in unlocked_ids
-    
-    return badges
+    return json_response([{**badge, 'unlocked': badge['id'] in unlocked_ids} for badge in badges])
 
 # ============ PROFILE ENDPOINTS ============
 
 @api_router.get("/profile")
 async def get_profile(current_user: dict = Depends(get_current_user)):
-    return {k: v for k, v in current_user.items() if k != 'passwordHash'}
+    return json_response(public_student(current_user))
 
 @api_router.put("/profile")
 async def update_profile(username: Optional[str] = None, email: Optional[EmailStr] = None, grade: Optional[int] = None, current_user: dict = Depends(get_current_user)):
     update_data = {}
     
     if username:
-        # Check username availability
-        existing = await db.students.find_one({"username": username, "id": {"$ne": current_user['id']}}, {"_id": 0})
-        if existing:
-            raise HTTPException(status_code=400, detail="Username already taken")
         update_data['username'] = username
     
     if email:
-        # Check email availability
-        existing = await db.students.find_one({"email": email, "id": {"$ne": current_user['id']}}, {"_id": 0})
-        if existing:
-            raise HTTPException(status_code=400, detail="Email already taken")
         update_data['email'] = email
     
     if grade in [11, 12]:
         update_data['grade'] = grade
     
-    if update_data:
-        await db.students.update_one(
-            {"id": current_user['id']},
-            {"$set": update_data}
-        )
+    if not update_data:
+        return json_response({"message": "Profile updated", "user": public_student(current_user)})
+    
+    # Taken usernames/emails are caught by the unique indexes
+    if 'username' in update_data or 'email' in update_data:
+        await require_student_indexes()
+    try:
+        student = await repository.update_profile(current_user['id'], update_data)
+    except DuplicateStudent as e:
+        raise HTTPException(status_code=400, detail=f"{e.field.capitalize()} already taken")
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    await invalidation.publish("student", current_user['id'])
+    
+    return json_response({"message": "Profile updated", **update_data, "user": public_student(student)})
+
+# ============ ADMIN ENDPOINTS ============
+
+@api_router.post("/admin/students/import", dependencies=[Depends(require_admin)])
+async def import_students(request: Request, format: Optional[str] = None):
+    # Body is the raw CSV (with header) or JSONL file
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "jsonl")
+    try:
+        rows = provisioning.parse(await request.body(), fmt)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read file: {e}")
+    
+    # Taken usernames and emails are caught by the unique indexes
+    await require_student_indexes()
+    # Hashing takes minutes for a large file, so it runs as a job; poll GET /admin/students/import/{id}
+    job = await provisioning.start_job(
+        db, rows, on_done=lambda report: leaderboards.mark_dirty() if report['created'] else None
+    )
+    return json_response(job, status_code=202)
+
+@api_router.get("/admin/students/import/{job_id}", dependencies=[Depends(require_admin)])
+async def get_student_import(job_id: str):
+    job = await provisioning.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return json_response(job)
+
+@api_router.post("/admin/quizzes/import", dependencies=[Depends(require_admin)])
+async def import_quizzes(request: Request, format: Optional[str] = None):
+    # Body is a JSONL or CSV (with header) quiz bank, read as it arrives
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "jsonl")
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {fmt}")
     
-    return {"message": "Profile updated", **update_data}
+    rows = quiz_bank.iter_rows(quiz_bank.iter_lines(request.stream()), fmt)
+    try:
+        report = await quiz_bank.import_quizzes(
+            db, rows, Quiz,
+            progress=lambda r: logger.info("Quiz import: %d rows, %d new, %d updated, %d rejected",
+                                           r['received'], r['inserted'], r['updated'], r['failed'])
+        )
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Could not read file: {e}")
+    if report['inserted'] or report['updated']:
+        await invalidation.publish("catalog")
+    return json_response(report)
+
+@api_router.get("/admin/quizzes/export", dependencies=[Depends(require_admin)])
+async def export_quizzes(format: str = "jsonl", subjectId: Optional[str] = None):
+    if format not in quiz_bank.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    return StreamingResponse(
+        quiz_bank.export_quizzes(db, format, subjectId),
+        media_type=quiz_bank.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="quizzes.{format}"'}
+    )
 
 # ============ SUBJECTS ENDPOINT ============
 
 @api_router.get("/subjects")
 async def get_subjects():
-    subjects = await db.exam_subjects.find({}, {"_id": 0}).to_list(100)
-    return subjects
+    return PrecompressedResponse(await get_catalog_payload("exam_subjects"))
+
+# ============ HEALTH ENDPOINT ============
+
+@api_router.get("/health")
+async def health():
+    # Missing unique student indexes only hold up registration and username/email changes, not the worker
+    return json_response({
+        "status": "ok",
+        "worker": os.getpid(),
+        "cacheGeneration": invalidation.generation,
+        "studentIndexes": student_indexes_ready
+    })
+
+@api_router.get("/metrics")
+async def get_metrics():
+    # Per worker, like /health
+    return json_response({"worker": os.getpid(), **metrics.snapshot()})
 
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -538,6 +1081,63 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# Until all of the unique student indexes exist, registration and username/email changes
+# wait for (or retry) the build
+STUDENT_INDEX_RETRY_SECONDS = 30
+student_indexes_ready = False
+student_index_build: Optional[asyncio.Task] = None
+student_index_failed_at = 0.0
+
+async def ensure_student_indexes() -> bool:
+    global student_indexes_ready, student_index_failed_at
+    student_indexes_ready = not await build_student_indexes(db)
+    if not student_indexes_ready:
+        student_index_failed_at = time.monotonic()
+    return student_indexes_ready
+
+async def student_indexes() -> bool:
+    # Callers share one build; a failed one is retried after a while
+    global student_index_build
+    if student_indexes_ready:
+        return True
+    build = student_index_build
+    if build is None or build.get_loop() is not asyncio.get_running_loop() or (
+        build.done() and time.monotonic() - student_index_failed_at >= STUDENT_INDEX_RETRY_SECONDS
+    ):
+        build = student_index_build = asyncio.create_task(ensure_student_indexes())
+    return await asyncio.shield(build)
+
+async def require_student_indexes():
+    if not await student_indexes():
+        raise HTTPException(status_code=503, detail="Accounts can't be created or changed right now")
+
+async def ensure_indexes():
+    await student_indexes()
+    # Each on its own, so one failure leaves the rest in place
+    for name, build in (
+        ("quizzes", lambda: db.quizzes.create_index("id")),
+        ("daily quests", lambda: db.student_daily_quests.create_index(
+            [("studentId", 1), ("questId", 1), ("date", 1)], unique=True
+        )),
+        ("quiz bank", lambda: quiz_bank.ensure_quiz_bank_indexes(db)),
+        ("attempts", attempt_store.ensure_indexes),
+        ("analytics rollups", lambda: analytics.ensure_rollup_indexes(db)),
+        ("exam sessions", exam_sessions.ensure_indexes),
+        ("retention", lambda: retention.ensure_retention_indexes(db)),
+        ("provisioning jobs", lambda: db[provisioning.JOBS].create_index("id")),
+        ("rate limits", getattr(rate_limiter.backend, "ensure_indexes", None)),
+    ):
+        if build is None:
+            continue
+        try:
+            await build()
+        except Exception:
+            logger.exception("Could not create the %s indexes", name)
+
+async def load_quiz_index():
+    try:
+        await quiz_index.ensure_loaded()
+        await quiz_search.ensure_built()
+        await quiz_selector.ensure_pools()
+    except Exception:
+        logger.exception("Could not load the quiz index")
@@ -0,0 +1,104 @@
+"""Find and resolve duplicate student usernames and emails.
+
+The unique student indexes (see ``repository.ensure_student_indexes``) cannot
+be built while duplicates exist, and until they are, registration and
+username/email changes answer 503. ``report`` lists every duplicated id,
+username and email with the accounts that share it. ``resolve`` keeps the
+earliest registered account of each username or email as it is and renames
+the others: ``alice`` becomes ``alice-2``, ``a@x.com`` becomes
+``a+duplicate-2@x.com``. It only prints what it would do unless ``--apply``
+is given. Duplicate ids hold attempts of possibly different students and
+have to be merged by hand.
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from repository import STUDENT_UNIQUE_FIELDS
+
+SHOWN = {"_id": 0, "id": 1, "username": 1, "email": 1, "createdAt": 1, "lastActive": 1, "xp": 1}
+
+
+async def find_duplicates(db, field: str) -> List[dict]:
+    """Each duplicated value of ``field`` with its accounts, earliest registered first."""
+    groups = await db.students.aggregate([
+        {"$sort": {"createdAt": 1, "_id": 1}},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}, "students": {"$push": "$$ROOT"}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"_id": 1}},
+    ]).to_list(None)
+    return [
+        {"value": g["_id"], "students": [{k: s.get(k) for k in SHOWN if k != "_id"} for s in g["students"]]}
+        for g in groups
+    ]
+
+
+def renamed(field: str, value: str, n: int) -> str:
+    if field == "email" and "@" in value:
+        local, domain = value.rsplit("@", 1)
+        return f"{local}+duplicate-{n}@{domain}"
+    return f"{value}-{n}"
+
+
+async def resolve(db, field: str, apply: bool) -> List[tuple]:
+    """Rename all but the earliest account of each duplicated ``field``; returns (id, old, new) per rename."""
+    renames = []
+    for group in await find_duplicates(db, field):
+        n = 1
+        for student in group["students"][1:]:
+            new = renamed(field, group["value"], n := n + 1)
+            while await db.students.count_documents({field: new}, limit=1):
+                new = renamed(field, group["value"], n := n + 1)
+            if apply:
+                await db.students.update_one(
+                    {"id": student["id"], field: group["value"]},
+                    {"$set": {field: new}, "$inc": {"syncVersion": 1}}
+                )
+            renames.append((student["id"], group["value"], new))
+    return renames
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from cache import publish_invalidation
+    from repository import ensure_student_indexes
+
+    parser = argparse.ArgumentParser(description="Duplicate student usernames and emails")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("report", help="list duplicated ids, usernames and emails")
+    fix = sub.add_parser("resolve", help="rename the later accounts of each duplicated username and email")
+    fix.add_argument("--apply", action="store_true", help="write the renames (default: only print them)")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if args.command == "report":
+        found: Dict[str, List[dict]] = {field: await find_duplicates(db, field) for field in STUDENT_UNIQUE_FIELDS}
+        for field, groups in found.items():
+            print(f"{field}: {len(groups)} duplicated")
+            for group in groups:
+                print(f"  {group['value']!r}")
+                for s in group["students"]:
+                    print(f"    {s['id']}  {s['username']}  {s['email']}  created {s['createdAt']}  xp {s['xp']}")
+    else:
+        renames = [(field, *r) for field in ("username", "email") for r in await resolve(db, field, args.apply)]
+        for field, student_id, old, new in renames:
+            print(f"  {student_id}: {field} {old!r} -> {new!r}")
+        if not args.apply:
+            print(f"{len(renames)} renames; run again with --apply to write them")
+        else:
+            if renames:
+                # Running workers drop their cached copies of the renamed students
+                await publish_invalidation(db, "student")
+            missing = await ensure_student_indexes(db)
+            print(f"✅ Renamed {len(renames)} accounts" if not missing
+                  else f"❌ Renamed {len(renames)} accounts; still missing indexes: {', '.join(missing)}")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
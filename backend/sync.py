@@ -0,0 +1,87 @@
+"""Version counters behind ``GET /api/sync``.
+
+Each reference collection the SPA keeps (MBTI types, subjects, badges, daily
+quests) has a monotonic counter in ``sync_versions``, bumped by whoever
+rewrites it. Per-student progress (XP, level, streak, MBTI type, today's
+quest progress, unlocked badges) is versioned by ``syncVersion`` on the
+student document, which every repository write increments in the same
+update. A client's version is the opaque token of all counters plus the
+day; /api/sync returns only the parts whose counter moved since that token.
+
+Bump after the data is written and the catalog invalidation is published: a
+client syncing in between gets the old version with possibly new data and
+simply fetches it again, whereas the opposite order could pair a new version
+with stale cached data that is then never refetched.
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Optional
+
+CATALOGS = ("mbti_types", "exam_subjects", "badges", "daily_quests")
+COLLECTION = "sync_versions"
+
+
+class SyncToken(NamedTuple):
+    catalogs: Dict[str, int]
+    student: int
+    day: str
+
+    def encode(self) -> str:
+        return ".".join([*(str(self.catalogs.get(c, 0)) for c in CATALOGS), str(self.student), self.day])
+
+    @classmethod
+    def decode(cls, token: Optional[str]) -> Optional["SyncToken"]:
+        # Anything unreadable (first visit, older client) means a full sync
+        parts = (token or "").split(".")
+        if len(parts) != len(CATALOGS) + 2:
+            return None
+        try:
+            numbers = [int(p) for p in parts[:-1]]
+        except ValueError:
+            return None
+        return cls(dict(zip(CATALOGS, numbers)), numbers[-1], parts[-1])
+
+
+async def bump_versions(db, collections: Iterable[str]):
+    for collection in collections:
+        await db[COLLECTION].update_one({"_id": collection}, {"$inc": {"version": 1}}, upsert=True)
+
+
+async def catalog_versions(db) -> Dict[str, int]:
+    versions = {c: 0 for c in CATALOGS}
+    async for doc in db[COLLECTION].find({"_id": {"$in": list(CATALOGS)}}):
+        versions[doc["_id"]] = doc.get("version", 0)
+    return versions
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from cache import publish_invalidation
+
+    parser = argparse.ArgumentParser(description="Delta-sync versions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bump = sub.add_parser("bump", help="mark reference collections as changed after editing them by hand")
+    bump.add_argument("collections", nargs="*", help=f"default: all of {', '.join(CATALOGS)}")
+    sub.add_parser("show", help="print the current versions")
+    args = parser.parse_args()
+    if args.command == "bump":
+        unknown = set(args.collections) - set(CATALOGS)
+        if unknown:
+            parser.error(f"not a synced collection: {', '.join(sorted(unknown))}")
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if args.command == "bump":
+        await publish_invalidation(db, "catalog")
+        await bump_versions(db, args.collections or CATALOGS)
+    for collection, version in (await catalog_versions(db)).items():
+        print(f"  {collection:15s} {version}")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,376 @@
+"""Database round trips per endpoint, checked against declared budgets.
+
+The app runs in-process against mongomock-motor behind a proxy that counts
+every command (a cursor counts once, when it is first read) and every
+document returned. Published events go through the MongoDB pub/sub broker
+(``PUBSUB_BROKER=mongo``, without its change stream), so their writes to
+``pubsub_events`` count too. Each route is measured twice: cold, with the
+per-worker caches emptied (as after an eviction or invalidation), then warm.
+A route that issues more commands or reads more documents than its budget
+fails with the list of commands it issued. When a change needs more, raise
+the budget in ``BUDGETS`` on purpose. The leaderboard rebuild, which runs in
+the background rather than on a request, has its own budget.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=500")
+os.environ.setdefault("DB_NAME", "db_budget_test")
+for route in ("register", "attempt"):
+    for kind in ("ip", "student"):
+        os.environ[f"RATE_LIMIT_{route.upper()}_{kind.upper()}"] = "off"
+
+import seed_data  # noqa: E402
+import server  # noqa: E402
+import sync  # noqa: E402
+from pubsub import MongoChangeStreamBroker  # noqa: E402
+
+ADMIN_TOKEN = "budget-test-admin"
+HISTORY = 50
+
+# Async collection methods that are one round trip; those that return a document count it
+COMMANDS = {
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "bulk_write", "count_documents", "estimated_document_count", "distinct",
+    "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+}
+SINGLE_DOCUMENT = {"find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete"}
+CURSORS = {"find", "aggregate"}
+CURSOR_CHAINING = {"sort", "limit", "skip", "batch_size", "hint", "max_time_ms", "allow_disk_use", "collation"}
+
+
+class OpLog:
+    def __init__(self):
+        self.commands: List[str] = []
+        self.documents = 0
+
+    def reset(self):
+        self.commands = []
+        self.documents = 0
+
+
+class CountingCursor:
+    def __init__(self, cursor, log: OpLog, command: str):
+        self._cursor = cursor
+        self._log = log
+        self._command = command
+        self._started = False
+
+    def _start(self):
+        if not self._started:
+            self._started = True
+            self._log.commands.append(self._command)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._cursor, name)
+        if name not in CURSOR_CHAINING:
+            return attr
+
+        def chained(*args, **kwargs):
+            attr(*args, **kwargs)
+            return self
+        return chained
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self._start()
+        document = await self._cursor.__anext__()
+        self._log.documents += 1
+        return document
+
+    next = __anext__
+
+    async def to_list(self, length=None):
+        self._start()
+        # mongomock-motor ignores the length; Motor stops there
+        documents = (await self._cursor.to_list(length))[:length]
+        self._log.documents += len(documents)
+        return documents
+
+
+class CountingCollection:
+    def __init__(self, collection, log: OpLog):
+        self._collection = collection
+        self._log = log
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._collection, name)
+        command = f"{self._collection.name}.{name}"
+        if name in CURSORS:
+            return lambda *args, **kwargs: CountingCursor(attr(*args, **kwargs), self._log, command)
+        if name not in COMMANDS:
+            return attr
+
+        async def counted(*args, **kwargs):
+            self._log.commands.append(command)
+            result = await attr(*args, **kwargs)
+            if name in SINGLE_DOCUMENT and result is not None:
+                self._log.documents += 1
+            return result
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, db, log: OpLog):
+        self._db = db
+        self._log = log
+
+    def __getitem__(self, name: str):
+        return CountingCollection(self._db[name], self._log)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class Budget(NamedTuple):
+    ops: int
+    docs: int
+    cold_ops: int
+    cold_docs: int
+    prepare: Callable  # (client, ctx) -> (method, url, request kwargs), not counted
+
+
+BUDGETS: Dict[str, Budget] = {}
+
+
+def budget(route: str, ops: int, docs: int, cold: Optional[Tuple[int, int]] = None):
+    # cold: (ops, docs) when the per-worker caches are empty, if that costs more
+    def register(prepare):
+        BUDGETS[route] = Budget(ops, docs, *(cold or (ops, docs)), prepare)
+        return prepare
+    return register
+
+
+def evict_caches():
+    # What a request can find missing on a running worker: evicted or invalidated entries.
+    # The quiz index and search index are loaded at startup, the leaderboards in the background.
+    server.student_cache.clear()
+    server.catalog_cache.clear()
+    server.quiz_selector.students.clear()
+
+
+def auth(ctx, **kwargs):
+    return {"headers": {"Authorization": f"Bearer {ctx['token']}"}, **kwargs}
+
+
+@budget("GET /api/auth/me", ops=0, docs=0, cold=(1, 1))
+async def _(c, ctx):
+    return "GET", "/api/auth/me", auth(ctx)
+
+
+@budget("POST /api/auth/login", ops=2, docs=1)
+async def _(c, ctx):
+    return "POST", "/api/auth/login", {"json": {"username": "budget", "password": "pw123456"}}
+
+
+@budget("POST /api/auth/register", ops=1, docs=0)
+async def _(c, ctx):
+    ctx['registered'] += 1
+    n = ctx['registered']
+    return "POST", "/api/auth/register", {
+        "json": {"email": f"new{n}@example.com", "username": f"new{n}", "password": "pw123456", "grade": 11}
+    }
+
+
+@budget("GET /api/dashboard/stats", ops=1, docs=len(seed_data.DAILY_QUESTS),
+        cold=(3, 1 + 2 * len(seed_data.DAILY_QUESTS)))
+async def _(c, ctx):
+    return "GET", "/api/dashboard/stats", auth(ctx)
+
+
+@budget("GET /api/sync", ops=1, docs=len(sync.CATALOGS), cold=(2, 1 + len(sync.CATALOGS)))
+async def _(c, ctx):
+    # Up to date, as a client polling for changes usually is
+    version = (await c.get("/api/sync", **auth(ctx))).json()['version']
+    return "GET", "/api/sync", auth(ctx, params={"since": version})
+
+
+# Cold, the student's mastery is loaded too: one read of their rollups, however long the history
+@budget("GET /api/quizzes", ops=1, docs=5, cold=(3, 7))
+async def _(c, ctx):
+    return "GET", "/api/quizzes", {"headers": {"Authorization": f"Bearer {ctx['history_token']}"}, "params": {"limit": 5}}
+
+
+@budget("GET /api/quizzes/search", ops=1, docs=5, cold=(2, 6))
+async def _(c, ctx):
+    return "GET", "/api/quizzes/search", auth(ctx, params={"q": "the", "limit": 5})
+
+
+# Quest progress, XP, the attempt, its rollup and the batched events: one write each, no student read
+@budget("POST /api/quizzes/attempt", ops=5, docs=2, cold=(6, 2 + len(seed_data.DAILY_QUESTS)))
+async def _(c, ctx):
+    return "POST", "/api/quizzes/attempt", auth(ctx, json={"quizId": ctx['quiz_id'], "selectedAnswer": 0})
+
+
+@budget("GET /api/leaderboard", ops=0, docs=0, cold=(1, 1))
+async def _(c, ctx):
+    return "GET", "/api/leaderboard", auth(ctx)
+
+
+@budget("GET /api/analytics/me", ops=1, docs=1, cold=(3, 2 + len(seed_data.SUBJECTS)))
+async def _(c, ctx):
+    return "GET", "/api/analytics/me", auth(ctx)
+
+
+@budget("GET /api/badges", ops=1, docs=len(seed_data.BADGES), cold=(3, 1 + 2 * len(seed_data.BADGES)))
+async def _(c, ctx):
+    return "GET", "/api/badges", auth(ctx)
+
+
+@budget("GET /api/mbti/types", ops=0, docs=0, cold=(1, len(seed_data.MBTI_TYPES)))
+async def _(c, ctx):
+    return "GET", "/api/mbti/types", {}
+
+
+@budget("GET /api/subjects", ops=0, docs=0, cold=(1, len(seed_data.SUBJECTS)))
+async def _(c, ctx):
+    return "GET", "/api/subjects", {}
+
+
+@budget("PUT /api/profile", ops=3, docs=2)
+async def _(c, ctx):
+    # Alternate, as an update that changes nothing is answered without writing
+    ctx['grade'] = 23 - ctx['grade']
+    return "PUT", "/api/profile", auth(ctx, params={"grade": ctx['grade']})
+
+
+# Archived attempts are read first, then the hot ones
+@budget("GET /api/me/attempts/export", ops=2, docs=HISTORY, cold=(3, 1 + HISTORY))
+async def _(c, ctx):
+    return "GET", "/api/me/attempts/export", {"headers": {"Authorization": f"Bearer {ctx['history_token']}"}}
+
+
+SUBJECT_QUIZZES = sum(q['subjectId'] == "subj-1" for q in seed_data.QUIZZES)
+
+
+@budget("POST /api/exams", ops=3, docs=SUBJECT_QUIZZES, cold=(5, 1 + len(seed_data.SUBJECTS) + SUBJECT_QUIZZES))
+async def _(c, ctx):
+    await submit_running_exam(c, ctx)
+    return "POST", "/api/exams", auth(ctx, json={"subjectId": "subj-1"})
+
+
+@budget("PUT /api/exams/{id}/answers", ops=0, docs=0, cold=(1, 1))
+async def _(c, ctx):
+    exam = await running_exam(c, ctx)
+    return "PUT", f"/api/exams/{exam['id']}/answers", auth(ctx, json={"question": 0, "answer": 1})
+
+
+@budget("POST /api/exams/{id}/submit", ops=2, docs=1, cold=(3, 2))
+async def _(c, ctx):
+    exam = await running_exam(c, ctx)
+    return "POST", f"/api/exams/{exam['id']}/submit", auth(ctx, json={"answers": [0] * len(exam['answers'])})
+
+
+@budget("GET /api/admin/quizzes/export", ops=1, docs=len(seed_data.QUIZZES))
+async def _(c, ctx):
+    return "GET", "/api/admin/quizzes/export", {"headers": {"X-Admin-Token": ADMIN_TOKEN}}
+
+
+async def running_exam(c, ctx) -> dict:
+    response = await c.get("/api/exams/current", **auth(ctx))
+    if response.status_code == 404:
+        response = await c.post("/api/exams", **auth(ctx, json={"subjectId": "subj-1"}))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def submit_running_exam(c, ctx):
+    response = await c.get("/api/exams/current", **auth(ctx))
+    if response.status_code == 200:
+        await c.post(f"/api/exams/{response.json()['id']}/submit", **auth(ctx))
+
+
+@pytest.fixture(scope="module")
+def app():
+    loop = asyncio.new_event_loop()
+    log = OpLog()
+    db = mongomock_motor.AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    previous = server.db._db, server.ADMIN_TOKEN, server.pubsub.broker
+    server.db._db = CountingDatabase(db, log)
+    server.ADMIN_TOKEN = ADMIN_TOKEN
+    # Publishing writes to pubsub_events as in production; mongomock has no change streams to follow
+    broker = server.pubsub.broker = MongoChangeStreamBroker(server.db)
+    broker._deliver = server.pubsub.publish_local
+    server.pubsub._started = True
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+    async def setup():
+        for collection, docs in (
+            ("mbti_types", seed_data.MBTI_TYPES), ("exam_subjects", seed_data.SUBJECTS),
+            ("quizzes", seed_data.QUIZZES), ("daily_quests", seed_data.DAILY_QUESTS), ("badges", seed_data.BADGES),
+        ):
+            await db[collection].insert_many([dict(d) for d in docs])
+        tokens = []
+        for username in ("budget", "history"):
+            response = await client.post("/api/auth/register", json={
+                "email": f"{username}@example.com", "username": username, "password": "pw123456", "grade": 11
+            })
+            assert response.status_code == 200, response.text
+            tokens.append(response.json()['token'])
+        ctx = {"token": tokens[0], "history_token": tokens[1], "quiz_id": seed_data.QUIZZES[0]['id'],
+               "registered": 0, "grade": 11}
+        # A history to export
+        for _ in range(HISTORY):
+            await client.post("/api/quizzes/attempt", headers={"Authorization": f"Bearer {tokens[1]}"},
+                              json={"quizId": ctx['quiz_id'], "selectedAnswer": 0})
+        # As the app's startup does
+        await server.load_quiz_index()
+        await server.leaderboards.refresh()
+        return ctx
+
+    ctx = loop.run_until_complete(setup())
+    yield loop, client, ctx, log
+    loop.run_until_complete(client.aclose())
+    loop.close()
+    server.pubsub._started = False
+    server.db._db, server.ADMIN_TOKEN, server.pubsub.broker = previous
+
+
+@pytest.mark.parametrize("route", list(BUDGETS))
+def test_db_budget(app, route):
+    loop, client, ctx, log = app
+    limit = BUDGETS[route]
+
+    async def call(cold: bool):
+        method, url, kwargs = await limit.prepare(client, ctx)
+        if cold:
+            evict_caches()
+        log.reset()
+        response = await client.request(method, url, **kwargs)
+        assert response.status_code == 200, f"{route}: {response.status_code} {response.text[:200]}"
+
+    # The first call also warms the caches for the second
+    for phase, ops, docs in (("cold", limit.cold_ops, limit.cold_docs), ("warm", limit.ops, limit.docs)):
+        loop.run_until_complete(call(phase == "cold"))
+        issued = ", ".join(log.commands) or "none"
+        assert len(log.commands) <= ops, \
+            f"{route} ({phase}): {len(log.commands)} DB commands, budget {ops} ({issued})"
+        assert log.documents <= docs, \
+            f"{route} ({phase}): {log.documents} documents read, budget {docs} ({issued})"
+
+
+def test_leaderboard_refresh_budget(app):
+    # Reads every student: runs in the background, at most once per refresh interval
+    loop, client, ctx, log = app
+    students = loop.run_until_complete(server.db._db._db.students.count_documents({}))
+    log.reset()
+    loop.run_until_complete(server.leaderboards.refresh())
+    issued = ", ".join(log.commands) or "none"
+    assert len(log.commands) <= 2, f"leaderboard refresh: {len(log.commands)} DB commands, budget 2 ({issued})"
+    assert log.documents <= len(seed_data.SUBJECTS) + students, \
+        f"leaderboard refresh: {log.documents} documents read, budget {len(seed_data.SUBJECTS) + students} ({issued})"
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("uvicorn")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from cache import InvalidationBus  # noqa: E402
+from pubsub import FileBroker, PubSub  # noqa: E402
+
+WORKERS = 4
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def poll_workers(url: str, until, timeout: float = 30.0) -> dict:
+    # Fresh connections let the kernel spread requests over all workers
+    seen = {}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            data = httpx.get(url, headers={"Connection": "close"}, timeout=2).json()
+            seen[data['worker']] = data['cacheGeneration']
+        except httpx.HTTPError:
+            time.sleep(0.1)
+            continue
+        if until(seen):
+            return seen
+    pytest.fail(f"Workers did not converge, last seen: {seen}")
+
+
+@pytest.fixture
+def workers(tmp_path):
+    port = free_port()
+    events = tmp_path / "events.jsonl"
+    env = {
+        **os.environ,
+        "MONGO_URL": "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=500",
+        "DB_NAME": "multi_worker_test",
+        "PUBSUB_BROKER": f"file:{events}",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(WORKERS), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        yield f"http://127.0.0.1:{port}/api/health", events
+    finally:
+        proc.terminate()
+        proc.wait(timeout=15)
+
+
+def test_invalidation_reaches_every_worker(workers):
+    url, events = workers
+    before = poll_workers(url, lambda seen: len(seen) == WORKERS, timeout=60)
+    assert all(generation == 0 for generation in before.values())
+
+    async def publish():
+        pubsub = PubSub(FileBroker(str(events)))
+        await pubsub.start()
+        await InvalidationBus(pubsub).publish("catalog")
+        await pubsub.stop()
+
+    asyncio.run(publish())
+
+    after = poll_workers(url, lambda seen: len(seen) == WORKERS and all(g == 1 for g in seen.values()))
+    assert set(after) == set(before)
@@ -0,0 +1,108 @@
+"""PostgresRepository against a real PostgreSQL server.
+
+Skipped unless POSTGRES_TEST_URL points at a server the tests may create a
+scratch schema on, e.g. ``POSTGRES_TEST_URL=postgresql://postgres@127.0.0.1/postgres``.
+The schema is the Supabase migration plus ``POSTGRES_ADDITIONS``, and it is
+dropped afterwards.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+DSN = os.environ.get("POSTGRES_TEST_URL")
+pytestmark = pytest.mark.skipif(not DSN, reason="POSTGRES_TEST_URL is not set")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from repository import DuplicateStudent, PostgresRepository  # noqa: E402
+
+SCHEMA = "repository_test"
+
+
+def student(n: int, xp: int = 0) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": str(uuid.uuid4()), "email": f"s{n}@example.com", "username": f"s{n}", "passwordHash": "x",
+        "grade": 11, "mbtiType": None, "xp": xp, "level": 1, "streak": 0, "lastActive": now, "createdAt": now,
+    }
+
+
+@pytest.fixture
+def repo():
+    loop = asyncio.new_event_loop()
+    repo = PostgresRepository(DSN, min_size=1, max_size=4, server_settings={"search_path": SCHEMA})
+
+    async def setup():
+        await repo.start()
+        await repo.pool.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+        await repo.ensure_schema()
+
+    loop.run_until_complete(setup())
+    yield loop, repo
+
+    async def teardown():
+        await repo.pool.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await repo.stop()
+
+    loop.run_until_complete(teardown())
+    loop.close()
+
+
+def test_students_round_trip(repo):
+    loop, repo = repo
+
+    async def run():
+        alice, bob = student(1, xp=100), student(2, xp=300)
+        for s in (alice, bob):
+            await repo.create_student(dict(s))
+
+        found = await repo.student(alice['id'])
+        assert found['username'] == "s1" and found['xp'] == 100 and found['syncVersion'] == 0
+        assert (await repo.student_by_username("s2"))['id'] == bob['id']
+        assert await repo.student("not-a-uuid") is None
+
+        with pytest.raises(DuplicateStudent) as taken:
+            await repo.create_student({**student(3), "username": "s1"})
+        assert taken.value.field == "username"
+        with pytest.raises(DuplicateStudent) as taken:
+            await repo.update_profile(bob['id'], {"email": "s1@example.com"})
+        assert taken.value.field == "email"
+
+        profile = await repo.update_profile(alice['id'], {"grade": 12})
+        assert profile['grade'] == 12 and "passwordHash" not in profile and profile['syncVersion'] == 1
+
+        assert await repo.add_xp(alice['id'], 250) == (350, 1)
+        assert await repo.rank(alice['id']) == 1
+        assert await repo.rank(bob['id']) == 2
+        top = await repo.top_students(10)
+        assert [(s['id'], s['rank']) for s in top] == [(alice['id'], 1), (bob['id'], 2)]
+
+    loop.run_until_complete(run())
+
+
+def test_insert_attempt(repo):
+    loop, repo = repo
+
+    async def run():
+        s = student(1)
+        await repo.create_student(dict(s))
+        subject_id, quiz_id = uuid.uuid4(), uuid.uuid4()
+        await repo.pool.execute("INSERT INTO exam_subjects (id, name) VALUES ($1, 'Test')", subject_id)
+        await repo.pool.execute(
+            "INSERT INTO quizzes (id, subject_id, question, options, correct_answer, difficulty, xp) "
+            "VALUES ($1, $2, 'Q', '[\"a\", \"b\"]', 0, 'easy', 50)", quiz_id, subject_id
+        )
+        await repo.insert_attempt({
+            "id": str(uuid.uuid4()), "studentId": s['id'], "quizId": str(quiz_id), "selectedAnswer": 0,
+            "isCorrect": True, "xpEarned": 50, "attemptedAt": datetime.now(timezone.utc).isoformat()
+        })
+        assert await repo.pool.fetchval("SELECT count(*) FROM student_quiz_attempts") == 1
+
+    loop.run_until_complete(run())